@@ -0,0 +1,357 @@
+"""
+Vectorized backtester over the OHLCV panel
+Loads data/OLHCV into date x symbol arrays and simulates a whole grid of
+strategy parameters at once: signals are computed for every combination in
+one array of shape (combinations, dates, symbols), and the execution loop
+steps through dates only, updating every combination and symbol together.
+
+HOSE trading rules applied:
+    price bands     +/-7% around the previous close, rounded to the tick;
+                    no buys on a day locked at the ceiling (low at ceiling)
+                    and no sells on a day locked at the floor (high at floor)
+    T+2 settlement  shares bought on day t can be sold from day t+2
+    lot size        orders in multiples of 100 shares
+
+Each symbol trades its own equal slice of the capital, long only (no short
+selling on HOSE). Signals from day t's close execute at day t+1's open.
+Parameter sweeps run on a process pool; the price arrays are placed once in
+shared memory and attached read-only by every worker.
+
+Usage:
+    python backtest.py --strategy sma_cross
+    python backtest.py --strategy momentum --param lookback=10:120:10 --param threshold=0.0:0.1:0.02
+"""
+
+import argparse
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from data_api import OHLCV_DIR, load_prices
+
+FIELDS = ["open", "high", "low", "close"]
+PRICE_UNIT = 1000            # vnstock prices are in thousand VND
+PRICE_BAND = 0.07            # HOSE daily limit
+SETTLEMENT_DAYS = 2          # T+2
+LOT_SIZE = 100
+FEE_RATE = 0.0015            # brokerage fee per side
+SELL_TAX = 0.001             # personal income tax on sale value
+TRADING_DAYS = 252
+OUTPUT_DIR = "data/backtest"
+
+
+class PricePanel:
+    """Date x symbol price arrays (NaN where a symbol has no bar)."""
+
+    def __init__(self, dates: pd.DatetimeIndex, symbols: list, prices: np.ndarray):
+        self.dates = dates
+        self.symbols = symbols
+        # Shape (len(FIELDS), dates, symbols)
+        self.prices = prices
+
+    @property
+    def open(self) -> np.ndarray:
+        return self.prices[0]
+
+    @property
+    def high(self) -> np.ndarray:
+        return self.prices[1]
+
+    @property
+    def low(self) -> np.ndarray:
+        return self.prices[2]
+
+    @property
+    def close(self) -> np.ndarray:
+        return self.prices[3]
+
+
+def load_panel(symbols: list = None, start: str = None, end: str = None, data_dir: str = OHLCV_DIR) -> PricePanel:
+    """
+    Load daily OHLCV CSVs into a PricePanel.
+
+    Args:
+        symbols: Symbols to include (default: every CSV in data_dir)
+        start: First date 'YYYY-MM-DD'
+        end: Last date 'YYYY-MM-DD'
+        data_dir: Directory written by download_ohlcv
+    """
+    if symbols is None:
+        symbols = sorted(f[:-4] for f in os.listdir(data_dir) if f.endswith(".csv"))
+    df = load_prices(list(symbols), start=start, end=end, fields=FIELDS, data_dir=data_dir)
+    if df.empty:
+        raise ValueError(f"No price data for {symbols} in {data_dir}")
+
+    wide = {field: df[field].unstack("symbol").sort_index() for field in FIELDS}
+    dates = wide["close"].index
+    columns = list(wide["close"].columns)
+    prices = np.stack([wide[field].reindex(index=dates, columns=columns).to_numpy(dtype="float64") for field in FIELDS])
+    return PricePanel(pd.DatetimeIndex(dates), columns, prices)
+
+
+# ----------------------------------------------------------------------
+# Signals: (panel, params DataFrame) -> bool array (combinations, dates, symbols)
+# ----------------------------------------------------------------------
+def _ffill(x: np.ndarray) -> np.ndarray:
+    """Forward-fill NaNs along the date axis."""
+    idx = np.where(np.isnan(x), 0, np.arange(x.shape[0])[:, None])
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    return x[idx, np.arange(x.shape[1])]
+
+
+def _rolling_mean(x: np.ndarray, window: int) -> np.ndarray:
+    valid = ~np.isnan(x)
+    sums = np.concatenate([np.zeros((1, x.shape[1])), np.cumsum(np.where(valid, x, 0.0), axis=0)])
+    counts = np.concatenate([np.zeros((1, x.shape[1])), np.cumsum(valid, axis=0)])
+    out = np.full(x.shape, np.nan)
+    if window <= x.shape[0]:
+        total = sums[window:] - sums[:-window]
+        n = counts[window:] - counts[:-window]
+        out[window - 1:] = np.where(n == window, total / window, np.nan)
+    return out
+
+
+def sma_cross_signal(panel: PricePanel, params: pd.DataFrame) -> np.ndarray:
+    """Long while the fast moving average is above the slow one."""
+    close = _ffill(panel.close)
+    means = {w: _rolling_mean(close, w) for w in set(params["fast"]) | set(params["slow"])}
+    return np.stack([means[f] > means[s] for f, s in zip(params["fast"], params["slow"])])
+
+
+def momentum_signal(panel: PricePanel, params: pd.DataFrame) -> np.ndarray:
+    """Long while the return over `lookback` days exceeds `threshold`."""
+    close = _ffill(panel.close)
+    returns = {}
+    for lookback in set(params["lookback"]):
+        past = np.full(close.shape, np.nan)
+        past[lookback:] = close[:-lookback]
+        returns[lookback] = close / past - 1
+    return np.stack([returns[lb] > th for lb, th in zip(params["lookback"], params["threshold"])])
+
+
+STRATEGIES = {
+    "sma_cross": {
+        "signal": sma_cross_signal,
+        "grid": {"fast": range(5, 55, 5), "slow": range(20, 260, 10)},
+        "valid": lambda p: p["fast"] < p["slow"],
+    },
+    "momentum": {
+        "signal": momentum_signal,
+        "grid": {"lookback": range(5, 130, 5), "threshold": np.round(np.arange(0, 0.21, 0.01), 4)},
+        "valid": None,
+    },
+}
+
+
+def param_grid(strategy: str, grid: dict = None) -> pd.DataFrame:
+    """Cartesian product of the strategy's parameter ranges (overridden by `grid`)."""
+    spec = STRATEGIES[strategy]
+    ranges = dict(spec["grid"])
+    ranges.update(grid or {})
+    params = pd.DataFrame(list(itertools.product(*ranges.values())), columns=list(ranges))
+    if spec["valid"] is not None:
+        params = params[spec["valid"](params)]
+    return params.reset_index(drop=True)
+
+
+# ----------------------------------------------------------------------
+# Execution
+# ----------------------------------------------------------------------
+def _tick(price: np.ndarray) -> np.ndarray:
+    """HOSE tick size in VND."""
+    return np.where(price < 10000, 10.0, np.where(price < 50000, 50.0, 100.0))
+
+
+def _band_locks(panel: PricePanel) -> tuple:
+    """(locked at ceiling, locked at floor) masks of shape (dates, symbols)."""
+    ref = np.full(panel.close.shape, np.nan)
+    ref[1:] = _ffill(panel.close)[:-1] * PRICE_UNIT
+    with np.errstate(invalid="ignore"):
+        ceiling = ref * (1 + PRICE_BAND)
+        ceiling = np.floor(ceiling / _tick(ceiling)) * _tick(ceiling)
+        floor = ref * (1 - PRICE_BAND)
+        floor = np.ceil(floor / _tick(floor)) * _tick(floor)
+        low = panel.low * PRICE_UNIT
+        high = panel.high * PRICE_UNIT
+        locked_up = low >= ceiling - _tick(ceiling) / 2
+        locked_down = high <= floor + _tick(floor) / 2
+    return locked_up, locked_down
+
+
+def simulate(panel: PricePanel, signals: np.ndarray, capital: float = 1e9) -> dict:
+    """
+    Execute target positions for every parameter combination.
+
+    Args:
+        panel: Price panel
+        signals: Bool array (combinations, dates, symbols), True = hold the symbol
+        capital: Starting capital in VND, split equally across symbols
+
+    Returns:
+        {'equity': (combinations, dates) VND, 'trades': (combinations,) round trips}
+    """
+    n_combos, n_dates, n_symbols = signals.shape
+    opens = panel.open * PRICE_UNIT
+    closes = _ffill(panel.close) * PRICE_UNIT
+    tradable = ~np.isnan(opens)
+    locked_up, locked_down = _band_locks(panel)
+
+    cash = np.full((n_combos, n_symbols), capital / n_symbols)
+    shares = np.zeros((n_combos, n_symbols))
+    bought_on = np.full((n_combos, n_symbols), -SETTLEMENT_DAYS)
+    trades = np.zeros(n_combos)
+    equity = np.empty((n_combos, n_dates))
+
+    for t in range(n_dates):
+        if t > 0:
+            want = signals[:, t - 1, :]
+            price = opens[t]
+            holding = shares > 0
+            can_sell = (tradable[t] & ~locked_down[t]) & (t - bought_on >= SETTLEMENT_DAYS)
+            can_buy = tradable[t] & ~locked_up[t]
+
+            sell = holding & ~want & can_sell
+            cash += np.where(sell, shares * np.nan_to_num(price) * (1 - FEE_RATE - SELL_TAX), 0.0)
+            shares[sell] = 0
+            trades += sell.sum(axis=1)
+
+            buy = ~holding & want & can_buy
+            with np.errstate(invalid="ignore", divide="ignore"):
+                lots = np.floor(cash / (price * (1 + FEE_RATE) * LOT_SIZE))
+            qty = np.where(buy, np.nan_to_num(lots), 0.0) * LOT_SIZE
+            cash -= qty * np.nan_to_num(price) * (1 + FEE_RATE)
+            shares += qty
+            bought_on = np.where(qty > 0, t, bought_on)
+
+        equity[:, t] = (cash + shares * np.nan_to_num(closes[t])).sum(axis=1)
+
+    return {"equity": equity, "trades": trades}
+
+
+def metrics(equity: np.ndarray, trades: np.ndarray) -> pd.DataFrame:
+    """Total return, CAGR, annualized Sharpe and max drawdown per combination."""
+    returns = equity[:, 1:] / equity[:, :-1] - 1
+    years = max(equity.shape[1] / TRADING_DAYS, 1e-9)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sharpe = returns.mean(axis=1) / returns.std(axis=1) * np.sqrt(TRADING_DAYS)
+    drawdown = equity / np.maximum.accumulate(equity, axis=1) - 1
+    total = equity[:, -1] / equity[:, 0]
+    return pd.DataFrame({
+        "total_return": total - 1,
+        "cagr": total ** (1 / years) - 1,
+        "sharpe": sharpe,
+        "max_drawdown": drawdown.min(axis=1),
+        "trades": trades,
+    })
+
+
+def run_backtest(panel: PricePanel, strategy: str, params: pd.DataFrame, capital: float = 1e9) -> pd.DataFrame:
+    """Signals, execution and metrics for one block of parameter combinations."""
+    signals = STRATEGIES[strategy]["signal"](panel, params)
+    result = simulate(panel, signals, capital)
+    return pd.concat([params.reset_index(drop=True), metrics(result["equity"], result["trades"])], axis=1)
+
+
+# ----------------------------------------------------------------------
+# Parallel sweep over shared memory
+# ----------------------------------------------------------------------
+_worker = {}
+
+
+def _attach(name: str, shape: tuple, dates: np.ndarray, symbols: list):
+    shm = shared_memory.SharedMemory(name=name)
+    prices = np.ndarray(shape, dtype="float64", buffer=shm.buf)
+    prices.flags.writeable = False
+    # Keep the handle alive for the life of the worker
+    _worker["shm"] = shm
+    _worker["panel"] = PricePanel(pd.DatetimeIndex(dates), symbols, prices)
+
+
+def _run_chunk(strategy: str, params: pd.DataFrame, capital: float) -> pd.DataFrame:
+    return run_backtest(_worker["panel"], strategy, params, capital)
+
+
+def sweep(
+    panel: PricePanel,
+    strategy: str,
+    params: pd.DataFrame = None,
+    capital: float = 1e9,
+    max_workers: int = None,
+    chunk_size: int = 64
+) -> pd.DataFrame:
+    """
+    Backtest every parameter combination on a process pool.
+
+    Args:
+        panel: Price panel, copied once into shared memory
+        strategy: Key of STRATEGIES
+        params: Parameter combinations (default: the strategy's full grid)
+        capital: Starting capital in VND
+        max_workers: Worker processes (default: CPU count)
+        chunk_size: Combinations simulated together per task
+
+    Returns:
+        One row per combination with its parameters and metrics, best Sharpe first
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown strategy {strategy!r}, expected one of {sorted(STRATEGIES)}")
+    params = param_grid(strategy) if params is None else params.reset_index(drop=True)
+    chunks = [params.iloc[i:i + chunk_size] for i in range(0, len(params), chunk_size)]
+
+    shm = shared_memory.SharedMemory(create=True, size=panel.prices.nbytes)
+    try:
+        shared = np.ndarray(panel.prices.shape, dtype="float64", buffer=shm.buf)
+        shared[:] = panel.prices
+        initargs = (shm.name, panel.prices.shape, panel.dates.to_numpy(), panel.symbols)
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_attach, initargs=initargs) as pool:
+            results = list(pool.map(_run_chunk, [strategy] * len(chunks), chunks, [capital] * len(chunks)))
+    finally:
+        shm.close()
+        shm.unlink()
+
+    print(f"Backtested {len(params)} {strategy} combinations on {len(panel.symbols)} symbols x {len(panel.dates)} days")
+    return pd.concat(results, ignore_index=True).sort_values("sharpe", ascending=False, ignore_index=True)
+
+
+def _parse_range(text: str) -> tuple:
+    """'name=start:stop:step' or 'name=a,b,c' -> (name, values)."""
+    name, spec = text.split("=", 1)
+    cast = float if "." in spec else int
+    if ":" in spec:
+        start, stop, step = (cast(v) for v in spec.split(":"))
+        values = np.round(np.arange(start, stop + step / 2, step), 6).astype(cast).tolist()
+    else:
+        values = [cast(v) for v in spec.split(",")]
+    return name, values
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vectorized parameter sweep over the OHLCV panel")
+    parser.add_argument("--strategy", default="sma_cross", choices=sorted(STRATEGIES))
+    parser.add_argument("--param", action="append", default=[], help="Override a range: name=start:stop:step or name=a,b,c")
+    parser.add_argument("--symbols", nargs="+", help="Symbols to include (default: all downloaded)")
+    parser.add_argument("--start")
+    parser.add_argument("--end")
+    parser.add_argument("--data-dir", default=OHLCV_DIR, help="e.g. data/OLHCV_adjusted for split-adjusted prices")
+    parser.add_argument("--capital", type=float, default=1e9, help="Starting capital in VND")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    panel = load_panel(args.symbols, args.start, args.end, data_dir=args.data_dir)
+    params = param_grid(args.strategy, dict(_parse_range(p) for p in args.param))
+    results = sweep(panel, args.strategy, params, capital=args.capital, max_workers=args.workers)
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    output_path = os.path.join(OUTPUT_DIR, f"{args.strategy}.csv")
+    results.to_csv(output_path, index=False)
+    print(results.head(args.top).to_string(index=False))
+    print(f"Saved {len(results)} results to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Startup-time benchmark for the collector CLI
+Runs each command in a fresh interpreter several times and reports the median
+wall time, next to the cost of importing the heavy collector modules directly.
+
+Usage:
+    python bench_startup.py
+    python bench_startup.py --runs 20
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+COMMANDS = {
+    "python -c pass": [sys.executable, "-c", "pass"],
+    "cli.py --help": [sys.executable, "cli.py", "--help"],
+    "cli.py status": [sys.executable, "cli.py", "status"],
+    "import download_ohlcv": [sys.executable, "-c", "import download_ohlcv"],
+    "import vn30_crawler": [sys.executable, "-c", "import vn30_crawler"],
+    "import cophieu68_selenium": [sys.executable, "-c", "import cophieu68_selenium"],
+}
+
+
+def time_command(cmd: list, runs: int):
+    """Median wall time in milliseconds, or None if the command fails."""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(cmd, cwd=HERE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        elapsed = (time.perf_counter() - start) * 1000
+        if result.returncode != 0:
+            return None
+        samples.append(elapsed)
+    return statistics.median(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure CLI startup time")
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    print(f"Median of {args.runs} runs:")
+    for name, cmd in COMMANDS.items():
+        median = time_command(cmd, args.runs)
+        shown = f"{median:8.1f} ms" if median is not None else "  failed (missing dependency?)"
+        print(f"  {name:28s} {shown}")
+
+
+if __name__ == "__main__":
+    main()
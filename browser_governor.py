@@ -0,0 +1,364 @@
+"""
+Browser resource governor for long Selenium runs
+Owns the Chrome driver of a crawler and replaces it with a fresh one when it
+has been used for too long, so memory and page latency stay flat over
+thousands of symbols. The driver is recycled after `max_symbols` symbols, when
+the RSS of chromedriver and its Chrome processes exceeds `max_rss_mb`, when
+the median page-load time grows past `latency_factor` times the median of the
+first page loads of the session, or when the driver stops responding.
+
+Page-load times come from the browser's Navigation Timing of each page the
+crawler opens (record_page_load), so rate-limiter waits and retry backoff
+never count as slowness. Recycling happens lazily in before_symbol(), never
+after a symbol's data was saved; a failed restart is retried before giving up.
+
+A recycled driver is set up again with the crawler's own `setup` callable
+(e.g. vn30_crawler.open_home, which also dismisses the login popup), so the
+crawl continues in the same state.
+
+Every driver started here is registered in data/browser_pids/ with the pid
+and start time of its chromedriver and of the owning Python process. On start
+and at every recycle, registered drivers whose owner is gone are killed
+(only processes of the current user, and only if the pid still belongs to the
+same chromedriver). Drivers started by other tools are never touched.
+
+Usage:
+    governor = BrowserGovernor(webdriver.Chrome, open_home)
+    for stock in symbols:
+        governor.before_symbol()
+        crawl_symbol(governor.driver, governor.wait, stock)
+        governor.symbol_done()
+    governor.close()
+
+Requirements:
+    pip install psutil   (optional: RSS limit and orphan cleanup)
+"""
+
+import json
+import os
+import statistics
+import time
+from collections import defaultdict, deque
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+REGISTRY_DIR = "data/browser_pids"
+START_ATTEMPTS = 3
+
+# Page-load seconds recorded per driver session, drained by its governor
+_page_loads = defaultdict(list)
+
+_NAVIGATION_TIMING_JS = """
+const nav = performance.getEntriesByType('navigation')[0];
+if (!nav) { return null; }
+const end = nav.loadEventEnd > 0 ? nav.loadEventEnd : nav.domContentLoadedEventEnd;
+return end > 0 ? end - nav.startTime : null;
+"""
+
+
+def record_page_load(driver):
+    """
+    Record the load time of the page currently shown in `driver`.
+
+    Uses the browser's Navigation Timing, so time spent waiting before the
+    navigation started (rate limiting, backoff) is not included.
+    """
+    try:
+        millis = driver.execute_script(_NAVIGATION_TIMING_JS)
+        session = driver.session_id
+    except Exception:
+        return None
+    if millis is None:
+        return None
+    _page_loads[session].append(millis / 1000)
+    return millis / 1000
+
+
+# ----------------------------------------------------------------------
+# Driver process registry
+# ----------------------------------------------------------------------
+def _process_tree(pid: int) -> list:
+    try:
+        process = psutil.Process(pid)
+        return [process] + process.children(recursive=True)
+    except psutil.Error:
+        return []
+
+
+def _terminate(processes: list, timeout: float = 5.0):
+    for process in processes:
+        try:
+            process.terminate()
+        except psutil.Error:
+            pass
+    _, alive = psutil.wait_procs(processes, timeout=timeout)
+    for process in alive:
+        try:
+            process.kill()
+        except psutil.Error:
+            pass
+
+
+def _same_process(pid: int, create_time: float):
+    """The process `pid` if it still is the one started at `create_time`, else None."""
+    try:
+        process = psutil.Process(pid)
+        if abs(process.create_time() - create_time) < 1.0:
+            return process
+    except psutil.Error:
+        pass
+    return None
+
+
+def _register(driver_pid: int, registry_dir: str) -> str:
+    os.makedirs(registry_dir, exist_ok=True)
+    owner = psutil.Process()
+    entry = {
+        "driver_pid": driver_pid,
+        "driver_created": psutil.Process(driver_pid).create_time(),
+        "owner_pid": owner.pid,
+        "owner_created": owner.create_time(),
+    }
+    path = os.path.join(registry_dir, f"{driver_pid}.json")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entry, f)
+    os.replace(tmp_path, path)
+    return path
+
+
+def kill_orphaned_chromedrivers(registry_dir: str = REGISTRY_DIR) -> int:
+    """
+    Kill registered chromedrivers (and their browsers) whose owning process is gone.
+
+    Returns:
+        Number of chromedriver processes killed (0 without psutil)
+    """
+    if psutil is None or not os.path.isdir(registry_dir):
+        return 0
+    user = psutil.Process().username()
+    killed = 0
+    for filename in os.listdir(registry_dir):
+        if not filename.endswith(".json"):
+            continue
+        path = os.path.join(registry_dir, filename)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if _same_process(entry["owner_pid"], entry["owner_created"]) is not None:
+            # Still owned by a live crawler
+            continue
+        driver = _same_process(entry["driver_pid"], entry["driver_created"])
+        try:
+            if driver is not None and driver.username() == user:
+                _terminate(_process_tree(driver.pid))
+                killed += 1
+        except psutil.Error:
+            pass
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    if killed:
+        print(f"Killed {killed} orphaned chromedriver process(es)")
+    return killed
+
+
+class BrowserGovernor:
+    """Creates, watches and recycles one Selenium driver."""
+
+    def __init__(
+        self,
+        factory,
+        setup=None,
+        max_symbols: int = 50,
+        max_rss_mb: float = 1500,
+        latency_factor: float = 2.0,
+        latency_window: int = 10,
+        wait_timeout: float = 10,
+        registry_dir: str = REGISTRY_DIR
+    ):
+        """
+        Args:
+            factory: Callable returning a new driver (e.g. webdriver.Chrome)
+            setup: Callable(driver) that opens the start page and restores the
+                session state; run for every new driver
+            max_symbols: Symbols per driver before it is recycled
+            max_rss_mb: Memory limit of chromedriver plus its browser processes
+            latency_factor: Recycle when the median page load over the last
+                `latency_window` pages exceeds this multiple of the baseline
+            latency_window: Page loads used for the baseline and rolling median
+            wait_timeout: Timeout of the WebDriverWait handed to the crawler
+            registry_dir: Directory of the driver pid registry
+        """
+        self.factory = factory
+        self.setup = setup
+        self.max_symbols = max_symbols
+        self.max_rss_mb = max_rss_mb
+        self.latency_factor = latency_factor
+        self.latency_window = latency_window
+        self.wait_timeout = wait_timeout
+        self.registry_dir = registry_dir
+        self.driver = None
+        self.wait = None
+        self.recycles = 0
+        self.pending = None
+        self._registry_path = None
+        self._reset_counters()
+        if psutil is None:
+            print("psutil not installed: browser memory limit and orphan cleanup disabled")
+
+    def _reset_counters(self):
+        self.symbols = 0
+        self.baseline = None
+        self.latencies = deque(maxlen=self.latency_window)
+
+    def start(self):
+        """Kill orphaned chromedrivers, then open and set up a new driver."""
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        kill_orphaned_chromedrivers(self.registry_dir)
+        self.driver = self.factory()
+        pid = self._driver_pid()
+        if psutil is not None and pid is not None:
+            try:
+                self._registry_path = _register(pid, self.registry_dir)
+            except (psutil.Error, OSError) as e:
+                print(f"Could not register chromedriver {pid}: {e}")
+        self.wait = WebDriverWait(self.driver, self.wait_timeout)
+        self._reset_counters()
+        self.pending = None
+        if self.setup is not None:
+            self.setup(self.driver)
+
+    def _driver_pid(self):
+        try:
+            return self.driver.service.process.pid
+        except AttributeError:
+            return None
+
+    def rss_mb(self):
+        """Resident memory of chromedriver and all its child processes, or None."""
+        pid = self._driver_pid()
+        if psutil is None or pid is None:
+            return None
+        total = 0
+        for process in _process_tree(pid):
+            try:
+                total += process.memory_info().rss
+            except psutil.Error:
+                pass
+        return total / (1024 * 1024)
+
+    def is_alive(self) -> bool:
+        try:
+            self.driver.current_url
+            return True
+        except Exception:
+            return False
+
+    def _collect_page_loads(self):
+        try:
+            session = self.driver.session_id
+        except AttributeError:
+            return
+        for seconds in _page_loads.pop(session, []):
+            self.latencies.append(seconds)
+            if self.baseline is None and len(self.latencies) == self.latency_window:
+                self.baseline = statistics.median(self.latencies)
+
+    def recycle_reason(self):
+        """Why the driver should be replaced now, or None."""
+        if self.driver is None:
+            return "no driver"
+        if not self.is_alive():
+            return "driver not responding"
+        if self.symbols >= self.max_symbols:
+            return f"{self.symbols} symbols processed"
+        rss = self.rss_mb()
+        if rss is not None and rss > self.max_rss_mb:
+            return f"browser RSS {rss:.0f} MB > {self.max_rss_mb:.0f} MB"
+        if self.baseline is not None and len(self.latencies) == self.latency_window:
+            current = statistics.median(self.latencies)
+            if current > self.latency_factor * self.baseline:
+                return f"median page load {current:.1f}s vs {self.baseline:.1f}s at start"
+        return None
+
+    def symbol_done(self):
+        """
+        Record one processed symbol. Never raises: a needed recycle is only
+        noted here and carried out by the next before_symbol().
+        """
+        self.symbols += 1
+        try:
+            self._collect_page_loads()
+            self.pending = self.recycle_reason()
+        except Exception as e:
+            self.pending = f"health check failed: {e}"
+
+    def before_symbol(self):
+        """
+        Make sure a healthy driver is ready for the next symbol, starting or
+        recycling it if needed. Raises only if no driver could be started.
+        """
+        if self.driver is None:
+            self._start_with_retries("starting browser")
+        elif self.pending is not None:
+            self.recycle(self.pending)
+
+    def _quit(self):
+        if self.driver is None:
+            return
+        _page_loads.pop(getattr(self.driver, "session_id", None), None)
+        pid = self._driver_pid()
+        processes = _process_tree(pid) if psutil is not None and pid is not None else []
+        try:
+            self.driver.quit()
+        except Exception as e:
+            print(f"Driver quit failed: {e}")
+        if processes:
+            # Anything that survived quit() (hung renderer, ad iframes) goes too
+            _terminate([p for p in processes if p.is_running()])
+        if self._registry_path is not None:
+            try:
+                os.remove(self._registry_path)
+            except OSError:
+                pass
+            self._registry_path = None
+        self.driver = None
+        self.wait = None
+
+    def _start_with_retries(self, reason: str):
+        for attempt in range(1, START_ATTEMPTS + 1):
+            try:
+                self.start()
+                return
+            except Exception as e:
+                print(f"Browser start failed ({reason}, attempt {attempt}/{START_ATTEMPTS}): {e}")
+                self._quit()
+                time.sleep(2 * attempt)
+        raise RuntimeError(f"Could not start a browser after {START_ATTEMPTS} attempts")
+
+    def recycle(self, reason: str = "requested"):
+        """Replace the driver with a fresh, set-up one."""
+        print(f"Recycling browser ({reason})...")
+        started = time.monotonic()
+        self._quit()
+        self._start_with_retries(reason)
+        self.recycles += 1
+        print(f"Browser recycled in {time.monotonic() - started:.1f}s (recycle #{self.recycles})")
+
+    def close(self):
+        self._quit()
+
+    def __enter__(self):
+        self.before_symbol()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,170 @@
+"""
+Content-hash change detection for collector outputs
+Before a collector rewrites a file it hashes the normalized result per
+partition (month of OHLCV bars, statement quarter, share-count event) and
+compares it with the manifest of the previous write. Unchanged results are not
+written at all, so file mtimes, downstream caches and file watchers only move
+when the data did.
+
+Each write that changes something appends one line to the change feed
+(data/_changes.jsonl) naming the dataset, symbol and the partitions that
+changed, so downstream analytics can recompute only what was affected.
+
+When one dataset can be written in several variants (e.g. OHLCV bars at
+different intervals or into different directories), pass a `variant` so each
+variant keeps its own manifest instead of skipping writes of the others.
+
+Usage:
+    from change_manifest import commit_if_changed, ohlcv_partitions, read_changes
+
+    changed = commit_if_changed("ohlcv", "ACB", ohlcv_partitions(df), write, [csv_file])
+    for record in read_changes(since="2025-01-01T00:00:00"):
+        ...
+"""
+
+import hashlib
+import json
+import os
+import re
+from datetime import datetime
+
+import pandas as pd
+
+MANIFEST_DIR = "data/_manifest"
+CHANGE_FEED = "data/_changes.jsonl"
+
+
+def _hash_frame(df: pd.DataFrame) -> str:
+    row_hashes = pd.util.hash_pandas_object(df.reset_index(drop=True), index=False).to_numpy()
+    digest = hashlib.blake2b(row_hashes.tobytes(), digest_size=16)
+    digest.update("|".join(map(str, df.columns)).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def ohlcv_partitions(df: pd.DataFrame) -> dict:
+    """Split OHLCV bars into one partition per month ('YYYY-MM')."""
+    if df.empty:
+        return {}
+    months = pd.to_datetime(df["time"]).dt.strftime("%Y-%m")
+    return {month: part for month, part in df.groupby(months.to_numpy(), sort=True)}
+
+
+def finance_partitions(wide_df: pd.DataFrame) -> dict:
+    """Split a wide statement table into one partition per quarter column."""
+    quarter_cols = [c for c in wide_df.columns if c != "Indicator"]
+    return {str(q): wide_df[["Indicator", q]] for q in quarter_cols}
+
+
+def shares_partitions(records: list) -> dict:
+    """One partition per share-count event date."""
+    df = pd.DataFrame(records, columns=["Ngay bo sung", "Co phieu luu hanh"])
+    return {str(date): part for date, part in df.groupby("Ngay bo sung", sort=True)}
+
+
+def _manifest_path(dataset: str, symbol: str, manifest_dir: str, variant: str = None) -> str:
+    if variant is None:
+        return os.path.join(manifest_dir, dataset, f"{symbol}.json")
+    slug = re.sub(r"[^A-Za-z0-9._-]+", "_", variant).strip("_")
+    return os.path.join(manifest_dir, dataset, slug, f"{symbol}.json")
+
+
+def load_manifest(dataset: str, symbol: str, manifest_dir: str = MANIFEST_DIR, variant: str = None) -> dict:
+    path = _manifest_path(dataset, symbol, manifest_dir, variant)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def commit_if_changed(
+    dataset: str,
+    symbol: str,
+    partitions: dict,
+    write,
+    paths: list,
+    manifest_dir: str = MANIFEST_DIR,
+    feed_path: str = CHANGE_FEED,
+    variant: str = None
+) -> list:
+    """
+    Call `write()` only if the content differs from the last committed write.
+
+    Args:
+        dataset: Dataset name ('ohlcv', 'finance', 'shares')
+        symbol: Stock ticker symbol
+        partitions: {partition key: DataFrame} of the normalized result
+        write: Callable that writes the output files
+        paths: Output files; a missing file forces a write
+        manifest_dir: Directory of per-symbol manifests
+        feed_path: Change feed file
+        variant: Part of the manifest key besides dataset and symbol (e.g.
+            interval and output directory); recorded in the change feed
+
+    Returns:
+        Sorted list of partition keys that were added, changed or removed
+        (empty if nothing was written)
+    """
+    hashes = {key: _hash_frame(part) for key, part in partitions.items()}
+    overall = hashlib.blake2b(
+        json.dumps(hashes, sort_keys=True).encode("utf-8"), digest_size=16
+    ).hexdigest()
+
+    previous = load_manifest(dataset, symbol, manifest_dir, variant)
+    files_present = all(os.path.exists(p) for p in paths)
+    if previous.get("hash") == overall and files_present:
+        print(f"{dataset} {symbol} unchanged, skipping write")
+        return []
+
+    write()
+
+    old_hashes = previous.get("partitions", {})
+    changed = sorted(
+        {k for k, h in hashes.items() if old_hashes.get(k) != h}
+        | (set(old_hashes) - set(hashes))
+    )
+    now = datetime.now().isoformat(timespec="seconds")
+
+    manifest_path = _manifest_path(dataset, symbol, manifest_dir, variant)
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"hash": overall, "updated": now, "partitions": hashes}, f)
+    os.replace(tmp_path, manifest_path)
+
+    if changed:
+        os.makedirs(os.path.dirname(feed_path) or ".", exist_ok=True)
+        record = {"time": now, "dataset": dataset, "symbol": symbol, "changed": changed}
+        if variant is not None:
+            record["variant"] = variant
+        with open(feed_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+        print(f"{dataset} {symbol}: {len(changed)} partition(s) changed")
+    return changed
+
+
+def read_changes(since: str = None, dataset: str = None, feed_path: str = CHANGE_FEED) -> list:
+    """
+    Read the change feed.
+
+    Args:
+        since: Only records at or after this ISO timestamp
+        dataset: Only records of this dataset
+
+    Returns:
+        List of {'time', 'dataset', 'symbol', 'changed'} records, oldest first
+    """
+    if not os.path.exists(feed_path):
+        return []
+    records = []
+    with open(feed_path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if since is not None and record["time"] < since:
+                continue
+            if dataset is not None and record["dataset"] != dataset:
+                continue
+            records.append(record)
+    return records
@@ -0,0 +1,252 @@
+"""
+Command line entry point for all collectors
+Heavy dependencies (pandas, Selenium, vnstock) are imported only inside the
+subcommand that needs them, so `status` and `--help` start in milliseconds.
+
+Usage:
+    python cli.py ohlcv --symbols ACB FPT --start 2024-01-01
+    python cli.py ohlcv --symbols FPT --interval 1m --start 2023-01-01 --intraday
+    python cli.py finance --symbols VNM
+    python cli.py finance --symbols VNM --profile
+    python cli.py reparse --workers 4
+    python cli.py shares
+    python cli.py search --symbols ACB VIC
+    python cli.py daemon --symbols ACB FPT --port 8765
+    python cli.py adjust --symbols ACB FPT
+    python cli.py backtest --strategy sma_cross --workers 8
+    python cli.py risk --window 60
+    python cli.py status
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+
+# Standard library only, cheap to import
+from crawl_retry import STATUS_DIR
+from rate_limiter import LIMITER_PATH, RateLimiter
+from work_queue import QUEUE_PATH, WorkQueue
+
+DATASET_DIRS = {
+    "ohlcv": "data/OLHCV",
+    "ohlcv_adjusted": "data/OLHCV_adjusted",
+    "finance": "data/finance",
+    "finance_long": "data/finance_long",
+    "cash_flow": "data/finance_cash_flow",
+    "ratios": "data/finance_ratios",
+    "shares": "data/Shares_Outstanding",
+}
+
+PROFILE_HELP = "Sample the run and write a flamegraph and hotspot report to data/profiles"
+
+
+def cmd_ohlcv(args):
+    from download_ohlcv import (
+        VN30_SYMBOLS, download_intraday, download_multiple_stocks, get_all_listed_symbols
+    )
+
+    if args.all:
+        symbols = sorted(get_all_listed_symbols(source=args.source)["symbol"].dropna().astype(str).unique())
+    else:
+        symbols = args.symbols or VN30_SYMBOLS
+
+    if args.intraday:
+        from profiler import profile_run
+
+        with profile_run("download_intraday") if args.profile else contextlib.nullcontext():
+            for symbol in symbols:
+                try:
+                    download_intraday(
+                        symbol, args.start, args.end, interval=args.interval, source=args.source,
+                        window_days=args.window_days, max_workers=args.workers
+                    )
+                except Exception as e:
+                    print(f"✗ Error downloading {symbol}: {e}\n")
+        return
+
+    download_multiple_stocks(
+        symbols=symbols,
+        start_date=args.start,
+        end_date=args.end,
+        interval=args.interval,
+        source=args.source,
+        output_dir=args.output_dir,
+        excel_layout=args.excel,
+        excel_background=args.excel_background,
+        profile=args.profile
+    )
+
+
+def cmd_finance(args):
+    from vn30_crawler import run_crawler
+
+    run_crawler(args.symbols, profile=args.profile)
+
+
+def cmd_reparse(args):
+    from reparse_finance import reparse_all
+
+    reparse_all(args.symbols, max_workers=args.workers)
+
+
+def cmd_shares(args):
+    from cophieu68_selenium import run_automation
+
+    run_automation(args.symbols, profile=args.profile)
+
+
+def cmd_search(args):
+    from search_vietstock import run_search
+
+    run_search(args.symbols, profile=args.profile)
+
+
+def cmd_daemon(args):
+    from ohlcv_daemon import main as daemon_main
+
+    daemon_main(args.daemon_args)
+
+
+def cmd_adjust(args):
+    from price_adjust import adjust_all
+
+    adjust_all(args.symbols, full=args.full)
+
+
+def cmd_backtest(args):
+    from backtest import main as backtest_main
+
+    backtest_main(args.backtest_args)
+
+
+def cmd_risk(args):
+    from risk import main as risk_main
+
+    risk_main(args.risk_args)
+
+
+def _dir_summary(path: str):
+    if not os.path.isdir(path):
+        return 0, None
+    count = 0
+    newest = None
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith(".csv"):
+                count += 1
+                mtime = entry.stat().st_mtime
+                newest = mtime if newest is None or mtime > newest else newest
+    return count, newest
+
+
+def cmd_status(args):
+    print("Datasets:")
+    for name, path in DATASET_DIRS.items():
+        count, newest = _dir_summary(path)
+        updated = time.strftime("%Y-%m-%d %H:%M", time.localtime(newest)) if newest else "-"
+        print(f"  {name:14s} {count:5d} files  last update {updated}  ({path})")
+
+    for dataset in ("finance", "shares"):
+        status_dir = os.path.join(STATUS_DIR, dataset)
+        if not os.path.isdir(status_dir):
+            continue
+        partial = []
+        for filename in sorted(os.listdir(status_dir)):
+            with open(os.path.join(status_dir, filename), encoding="utf-8") as f:
+                if not json.load(f).get("complete"):
+                    partial.append(filename[:-5])
+        print(f"Incomplete {dataset} crawls: {len(partial)}" + (f" ({', '.join(partial)})" if partial else ""))
+
+    if os.path.exists(QUEUE_PATH):
+        queue = WorkQueue(QUEUE_PATH)
+        print("Queue:")
+        for kind, counts in sorted(queue.stats().items()):
+            print(f"  {kind:8s} " + "  ".join(f"{k}={v}" for k, v in sorted(counts.items())))
+        queue.close()
+
+    if os.path.exists(LIMITER_PATH):
+        print("Rate limits:")
+        for host, rate in sorted(RateLimiter(LIMITER_PATH).rates().items()):
+            print(f"  {host:28s} {rate:.2f} req/s")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="VN30 stock data collectors")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_ohlcv = sub.add_parser("ohlcv", help="Download OHLCV prices with vnstock")
+    p_ohlcv.add_argument("--symbols", nargs="+", help="Symbols to download (default: VN30)")
+    p_ohlcv.add_argument("--all", action="store_true", help="Download every listed symbol")
+    p_ohlcv.add_argument("--start", default="2020-01-01", help="Start date YYYY-MM-DD")
+    p_ohlcv.add_argument("--end", help="End date YYYY-MM-DD (default: today)")
+    p_ohlcv.add_argument("--interval", default="1D")
+    p_ohlcv.add_argument("--source", default="VCI", choices=["VCI", "TCBS"])
+    p_ohlcv.add_argument("--output-dir", default="data/OLHCV")
+    p_ohlcv.add_argument("--excel", choices=["sheets", "long"], help="Export one workbook after downloading")
+    p_ohlcv.add_argument("--excel-background", action="store_true", help="Run the Excel export in a separate process")
+    p_ohlcv.add_argument("--intraday", action="store_true", help="Chunked streaming download")
+    p_ohlcv.add_argument("--window-days", type=int, default=30)
+    p_ohlcv.add_argument("--workers", type=int, default=4)
+    p_ohlcv.add_argument("--profile", action="store_true", help=PROFILE_HELP)
+    p_ohlcv.set_defaults(func=cmd_ohlcv)
+
+    p_finance = sub.add_parser("finance", help="Crawl Vietstock financial statements")
+    p_finance.add_argument("--symbols", nargs="+", help="Symbols to crawl (default: VN30)")
+    p_finance.add_argument("--profile", action="store_true", help=PROFILE_HELP)
+    p_finance.set_defaults(func=cmd_finance)
+
+    p_reparse = sub.add_parser("reparse", help="Rebuild finance outputs from the raw HTML archive")
+    p_reparse.add_argument("--symbols", nargs="+", help="Symbols to re-parse (default: all archived)")
+    p_reparse.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    p_reparse.set_defaults(func=cmd_reparse)
+
+    p_shares = sub.add_parser("shares", help="Crawl cophieu68 shares outstanding")
+    p_shares.add_argument("--symbols", nargs="+", help="Symbols to crawl (default: VN30)")
+    p_shares.add_argument("--profile", action="store_true", help=PROFILE_HELP)
+    p_shares.set_defaults(func=cmd_shares)
+
+    p_search = sub.add_parser("search", help="Open Vietstock search results in the browser")
+    p_search.add_argument("--symbols", nargs="+", help="Symbols to search")
+    p_search.add_argument("--profile", action="store_true", help=PROFILE_HELP)
+    p_search.set_defaults(func=cmd_search)
+
+    p_daemon = sub.add_parser("daemon", help="Run the trading-hours live OHLCV daemon",
+                              description="Arguments are passed through to ohlcv_daemon.py")
+    p_daemon.add_argument("daemon_args", nargs=argparse.REMAINDER)
+    p_daemon.set_defaults(func=cmd_daemon)
+
+    p_adjust = sub.add_parser("adjust", help="Back-adjust OHLCV prices for splits and stock dividends")
+    p_adjust.add_argument("--symbols", nargs="+", help="Symbols to adjust (default: all with shares data)")
+    p_adjust.add_argument("--full", action="store_true", help="Recompute instead of rescaling incrementally")
+    p_adjust.set_defaults(func=cmd_adjust)
+
+    p_backtest = sub.add_parser("backtest", help="Sweep strategy parameters over the OHLCV panel",
+                                description="Arguments are passed through to backtest.py")
+    p_backtest.add_argument("backtest_args", nargs=argparse.REMAINDER)
+    p_backtest.set_defaults(func=cmd_backtest)
+
+    p_risk = sub.add_parser("risk", help="Update rolling covariance, correlation and beta",
+                            description="Arguments are passed through to risk.py")
+    p_risk.add_argument("risk_args", nargs=argparse.REMAINDER)
+    p_risk.set_defaults(func=cmd_risk)
+
+    p_status = sub.add_parser("status", help="Show dataset, crawl, queue and rate limit status")
+    p_status.set_defaults(func=cmd_status)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    try:
+        sys.stdout.reconfigure(encoding="utf-8")
+    except Exception:
+        pass
+    main()
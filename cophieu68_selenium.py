@@ -5,8 +5,12 @@ import sys
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from rate_limiter import COPHIEU68_HOST, get_limiter, page_is_blocked
+from crawl_retry import RetryBudget, record_status, retry_step
+from change_manifest import commit_if_changed, shares_partitions
+from profiler import profileable
+from browser_governor import BrowserGovernor, record_page_load
 
 # List of VN30 stocks
 VN30_STOCKS = [
@@ -69,256 +73,351 @@ def check_and_close_ad(driver):
         # Ensure we are back to default content
         driver.switch_to.default_content()
 
-def crawl_stock(driver, wait, symbol):
-    print(f"\n--- Processing {symbol} ---")
+COPHIEU68_HOME = "https://www.cophieu68.vn/index.php"
+
+def search_symbol(driver, wait, symbol):
+    """Step 1-2: search for the symbol and wait for its summary page."""
+    check_and_close_ad(driver)
+    print(f"Searching for {symbol}...")
+    
+    limiter = get_limiter()
+
+    # Ensure we are on a page with search bar, if not, go to home
     try:
-        # 1. Search for Stock
-        check_and_close_ad(driver)
-        print(f"Searching for {symbol}...")
-        
-        # Ensure we are on a page with search bar, if not, go to home
-        try:
-             driver.find_element(By.ID, "id")
-        except:
-             driver.get("https://www.cophieu68.vn/index.php")
-             
-        search_input = wait.until(EC.visibility_of_element_located((By.ID, "id")))
-        search_input.clear()
-        search_input.send_keys(symbol)
+         driver.find_element(By.ID, "id")
+    except:
+         with limiter.request(COPHIEU68_HOST) as outcome:
+             driver.get(COPHIEU68_HOME)
+             outcome.captcha = page_is_blocked(driver)
+         
+    search_input = wait.until(EC.visibility_of_element_located((By.ID, "id")))
+    search_input.clear()
+    search_input.send_keys(symbol)
+    with limiter.request(COPHIEU68_HOST) as outcome:
         search_input.send_keys(Keys.ENTER)
         
-        # 2. Wait for summary page
         print("Waiting for summary page...")
         wait.until(EC.url_contains(f"id={symbol}"))
-        time.sleep(1)
-        
-        # 3. Click 'Lịch sự kiện'
-        check_and_close_ad(driver)
-        print("Clicking 'Lich su kien'...")
-        # Selector from analysis: a[href*="quote/event.php?id=acb"]
-        # Use generic selector with symbol
-        event_link = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, f"a[href*='quote/event.php?id={symbol.lower()}']")))
+        outcome.captcha = page_is_blocked(driver)
+    record_page_load(driver)
+    time.sleep(1)
+
+def open_event_page(driver, wait, symbol):
+    """Step 3-4: click 'Lich su kien' and wait for the event page."""
+    check_and_close_ad(driver)
+    print("Clicking 'Lich su kien'...")
+    # Selector from analysis: a[href*="quote/event.php?id=acb"]
+    # Use generic selector with symbol
+    event_link = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, f"a[href*='quote/event.php?id={symbol.lower()}']")))
+    with get_limiter().request(COPHIEU68_HOST) as outcome:
         driver.execute_script("arguments[0].click();", event_link)
         
         # Check for ad that appears AFTER click (Interstitial)
         time.sleep(2)
         check_and_close_ad(driver)
         
-        # 4. Wait for Event page
         print("Waiting for Event page...")
         wait.until(EC.url_contains("event.php"))
-        time.sleep(1)
-        
-        # 5. Click 'Công thức tính khối lượng'
-        check_and_close_ad(driver)
-        print("Clicking 'Cong thuc tinh khoi luong'...")
-        # Selector from analysis: a[href*="event_calc_volume.php?id=acb"]
-        calc_link = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, f"a[href*='event_calc_volume.php']")))
+        outcome.captcha = page_is_blocked(driver)
+        # Includes the fixed wait for the interstitial ad
+        outcome.timed = False
+    record_page_load(driver)
+    time.sleep(1)
+
+def open_calc_volume_page(driver, wait):
+    """Step 5-6: click 'Cong thuc tinh khoi luong' and wait for the volume formula page."""
+    check_and_close_ad(driver)
+    print("Clicking 'Cong thuc tinh khoi luong'...")
+    # Selector from analysis: a[href*="event_calc_volume.php?id=acb"]
+    calc_link = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, f"a[href*='event_calc_volume.php']")))
+    with get_limiter().request(COPHIEU68_HOST) as outcome:
         driver.execute_script("arguments[0].click();", calc_link)
         
         # Check for ad post-click
         time.sleep(2)
         check_and_close_ad(driver)
         
-        # 6. Verify Final Page
         print("Waiting for Volume Formula page...")
         wait.until(EC.url_contains("event_calc_volume.php"))
-        print("Successfully reached 'Cong thuc tinh khoi luong' page!")
-        
-        # 7. Data Extraction via JS
-        print(f"[{symbol}] Extracting data via JS...")
-        try:
-            check_and_close_ad(driver)
-            
-            # Use JS to extract data directly
-            # Use JS to find table by content and extract
-            script = """
-            var debug = [];
-            var tables = document.querySelectorAll('table');
-            var targetTable = null;
-            
-            // 1. Find the correct table
-            var candidates = [];
-            for (var i = 0; i < tables.length; i++) {
-                var txt = tables[i].innerText;
-                if (txt.includes('Ngày bổ sung') && (txt.includes('Cổ phiếu Lưu Hành') || txt.includes('Khối lượng'))) {
-                    candidates.push(tables[i]);
-                    debug.push("Candidate table at index " + i + " with " + tables[i].rows.length + " rows.");
-                }
-            }
-            
-            // Pick candidate with most rows
-            if (candidates.length > 0) {
-                targetTable = candidates[0];
-                for (var i = 1; i < candidates.length; i++) {
-                    if (candidates[i].rows.length > targetTable.rows.length) {
-                        targetTable = candidates[i];
-                    }
-                }
-                debug.push("Selected table with " + targetTable.rows.length + " rows.");
-            }
-            
-            if (!targetTable) {
-                // Fallback: Look for the specific ID if text search fails 
-                targetTable = document.getElementById('calc_volume');
-                if (targetTable) debug.push("Found table by ID 'calc_volume' fallback.");
-                else {
-                    targetTable = document.getElementById('table_anchor_calc_volume');
-                    if (targetTable) debug.push("Found table by ID 'table_anchor_calc_volume' fallback.");
-                    
-                    // If target table has only 1 row (header), try to find its sibling 'calc_volume'
-                    if (targetTable && targetTable.rows.length <= 1) {
-                         var sibling = document.getElementById('calc_volume');
-                         if (sibling) {
-                             targetTable = sibling;
-                             debug.push("Switched to 'calc_volume' sibling with " + sibling.rows.length + " rows.");
-                         }
-                    }
-                }
-            }
-            
-            if (!targetTable) {
-                var allTableText = [];
-                for(var j=0; j<Math.min(tables.length, 3); j++) {
-                    allTableText.push("Table " + j + ": " + tables[j].innerText.substring(0, 100).replace(/\\n/g, " "));
-                }
-                debug.push("Tables Found: " + tables.length);
-                if (tables.length > 0) debug.push("Sample Content: " + allTableText.join(" | "));
-                return {error: "Table not found", debug: debug};
-            }
-            
-            var rows = targetTable.rows;
-            var data = [];
-            var colIndex = -1;
-            
-            // 2. Find the target column index
-            // Scan first few rows for header
-            for (var r = 0; r < Math.min(rows.length, 5); r++) {
-                var cells = rows[r].cells;
-                for (var c = 0; c < cells.length; c++) {
-                    if (cells[c].innerText.includes('Ngày bổ sung')) {
-                        colIndex = c;
-                        break;
-                    }
-                }
-                if (colIndex !== -1) break;
+        outcome.captcha = page_is_blocked(driver)
+        # Includes the fixed wait for the interstitial ad
+        outcome.timed = False
+    record_page_load(driver)
+    print("Successfully reached 'Cong thuc tinh khoi luong' page!")
+
+def extract_shares(driver, symbol):
+    """Step 7-8: extract the share count history from the volume formula page."""
+    print(f"[{symbol}] Extracting data via JS...")
+    check_and_close_ad(driver)
+    
+    # Use JS to extract data directly
+    # Use JS to find table by content and extract
+    script = """
+    var debug = [];
+    var tables = document.querySelectorAll('table');
+    var targetTable = null;
+
+    // 1. Find the correct table
+    var candidates = [];
+    for (var i = 0; i < tables.length; i++) {
+        var txt = tables[i].innerText;
+        if (txt.includes('Ngày bổ sung') && (txt.includes('Cổ phiếu Lưu Hành') || txt.includes('Khối lượng'))) {
+            candidates.push(tables[i]);
+            debug.push("Candidate table at index " + i + " with " + tables[i].rows.length + " rows.");
+        }
+    }
+
+    // Pick candidate with most rows
+    if (candidates.length > 0) {
+        targetTable = candidates[0];
+        for (var i = 1; i < candidates.length; i++) {
+            if (candidates[i].rows.length > targetTable.rows.length) {
+                targetTable = candidates[i];
             }
-            
-            if (colIndex === -1) {
-                 // Fallback: use 6th index (7th column) if text search fails
-                 colIndex = 6;
-                 debug.push("Column header not found, using default index 6");
-            } else {
-                 debug.push("Found column header at index " + colIndex);
+        }
+        debug.push("Selected table with " + targetTable.rows.length + " rows.");
+    }
+
+    if (!targetTable) {
+        // Fallback: Look for the specific ID if text search fails 
+        targetTable = document.getElementById('calc_volume');
+        if (targetTable) debug.push("Found table by ID 'calc_volume' fallback.");
+        else {
+            targetTable = document.getElementById('table_anchor_calc_volume');
+            if (targetTable) debug.push("Found table by ID 'table_anchor_calc_volume' fallback.");
+
+            // If target table has only 1 row (header), try to find its sibling 'calc_volume'
+            if (targetTable && targetTable.rows.length <= 1) {
+                 var sibling = document.getElementById('calc_volume');
+                 if (sibling) {
+                     targetTable = sibling;
+                     debug.push("Switched to 'calc_volume' sibling with " + sibling.rows.length + " rows.");
+                 }
             }
-            
-            debug.push("Total Rows: " + rows.length);
-            
-            // 3. Extract data
-            var sampleCells = [];
-            for (var i = 0; i < rows.length; i++) {
-                var cells = rows[i].cells;
-                if (cells.length > colIndex) {
-                    var cell = cells[colIndex];
-                    var html = cell.innerHTML;
-                    
-                    if (data.length < 3) {
-                         sampleCells.push("Row " + i + ": " + html.substring(0, 50).replace(/\\n/g, " "));
-                    }
-                    
-                    if (html.includes('<br>')) {
-                         var parts = html.split('<br>');
-                         if (parts.length >= 2) {
-                             var date = parts[0].replace(/<[^>]+>/g, '').trim();
-                             // skip if it's the header row itself
-                             if (date.includes('Ngày bổ sung')) continue;
-                             
-                             var volRaw = parts[1];
-                             var volClean = volRaw.replace(/<[^>]+>/g, '').trim();
-                             // Remove commas for clean data
-                             data.push({'Ngay bo sung': date, 'Co phieu luu hanh': volClean});
-                         }
-                    }
-                }
+        }
+    }
+
+    if (!targetTable) {
+        var allTableText = [];
+        for(var j=0; j<Math.min(tables.length, 3); j++) {
+            allTableText.push("Table " + j + ": " + tables[j].innerText.substring(0, 100).replace(/\\n/g, " "));
+        }
+        debug.push("Tables Found: " + tables.length);
+        if (tables.length > 0) debug.push("Sample Content: " + allTableText.join(" | "));
+        return {error: "Table not found", debug: debug};
+    }
+
+    var rows = targetTable.rows;
+    var data = [];
+    var colIndex = -1;
+
+    // 2. Find the target column index
+    // Scan first few rows for header
+    for (var r = 0; r < Math.min(rows.length, 5); r++) {
+        var cells = rows[r].cells;
+        for (var c = 0; c < cells.length; c++) {
+            if (cells[c].innerText.includes('Ngày bổ sung')) {
+                colIndex = c;
+                break;
             }
-            
-            if (data.length === 0) {
-                 debug.push("Extraction Content Samples: " + sampleCells.join(" | "));
+        }
+        if (colIndex !== -1) break;
+    }
+
+    if (colIndex === -1) {
+         // Fallback: use 6th index (7th column) if text search fails
+         colIndex = 6;
+         debug.push("Column header not found, using default index 6");
+    } else {
+         debug.push("Found column header at index " + colIndex);
+    }
+
+    debug.push("Total Rows: " + rows.length);
+
+    // 3. Extract data
+    var sampleCells = [];
+    for (var i = 0; i < rows.length; i++) {
+        var cells = rows[i].cells;
+        if (cells.length > colIndex) {
+            var cell = cells[colIndex];
+            var html = cell.innerHTML;
+
+            if (data.length < 3) {
+                 sampleCells.push("Row " + i + ": " + html.substring(0, 50).replace(/\\n/g, " "));
             }
-            
-            return {data: data, debug: debug};
-            """
-            
-            # Retry loop for extraction (handle slow loading rows)
-            debug_info = []
-            for attempt in range(3):
-                result = driver.execute_script(script)
-                extracted_data = result.get('data', [])
-                debug_info = result.get('debug', [])
-                
-                if extracted_data:
-                    break
-                time.sleep(2)
-
-            print(f"[{symbol}] Extracted {len(extracted_data)} records.")
-            
-            # 8. Fallback: Single Listing Check (e.g., BCM)
-            if not extracted_data:
-                 print(f"[{symbol}] No table data. Checking for single listing info...")
-                 script_single = """
-                 var body = document.body.innerText;
-                 var dateRegex = /Ngày niêm yết:\\s*(\\d{2}\\/\\d{2}\\/\\d{4})/;
-                 var volRegex = /Khối lượng niêm yết lần đầu:\\s*([0-9,]+)/;
-                 
-                 var dateMatch = body.match(dateRegex);
-                 var volMatch = body.match(volRegex);
-                 
-                 if (dateMatch && volMatch) {
-                     return [{
-                         'Ngay bo sung': dateMatch[1],
-                         'Co phieu luu hanh': volMatch[1]
-                     }];
+
+            if (html.includes('<br>')) {
+                 var parts = html.split('<br>');
+                 if (parts.length >= 2) {
+                     var date = parts[0].replace(/<[^>]+>/g, '').trim();
+                     // skip if it's the header row itself
+                     if (date.includes('Ngày bổ sung')) continue;
+
+                     var volRaw = parts[1];
+                     var volClean = volRaw.replace(/<[^>]+>/g, '').trim();
+                     // Remove commas for clean data
+                     data.push({'Ngay bo sung': date, 'Co phieu luu hanh': volClean});
                  }
-                 return [];
-                 """
-                 extracted_data = driver.execute_script(script_single)
-                 if extracted_data:
-                     print(f"[{symbol}] Found single listing info: {extracted_data}")
-            
-            if extracted_data:
-                # Save data
-                os.makedirs("data/Shares_Outstanding", exist_ok=True)
-                filename = f"data/Shares_Outstanding/{symbol}.csv"
-                with open(filename, "w", newline="", encoding="utf-8") as f:
-                    writer = csv.DictWriter(f, fieldnames=["Ngay bo sung", "Co phieu luu hanh"])
-                    writer.writeheader()
-                    writer.writerows(extracted_data)
-                print(f"Data saved to {filename}")
-            else:
-                print(f"No data found for {symbol}")
-                # Optional: print debug info only on failure
-                # print(f"[{symbol}] Debug info: {debug_info}")
-
-        except Exception as ex:
-             print(f"Extraction error for {symbol}: {ex}")
+            }
+        }
+    }
 
-    except Exception as e:
-        print(f"Error processing {symbol}: {e}")
-        # traceback.print_exc()
+    // 4. Explicit "no data" message of the table or its container, the only
+    // signal that an empty table really means no share events
+    var emptyState = false;
+    if (data.length === 0) {
+         debug.push("Extraction Content Samples: " + sampleCells.join(" | "));
+         var container = targetTable.parentElement || targetTable;
+         var text = container.innerText.toLowerCase();
+         var markers = ['không có dữ liệu', 'chưa có dữ liệu', 'no data'];
+         for (var m = 0; m < markers.length; m++) {
+             if (text.includes(markers[m])) emptyState = true;
+         }
+    }
+
+    return {data: data, debug: debug, emptyState: emptyState};
+    """
+    
+    # Retry loop for extraction (handle slow loading rows)
+    debug_info = []
+    empty_state = False
+    for attempt in range(3):
+        result = driver.execute_script(script)
+        extracted_data = result.get('data', [])
+        debug_info = result.get('debug', [])
+        empty_state = bool(result.get('emptyState'))
+        
+        if extracted_data:
+            break
+        time.sleep(2)
+
+    print(f"[{symbol}] Extracted {len(extracted_data)} records.")
+    
+    # Fallback: Single Listing Check (e.g., BCM)
+    if not extracted_data:
+         print(f"[{symbol}] No table data. Checking for single listing info...")
+         script_single = """
+         var body = document.body.innerText;
+         var dateRegex = /Ngày niêm yết:\\s*(\\d{2}\\/\\d{2}\\/\\d{4})/;
+         var volRegex = /Khối lượng niêm yết lần đầu:\\s*([0-9,]+)/;
 
-def run_automation():
-    driver = webdriver.Chrome()
+         var dateMatch = body.match(dateRegex);
+         var volMatch = body.match(volRegex);
+
+         if (dateMatch && volMatch) {
+             return [{
+                 'Ngay bo sung': dateMatch[1],
+                 'Co phieu luu hanh': volMatch[1]
+             }];
+         }
+         return [];
+         """
+         extracted_data = driver.execute_script(script_single)
+         if extracted_data:
+             print(f"[{symbol}] Found single listing info: {extracted_data}")
+    
+    if not extracted_data and not empty_state:
+        # Missing table or rows not loaded yet: let retry_step try again
+        # Optional: print debug info only on failure
+        # print(f"[{symbol}] Debug info: {debug_info}")
+        raise RuntimeError("no share data found on page")
+    if not extracted_data:
+        # The page says explicitly that there are no share events
+        print(f"[{symbol}] Page reports no share events.")
+    return extracted_data
+
+def crawl_stock(driver, wait, symbol, budget=None):
+    """Crawls the shares outstanding history of a symbol. Returns the saved CSV path or None.
+
+    A symbol whose page explicitly reports no share events is a complete result:
+    a CSV with only the header is saved and the status records 0 records. An
+    empty result never replaces an existing file that has share events.
+
+    Each step of the click chain is retried on its own: a failed step re-opens the page
+    reached by the previous step instead of restarting from the search.
+    """
+    print(f"\n--- Processing {symbol} ---")
+    budget = budget or RetryBudget()
+    status = {"complete": False, "steps_ok": [], "failed_step": None, "errors": []}
+    # URL reached after each completed step, used to re-navigate before a retry
+    checkpoint = {"url": COPHIEU68_HOME}
+
+    def reopen_checkpoint():
+        with get_limiter().request(COPHIEU68_HOST) as outcome:
+            driver.get(checkpoint["url"])
+            outcome.captcha = page_is_blocked(driver)
+        time.sleep(1)
+
+    steps = [
+        ("search", lambda: search_symbol(driver, wait, symbol)),
+        ("event page", lambda: open_event_page(driver, wait, symbol)),
+        ("volume formula page", lambda: open_calc_volume_page(driver, wait)),
+        ("extract", lambda: extract_shares(driver, symbol)),
+    ]
+
+    extracted_data = None
+    for name, action in steps:
+        try:
+            extracted_data = retry_step(f"{symbol} {name}", action, budget, recover=reopen_checkpoint)
+        except Exception as e:
+            print(f"Error processing {symbol}: {e}")
+            status["failed_step"] = name
+            status["errors"].append(f"{name}: {e}")
+            record_status("shares", symbol, status)
+            return None
+        status["steps_ok"].append(name)
+        checkpoint["url"] = driver.current_url
+
+    # Save data
+    os.makedirs("data/Shares_Outstanding", exist_ok=True)
+    filename = f"data/Shares_Outstanding/{symbol}.csv"
+
+    if not extracted_data and os.path.exists(filename):
+        with open(filename, newline="", encoding="utf-8") as f:
+            existing = sum(1 for _ in csv.DictReader(f))
+        if existing:
+            print(f"[{symbol}] Empty result, keeping the {existing} events already in {filename}")
+            status["complete"] = True
+            status["records"] = existing
+            status["kept_existing"] = True
+            record_status("shares", symbol, status)
+            return filename
+
+    def write():
+        with open(filename, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=["Ngay bo sung", "Co phieu luu hanh"])
+            writer.writeheader()
+            writer.writerows(extracted_data)
+        print(f"Data saved to {filename}")
+
+    commit_if_changed("shares", symbol, shares_partitions(extracted_data), write, [filename])
+
+    status["complete"] = True
+    status["records"] = len(extracted_data)
+    record_status("shares", symbol, status)
+    return filename
+
+def open_home(driver):
+    """Opens the cophieu68 home page, the starting point of every symbol."""
     driver.maximize_window()
-    wait = WebDriverWait(driver, 10)
+    print("Navigating to https://www.cophieu68.vn/index.php ...")
+    with get_limiter().request(COPHIEU68_HOST) as outcome:
+        driver.get(COPHIEU68_HOME)
+        outcome.captcha = page_is_blocked(driver)
+    time.sleep(2) 
+
+@profileable
+def run_automation(symbols=None):
+    symbols = symbols or VN30_STOCKS
+    # Recycles Chrome every few dozen symbols or when it grows slow/large
+    governor = BrowserGovernor(webdriver.Chrome, open_home)
     
     try:
-        # Initial Navigation
-        print("Navigating to https://www.cophieu68.vn/index.php ...")
-        driver.get("https://www.cophieu68.vn/index.php")
-        time.sleep(2) 
-        
-        for stock in VN30_STOCKS:
-            crawl_stock(driver, wait, stock)
+        budget = RetryBudget()
+        for stock in symbols:
+            governor.before_symbol()
+            crawl_stock(governor.driver, governor.wait, stock, budget)
+            governor.symbol_done()
             
     except Exception as e:
         import traceback
@@ -327,7 +426,7 @@ def run_automation():
     finally:
         print("Closing driver in 5 seconds...")
         time.sleep(5)
-        driver.quit()
+        governor.close()
 
 if __name__ == "__main__":
     # Safe print for Windows console
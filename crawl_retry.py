@@ -0,0 +1,86 @@
+"""
+Step-level retry for the browser crawlers
+A failed page or click is re-navigated and retried on its own instead of
+dropping the whole symbol. Retries across a run draw from one RetryBudget so a
+broken site cannot stall a run forever, and every crawl records what it got in
+data/crawl_status/{dataset}/{symbol}.json so partial results are explicit.
+"""
+
+import json
+import os
+import time
+from datetime import datetime
+
+STATUS_DIR = "data/crawl_status"
+
+
+class RetryBudget:
+    """Total number of step retries allowed for one crawler run."""
+
+    def __init__(self, total: int = 50):
+        self.total = total
+        self.remaining = total
+
+    def take(self) -> bool:
+        if self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        return True
+
+
+def retry_step(name: str, action, budget: RetryBudget, attempts: int = 3, recover=None, delay: float = 2.0):
+    """
+    Run one crawler step, retrying only that step on failure.
+
+    Args:
+        name: Step name used in log messages
+        action: Callable performing the step; its return value is returned
+        budget: Run-wide retry budget
+        attempts: Maximum tries for this step
+        recover: Optional callable run before each retry (e.g. re-navigate)
+        delay: Seconds to wait before retrying
+
+    Returns:
+        Whatever `action` returns
+
+    Raises:
+        The last exception once attempts or the budget are exhausted
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return action()
+        except Exception as e:
+            if attempt == attempts or not budget.take():
+                print(f"Step '{name}' failed after {attempt} attempt(s): {e}")
+                raise
+            print(f"Step '{name}' failed ({e}), retrying {attempt + 1}/{attempts} "
+                  f"({budget.remaining} retries left in run)...")
+            time.sleep(delay)
+            if recover is not None:
+                try:
+                    recover()
+                except Exception as recover_error:
+                    print(f"Recovery for '{name}' failed: {recover_error}")
+
+
+def record_status(dataset: str, symbol: str, status: dict, status_dir: str = STATUS_DIR) -> str:
+    """
+    Write the outcome of one symbol's crawl.
+
+    Args:
+        dataset: 'finance' or 'shares'
+        symbol: Stock ticker symbol
+        status: Dict with at least 'complete' (bool); failed pages/steps and
+            error messages are recorded alongside
+
+    Returns:
+        Path of the status file
+    """
+    os.makedirs(os.path.join(status_dir, dataset), exist_ok=True)
+    path = os.path.join(status_dir, dataset, f"{symbol}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"symbol": symbol, "crawled_at": datetime.now().isoformat(timespec="seconds"), **status},
+                  f, ensure_ascii=False, indent=1)
+    if not status.get("complete"):
+        print(f"[{symbol}] Partial {dataset} result recorded in {path}")
+    return path
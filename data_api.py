@@ -0,0 +1,273 @@
+"""
+Query API over the datasets written by the collectors
+Read OHLCV prices, financial statements and shares outstanding without
+re-parsing the same CSV files on every call.
+
+Decoded frames are kept in a bounded LRU cache keyed by file path. An entry is
+dropped as soon as the file's mtime or size changes, so a fresh run of
+download_ohlcv / crawl_stock_data / crawl_stock is picked up automatically.
+
+Usage:
+    from data_api import load_prices, load_statements, load_statements_long, load_shares
+
+    prices = load_prices(["ACB", "FPT"], start="2024-01-01", fields=["close"])
+    income = load_statements("VNM", quarters=["Q1/2024", "Q2/2024"])
+    revenue = load_statements_long(["ACB", "FPT"], indicators=["Net revenue"])
+    shares = load_shares("VNM", asof="2024-06-30")
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from finance_store import FINANCE_LONG_DIR, concat_long, quarter_to_period, read_long, to_long, to_wide
+
+OHLCV_DIR = "data/OLHCV"
+FINANCE_DIR = "data/finance"
+SHARES_DIR = "data/Shares_Outstanding"
+
+
+class FrameCache:
+    """Bounded LRU cache of decoded DataFrames, invalidated on file change."""
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path: str, loader):
+        """
+        Return the decoded frame for `path`, loading it with `loader(path)` on a miss.
+
+        Args:
+            path: File to read
+            loader: Callable that parses the file into a DataFrame
+
+        Returns:
+            The cached (or freshly loaded) DataFrame
+        """
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        df = loader(path)
+
+        with self._lock:
+            self._entries[path] = (signature, df)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return df
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+            }
+
+
+_cache = FrameCache()
+
+
+def clear_cache():
+    """Drop every cached frame."""
+    _cache.clear()
+
+
+def cache_info() -> dict:
+    """Return hit/miss counters and current size of the frame cache."""
+    return _cache.info()
+
+
+def _read_ohlcv(path: str) -> pd.DataFrame:
+    df = pd.read_csv(path)
+    df["time"] = pd.to_datetime(df["time"])
+    # Sorted, unique DatetimeIndex so .loc[start:end] is a binary search
+    df = df.drop_duplicates(subset="time", keep="last").set_index("time").sort_index()
+    return df
+
+
+def _read_wide_statement(path: str) -> pd.DataFrame:
+    # Files crawled before the long store existed: normalize once, then cache
+    symbol = os.path.splitext(os.path.basename(path))[0]
+    return to_long(pd.read_csv(path), symbol)
+
+
+def _read_shares(path: str) -> pd.DataFrame:
+    df = pd.read_csv(path, dtype=str)
+    df["date"] = pd.to_datetime(df["Ngay bo sung"], format="%d/%m/%Y", errors="coerce")
+    df["shares"] = pd.to_numeric(
+        df["Co phieu luu hanh"].str.replace(",", "", regex=False), errors="coerce"
+    )
+    df = df.dropna(subset=["date", "shares"])
+    df["shares"] = df["shares"].astype("int64")
+    return df[["date", "shares"]].set_index("date").sort_index()
+
+
+def load_prices(
+    symbols,
+    start: str = None,
+    end: str = None,
+    fields: list = None,
+    data_dir: str = OHLCV_DIR
+) -> pd.DataFrame:
+    """
+    Load OHLCV bars for one or more symbols.
+
+    Args:
+        symbols: A ticker symbol or a list of symbols
+        start: First date to include, 'YYYY-MM-DD' (default: earliest available)
+        end: Last date to include, 'YYYY-MM-DD' (default: latest available)
+        fields: Columns to return, e.g. ['close', 'volume'] (default: all)
+        data_dir: Directory written by download_ohlcv
+
+    Returns:
+        DataFrame indexed by date for a single symbol, or by (symbol, time)
+        for a list of symbols. Symbols without a file are skipped.
+    """
+    single = isinstance(symbols, str)
+    symbol_list = [symbols] if single else list(symbols)
+
+    frames = {}
+    for symbol in symbol_list:
+        path = os.path.join(data_dir, f"{symbol}.csv")
+        if not os.path.exists(path):
+            print(f"No price file for {symbol} in {data_dir}")
+            continue
+        df = _cache.get(path, _read_ohlcv)
+        df = df.loc[start:end]
+        if fields is not None:
+            df = df[fields]
+        frames[symbol] = df.copy()
+
+    if not frames:
+        return pd.DataFrame()
+    if single:
+        return frames[symbols]
+    return pd.concat(frames, names=["symbol", "time"])
+
+
+def _statement_long(symbol: str, data_dir: str, long_dir: str):
+    long_path = os.path.join(long_dir, f"{symbol}.csv")
+    if os.path.exists(long_path):
+        return _cache.get(long_path, read_long)
+    path = os.path.join(data_dir, f"{symbol}.csv")
+    if os.path.exists(path):
+        return _cache.get(path, _read_wide_statement)
+    return None
+
+
+def _filter_long(df: pd.DataFrame, indicators: list, quarters: list) -> pd.DataFrame:
+    mask = pd.Series(True, index=df.index)
+    if indicators is not None:
+        mask &= df["indicator"].isin(indicators)
+    if quarters is not None:
+        mask &= df["quarter"].isin([quarter_to_period(q) for q in quarters])
+    return df[mask]
+
+
+def load_statements(
+    symbol: str,
+    indicators: list = None,
+    quarters: list = None,
+    data_dir: str = FINANCE_DIR,
+    long_dir: str = FINANCE_LONG_DIR
+) -> pd.DataFrame:
+    """
+    Load the combined income statement / balance sheet of a symbol.
+
+    Args:
+        symbol: Stock ticker symbol
+        indicators: Indicator labels to keep (default: all)
+        quarters: Quarters to keep, e.g. ['Q1/2024'] (default: all)
+        data_dir: Directory with the wide CSVs written by crawl_stock_data
+        long_dir: Directory with the normalized long tables (preferred)
+
+    Returns:
+        DataFrame indexed by indicator with one float64 column per quarter
+    """
+    long_df = _statement_long(symbol, data_dir, long_dir)
+    if long_df is None:
+        print(f"No finance file for {symbol} in {long_dir} or {data_dir}")
+        return pd.DataFrame()
+    return to_wide(_filter_long(long_df, indicators, quarters))
+
+
+def load_statements_long(
+    symbols,
+    indicators: list = None,
+    quarters: list = None,
+    data_dir: str = FINANCE_DIR,
+    long_dir: str = FINANCE_LONG_DIR
+) -> pd.DataFrame:
+    """
+    Load statements of one or more symbols as a single typed long table.
+
+    Args:
+        symbols: A ticker symbol or a list of symbols
+        indicators: Indicator labels to keep (default: all)
+        quarters: Quarters to keep, e.g. ['Q2/2024'] (default: all)
+        data_dir: Directory with the wide CSVs written by crawl_stock_data
+        long_dir: Directory with the normalized long tables (preferred)
+
+    Returns:
+        DataFrame with categorical symbol/indicator, period quarter and
+        float64 value columns
+    """
+    symbol_list = [symbols] if isinstance(symbols, str) else list(symbols)
+    frames = []
+    for symbol in symbol_list:
+        long_df = _statement_long(symbol, data_dir, long_dir)
+        if long_df is None:
+            print(f"No finance file for {symbol} in {long_dir} or {data_dir}")
+            continue
+        frames.append(_filter_long(long_df, indicators, quarters))
+    return concat_long(frames)
+
+
+def load_shares(symbol: str, asof: str = None, data_dir: str = SHARES_DIR):
+    """
+    Load the shares outstanding history of a symbol.
+
+    Args:
+        symbol: Stock ticker symbol
+        asof: If given, return only the share count in effect on this date
+        data_dir: Directory written by crawl_stock
+
+    Returns:
+        DataFrame indexed by date with a 'shares' column, or the share count
+        (int) in effect at `asof` (None if no event precedes it)
+    """
+    path = os.path.join(data_dir, f"{symbol}.csv")
+    if not os.path.exists(path):
+        print(f"No shares file for {symbol} in {data_dir}")
+        return None if asof is not None else pd.DataFrame()
+
+    df = _cache.get(path, _read_shares)
+    if asof is None:
+        return df.copy()
+
+    pos = df.index.searchsorted(pd.Timestamp(asof), side="right")
+    if pos == 0:
+        return None
+    return int(df["shares"].iat[pos - 1])
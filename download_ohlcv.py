@@ -5,15 +5,63 @@ Download historical stock price data from Vietnamese stock market (HOSE, HNX, UP
 Usage:
     python download_ohlcv.py
 
+Intraday (minute/hour) bars over long ranges are fetched in date windows and
+streamed to disk with download_intraday() / iter_ohlcv_chunks().
+
 Requirements:
-    pip install vnstock pandas openpyxl
+    pip install vnstock pandas xlsxwriter   (or openpyxl)
 """
 
 from vnstock import Vnstock
 from vnstock import Quote
 import pandas as pd
 from datetime import datetime, timedelta
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import json
 import os
+import time
+
+from rate_limiter import SOURCE_HOSTS, get_limiter
+from change_manifest import commit_if_changed, ohlcv_partitions
+from excel_export import export_in_background, export_workbook
+from profiler import profileable
+
+INTRADAY_INTERVALS = ["1m", "5m", "15m", "30m", "1H"]
+
+# VN30 Index Components (30 stocks)
+VN30_SYMBOLS = [
+    "ACB",   # Asia Commercial Bank
+    "BID",   # Bank for Investment and Development
+    "CTG",   # Vietnam Commercial Bank for Industry and Trade
+    "DGC",   # Ducgiang Chemicals
+    "FPT",   # FPT Corp
+    "GAS",   # Petrovietnam Gas
+    "GVR",   # Vietnam Rubber
+    "HDB",   # Ho Chi Minh City Development Bank
+    "HPG",   # Hoa Phat Group
+    "LPB",   # Fortune Vietnam Joint Stock Commercial Bank
+    "MBB",   # Military Commercial Bank
+    "MSN",   # Masan Group
+    "MWG",   # Mobile World Investment
+    "PLX",   # Vietnam National Petroleum
+    "SAB",   # Saigon Beer Alcohol Beverage
+    "SHB",   # Sai Gon Ha Noi Commercial Bank
+    "SSB",   # Southeast Asia Commercial Bank
+    "SSI",   # SSI Securities
+    "STB",   # Sai Gon Thuong Tin Commercial Bank
+    "TCB",   # Techcombank
+    "TPB",   # Tien Phong Commercial Bank
+    "VCB",   # JSC Bank for Foreign Trade of Vietnam
+    "VHM",   # Vinhomes
+    "VIB",   # Vietnam International Commercial Bank
+    "VIC",   # Vingroup
+    "VJC",   # Vietjet Aviation
+    "VNM",   # Vinamilk
+    "VPB",   # Vietnam Prosperity Bank
+    "VRE",   # Vincom Retail
+    "BCM",   # Investment and Industrial Development
+]
 
 
 def download_ohlcv(
@@ -52,7 +100,8 @@ def download_ohlcv(
     
     # Initialize vnstock and get historical data
     quote = Quote(symbol=symbol, source=source)
-    df = quote.history(start=start_date, end=end_date, interval=interval)
+    with get_limiter().request(SOURCE_HOSTS.get(source, source)):
+        df = quote.history(start=start_date, end=end_date, interval=interval)
     
     if df is None or df.empty:
         print(f"No data found for {symbol}")
@@ -63,27 +112,39 @@ def download_ohlcv(
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
     
-    # Save to file
-    if output_format in ["csv", "both"]:
-        csv_file = os.path.join(output_dir, f"{symbol}.csv")
+    csv_file = os.path.join(output_dir, f"{symbol}.csv")
+    excel_file = os.path.join(output_dir, f"{symbol}.xlsx")
+    # The CSV is always written: it is the source of the Excel export
+    paths = [csv_file]
+    if output_format in ["excel", "both"]:
+        paths.append(excel_file)
+    
+    def write():
+        # Save to file
         df.to_csv(csv_file, index=False)
         print(f"Saved to {csv_file}")
+        
+        if excel_file in paths:
+            export_workbook([symbol], data_dir=output_dir, output_path=excel_file)
     
-    if output_format in ["excel", "both"]:
-        excel_file = os.path.join(output_dir, f"{symbol}.xlsx")
-        df.to_excel(excel_file, index=False)
-        print(f"Saved to {excel_file}")
+    # Skip the write entirely if the bars are identical to the last download
+    # of the same interval into the same directory
+    commit_if_changed("ohlcv", symbol, ohlcv_partitions(df), write, paths,
+                      variant=f"{interval}:{os.path.abspath(output_dir)}")
     
     return df
 
 
+@profileable
 def download_multiple_stocks(
     symbols: list,
     start_date: str = None,
     end_date: str = None,
     interval: str = "1D",
     source: str = "VCI",
-    output_dir: str = "data/OLHCV"
+    output_dir: str = "data/OLHCV",
+    excel_layout: str = None,
+    excel_background: bool = False
 ) -> dict:
     """
     Download OHLCV data for multiple stocks.
@@ -95,6 +156,11 @@ def download_multiple_stocks(
         interval: Time interval
         source: Data source
         output_dir: Directory to save output files (default: 'data')
+        excel_layout: If set ('sheets' or 'long'), write one consolidated
+            workbook '{output_dir}/ohlcv.xlsx' after all downloads finish
+        excel_background: Run that export in a separate process
+        profile: Run under the sampling profiler and write a flamegraph
+            and hotspot report to data/profiles (keyword added by profileable)
     
     Returns:
         Dictionary with symbol as key and DataFrame as value
@@ -118,9 +184,224 @@ def download_multiple_stocks(
             print(f"✗ Error downloading {symbol}: {e}\n")
             results[symbol] = pd.DataFrame()
     
+    # Export stage: runs after the network loop so Excel never slows downloads
+    if excel_layout is not None:
+        export_kwargs = dict(
+            symbols=[s for s, df in results.items() if not df.empty],
+            data_dir=output_dir,
+            output_path=os.path.join(output_dir, "ohlcv.xlsx"),
+            layout=excel_layout
+        )
+        if excel_background:
+            export_in_background(**export_kwargs)
+        else:
+            export_workbook(**export_kwargs)
+    
     return results
 
 
+def _date_windows(start_date: str, end_date: str, window_days: int) -> list:
+    """Split [start_date, end_date] into consecutive inclusive windows."""
+    start = datetime.strptime(start_date, "%Y-%m-%d")
+    end = datetime.strptime(end_date, "%Y-%m-%d")
+    windows = []
+    while start <= end:
+        window_end = min(start + timedelta(days=window_days - 1), end)
+        windows.append((start.strftime("%Y-%m-%d"), window_end.strftime("%Y-%m-%d")))
+        start = window_end + timedelta(days=1)
+    return windows
+
+
+def _fetch_window(symbol: str, start: str, end: str, interval: str, source: str, attempts: int = 3):
+    """Fetch one window, retrying failures; returns None if every attempt failed."""
+    for attempt in range(1, attempts + 1):
+        try:
+            quote = Quote(symbol=symbol, source=source)
+            with get_limiter().request(SOURCE_HOSTS.get(source, source)):
+                df = quote.history(start=start, end=end, interval=interval)
+            return df if df is not None else pd.DataFrame()
+        except Exception as e:
+            if attempt == attempts:
+                print(f"✗ {symbol} {start} -> {end} failed after {attempts} attempts: {e}")
+                return None
+            print(f"  {symbol} {start} -> {end} failed ({e}), retrying {attempt + 1}/{attempts}...")
+            time.sleep(2 * attempt)
+
+
+def iter_ohlcv_chunks(
+    symbol: str,
+    start_date: str,
+    end_date: str,
+    interval: str = "1m",
+    source: str = "VCI",
+    window_days: int = 30,
+    max_workers: int = 4,
+    skip_until: str = None,
+    extra_windows: list = None
+):
+    """
+    Fetch a long range window by window and yield the chunks in date order.
+
+    At most `max_workers` windows are in flight at any time, so memory use
+    depends on the window size, not on the length of the range. A window that
+    still fails after its retries is yielded with None instead of a DataFrame,
+    so one bad window does not stop the stream.
+
+    Args:
+        symbol: Stock ticker symbol
+        start_date: Start date in 'YYYY-MM-DD' format
+        end_date: End date in 'YYYY-MM-DD' format
+        interval: Bar interval, e.g. '1m', '5m', '1H'
+        source: Data source - 'VCI' or 'TCBS'
+        window_days: Calendar days per request
+        max_workers: Maximum number of concurrent requests
+        skip_until: Skip windows ending on or before this date (resume)
+        extra_windows: (start, end) windows to fetch first, e.g. windows that
+            failed in an earlier run
+
+    Yields:
+        Tuples of (window_start, window_end, DataFrame or None if it failed)
+    """
+    windows = _date_windows(start_date, end_date, window_days)
+    if skip_until is not None:
+        windows = [w for w in windows if w[1] > skip_until]
+    windows = [tuple(w) for w in extra_windows or []] + windows
+    remaining = iter(windows)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        in_flight = deque()
+
+        def submit_next():
+            window = next(remaining, None)
+            if window is not None:
+                future = pool.submit(_fetch_window, symbol, window[0], window[1], interval, source)
+                in_flight.append((window, future))
+
+        for _ in range(max_workers):
+            submit_next()
+
+        while in_flight:
+            window, future = in_flight.popleft()
+            df = future.result()
+            submit_next()
+            yield window[0], window[1], df
+
+
+def download_intraday(
+    symbol: str,
+    start_date: str,
+    end_date: str = None,
+    interval: str = "1m",
+    source: str = "VCI",
+    window_days: int = 30,
+    max_workers: int = 4,
+    output_dir: str = "data/OLHCV/intraday"
+) -> str:
+    """
+    Download intraday bars in date windows and stream-append them to CSV.
+
+    After each window the CSV is flushed and '{file}.progress.json' is
+    atomically replaced with the last completed window and the CSV size at
+    that point. Running the same call again truncates the CSV to that size
+    (dropping rows of a window that was appended but not committed) and
+    resumes after the last completed window.
+
+    Windows that fail after their retries are skipped and recorded under
+    'failed_windows' in the progress file; the next run with the same
+    arguments fetches them first and appends them at the end of the CSV, so
+    those bars are not in time order with the rest.
+
+    Args:
+        symbol: Stock ticker symbol
+        start_date: Start date in 'YYYY-MM-DD' format
+        end_date: End date in 'YYYY-MM-DD' format (default: today)
+        interval: Bar interval, one of INTRADAY_INTERVALS
+        source: Data source - 'VCI' or 'TCBS'
+        window_days: Calendar days per request
+        max_workers: Maximum number of concurrent requests
+        output_dir: Directory to save output files
+
+    Returns:
+        Path of the CSV file
+    """
+    if interval not in INTRADAY_INTERVALS:
+        raise ValueError(f"Unsupported intraday interval {interval!r}, expected one of {INTRADAY_INTERVALS}")
+    if end_date is None:
+        end_date = datetime.now().strftime("%Y-%m-%d")
+
+    os.makedirs(output_dir, exist_ok=True)
+    csv_file = os.path.join(output_dir, f"{symbol}_{interval}.csv")
+    progress_file = csv_file + ".progress.json"
+
+    # Resume only if the previous run covered the same request
+    skip_until = None
+    retry_windows = []
+    csv_bytes = 0
+    if os.path.exists(progress_file) and os.path.exists(csv_file):
+        with open(progress_file, encoding="utf-8") as f:
+            progress = json.load(f)
+        committed = progress.get("csv_bytes")
+        if (progress.get("start_date") == start_date and progress.get("interval") == interval
+                and committed is not None and os.path.getsize(csv_file) >= committed):
+            skip_until = progress.get("completed_until")
+            retry_windows = progress.get("failed_windows", [])
+            csv_bytes = committed
+            # Drop rows appended after the last committed window
+            with open(csv_file, "r+b") as f:
+                f.truncate(csv_bytes)
+            print(f"Resuming {symbol} {interval} after {skip_until}"
+                  + (f", retrying {len(retry_windows)} failed window(s)" if retry_windows else ""))
+    if skip_until is None and os.path.exists(csv_file):
+        os.remove(csv_file)
+
+    def commit(completed_until, failed_windows):
+        tmp_path = progress_file + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "start_date": start_date,
+                "interval": interval,
+                "completed_until": completed_until,
+                "csv_bytes": csv_bytes,
+                "failed_windows": failed_windows,
+            }, f)
+        os.replace(tmp_path, progress_file)
+
+    print(f"Downloading {interval} bars for {symbol} from {start_date} to {end_date}...")
+    total = 0
+    pending_retries = {tuple(w) for w in retry_windows}
+    failed = []
+    completed_until = skip_until
+    for window_start, window_end, df in iter_ohlcv_chunks(
+        symbol, start_date, end_date, interval=interval, source=source,
+        window_days=window_days, max_workers=max_workers, skip_until=skip_until,
+        extra_windows=retry_windows
+    ):
+        window = (window_start, window_end)
+        pending_retries.discard(window)
+        if df is None:
+            failed.append(list(window))
+        elif not df.empty:
+            with open(csv_file, "a", encoding="utf-8", newline="") as f:
+                df.to_csv(f, header=csv_bytes == 0, index=False)
+                f.flush()
+                os.fsync(f.fileno())
+            csv_bytes = os.path.getsize(csv_file)
+            total += len(df)
+
+        if completed_until is None or window_end > completed_until:
+            completed_until = window_end
+        # Retried windows not reached yet stay recorded as failed
+        commit(completed_until, failed + [list(w) for w in sorted(pending_retries)])
+        print(f"  {window_start} -> {window_end}: "
+              + ("failed, skipped" if df is None else f"{len(df)} records"))
+
+    if failed:
+        print(f"⚠ {len(failed)} window(s) failed and were skipped; run again to retry: "
+              + ", ".join(f"{s} -> {e}" for s, e in failed))
+    print(f"Downloaded {total} records, saved to {csv_file}")
+    return csv_file
+
+
 def get_all_listed_symbols(source: str = "VCI") -> pd.DataFrame:
     """
     Get list of all listed stock symbols.
@@ -161,41 +442,8 @@ if __name__ == "__main__":
     # print("Example 2: Download multiple stocks")
     # print("=" * 50)
     
-    # VN30 Index Components (30 stocks)
-    symbols = [
-        "ACB",   # Asia Commercial Bank
-        "BID",   # Bank for Investment and Development
-        "CTG",   # Vietnam Commercial Bank for Industry and Trade
-        "DGC",   # Ducgiang Chemicals
-        "FPT",   # FPT Corp
-        "GAS",   # Petrovietnam Gas
-        "GVR",   # Vietnam Rubber
-        "HDB",   # Ho Chi Minh City Development Bank
-        "HPG",   # Hoa Phat Group
-        "LPB",   # Fortune Vietnam Joint Stock Commercial Bank
-        "MBB",   # Military Commercial Bank
-        "MSN",   # Masan Group
-        "MWG",   # Mobile World Investment
-        "PLX",   # Vietnam National Petroleum
-        "SAB",   # Saigon Beer Alcohol Beverage
-        "SHB",   # Sai Gon Ha Noi Commercial Bank
-        "SSB",   # Southeast Asia Commercial Bank
-        "SSI",   # SSI Securities
-        "STB",   # Sai Gon Thuong Tin Commercial Bank
-        "TCB",   # Techcombank
-        "TPB",   # Tien Phong Commercial Bank
-        "VCB",   # JSC Bank for Foreign Trade of Vietnam
-        "VHM",   # Vinhomes
-        "VIB",   # Vietnam International Commercial Bank
-        "VIC",   # Vingroup
-        "VJC",   # Vietjet Aviation
-        "VNM",   # Vinamilk
-        "VPB",   # Vietnam Prosperity Bank
-        "VRE",   # Vincom Retail
-        "BCM",   # Investment and Industrial Development
-    ]
     results = download_multiple_stocks(
-        symbols=symbols,
+        symbols=VN30_SYMBOLS,
         start_date="2020-01-01",
         end_date="2025-12-15",
         output_dir="data/OLHCV"
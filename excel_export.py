@@ -0,0 +1,180 @@
+"""
+Consolidated Excel export of downloaded OHLCV data
+Runs after collection instead of inside the download loop. The CSVs written by
+download_ohlcv are streamed row by row into one workbook with a constant-memory
+writer (xlsxwriter's constant_memory mode, or openpyxl's write-only mode when
+xlsxwriter is not installed), so memory stays flat however many symbols are
+exported.
+
+Layouts:
+    sheets  one sheet per symbol
+    long    one 'ohlcv' sheet with a leading symbol column (continues on
+            'ohlcv_2', ... past Excel's row limit)
+
+Usage:
+    python excel_export.py                       # data/OLHCV -> data/OLHCV/ohlcv.xlsx
+    python excel_export.py --layout long --background
+
+Requirements:
+    pip install xlsxwriter   (or openpyxl)
+"""
+
+import argparse
+import csv
+import multiprocessing
+import os
+
+EXCEL_MAX_ROWS = 1048576
+
+
+def _number(value: str):
+    try:
+        return float(value) if value != "" else None
+    except ValueError:
+        return value
+
+
+class _XlsxWriterBook:
+    def __init__(self, path: str):
+        import xlsxwriter
+
+        self.book = xlsxwriter.Workbook(path, {"constant_memory": True})
+        self.sheet = None
+        self.row = 0
+
+    def add_sheet(self, name: str):
+        self.sheet = self.book.add_worksheet(name)
+        self.row = 0
+
+    def append(self, values: list):
+        self.sheet.write_row(self.row, 0, values)
+        self.row += 1
+
+    def close(self):
+        self.book.close()
+
+
+class _OpenpyxlBook:
+    def __init__(self, path: str):
+        from openpyxl import Workbook
+
+        self.path = path
+        self.book = Workbook(write_only=True)
+        self.sheet = None
+
+    def add_sheet(self, name: str):
+        self.sheet = self.book.create_sheet(name)
+
+    def append(self, values: list):
+        self.sheet.append(values)
+
+    def close(self):
+        self.book.save(self.path)
+
+
+def _open_book(path: str):
+    try:
+        return _XlsxWriterBook(path)
+    except ImportError:
+        return _OpenpyxlBook(path)
+
+
+def _iter_rows(csv_file: str):
+    """Yield (header, row) pairs of a CSV with numeric cells converted."""
+    with open(csv_file, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        for row in reader:
+            # First column is the timestamp, keep it as text
+            yield header, row[:1] + [_number(v) for v in row[1:]]
+
+
+def export_workbook(
+    symbols: list = None,
+    data_dir: str = "data/OLHCV",
+    output_path: str = "data/OLHCV/ohlcv.xlsx",
+    layout: str = "sheets"
+) -> str:
+    """
+    Write the OHLCV CSVs of `symbols` into one workbook.
+
+    Args:
+        symbols: Symbols to export (default: every CSV in data_dir)
+        data_dir: Directory written by download_ohlcv
+        output_path: Workbook to create
+        layout: 'sheets' (one sheet per symbol) or 'long' (single sheet)
+
+    Returns:
+        Path of the workbook
+    """
+    if layout not in ("sheets", "long"):
+        raise ValueError(f"Unknown layout {layout!r}, expected 'sheets' or 'long'")
+    if symbols is None:
+        symbols = sorted(f[:-4] for f in os.listdir(data_dir) if f.endswith(".csv"))
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    book = _open_book(output_path)
+    rows_in_sheet = 0
+    sheet_count = 0
+    exported = 0
+
+    try:
+        for symbol in symbols:
+            csv_file = os.path.join(data_dir, f"{symbol}.csv")
+            if not os.path.exists(csv_file):
+                print(f"No CSV for {symbol}, skipping")
+                continue
+
+            if layout == "sheets":
+                book.add_sheet(symbol[:31])
+                header_written = False
+                for header, row in _iter_rows(csv_file):
+                    if not header_written:
+                        book.append(header)
+                        header_written = True
+                    book.append(row)
+            else:
+                for header, row in _iter_rows(csv_file):
+                    if sheet_count == 0 or rows_in_sheet >= EXCEL_MAX_ROWS:
+                        sheet_count += 1
+                        book.add_sheet("ohlcv" if sheet_count == 1 else f"ohlcv_{sheet_count}")
+                        book.append(["symbol"] + header)
+                        rows_in_sheet = 1
+                    book.append([symbol] + row)
+                    rows_in_sheet += 1
+            exported += 1
+    finally:
+        book.close()
+
+    print(f"Exported {exported} symbols to {output_path}")
+    return output_path
+
+
+def export_in_background(**kwargs) -> multiprocessing.Process:
+    """Run export_workbook in a separate process; join() it to wait for the file."""
+    process = multiprocessing.Process(target=export_workbook, kwargs=kwargs, daemon=False)
+    process.start()
+    print(f"Excel export started in background (pid {process.pid})")
+    return process
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export OHLCV CSVs into one Excel workbook")
+    parser.add_argument("--symbols", nargs="+")
+    parser.add_argument("--data-dir", default="data/OLHCV")
+    parser.add_argument("--output", default="data/OLHCV/ohlcv.xlsx")
+    parser.add_argument("--layout", default="sheets", choices=["sheets", "long"])
+    parser.add_argument("--background", action="store_true")
+    args = parser.parse_args(argv)
+
+    kwargs = dict(symbols=args.symbols, data_dir=args.data_dir, output_path=args.output, layout=args.layout)
+    if args.background:
+        export_in_background(**kwargs)
+    else:
+        export_workbook(**kwargs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+"""
+Parsing and saving of Vietstock financial statement tables
+Shared by the live crawler (vn30_crawler) and the offline re-parser
+(reparse_finance), so a fix to the cleanup heuristics here regenerates
+data/finance from the raw HTML archive without a re-crawl.
+
+Every statement table the crawler sees is archived as
+    data/raw_html/{symbol}/p{page:02d}_{statement}.html.gz
+A crawl archives into a staging directory (begin_archive / archive_html) that
+replaces the symbol's directory once the crawl saved data (commit_archive), so
+pages left over from an older, longer crawl never survive next to new ones.
+
+Statements are grouped into datasets, each saved as a wide CSV and a long table:
+    finance     Income Statement + Balance Sheet   data/finance, data/finance_long
+    cash_flow   Cash Flow                          data/finance_cash_flow(_long)
+    ratios      Financial Ratios                   data/finance_ratios(_long)
+"""
+
+import gzip
+import io
+import itertools
+import os
+import re
+import shutil
+import unicodedata
+
+import pandas as pd
+
+from change_manifest import commit_if_changed, finance_partitions
+from finance_store import FINANCE_LONG_DIR, save_long, to_long
+
+ARCHIVE_DIR = "data/raw_html"
+STAGING_DIR = ".staging"
+FINANCE_DIR = "data/finance"
+
+# Statement display name -> archive slug, in the order tables are stacked per page
+STATEMENTS = {
+    "Income Statement": "income_statement",
+    "Balance Sheet": "balance_sheet",
+    "Cash Flow": "cash_flow",
+    "Financial Ratios": "ratios",
+}
+
+# Caption / header / first-row phrases identifying a table, matched as whole
+# words; the core statements are checked before Financial Ratios
+STATEMENT_KEYWORDS = [
+    ("Cash Flow", ("cash flow", "cash flows", "luu chuyen tien")),
+    ("Balance Sheet", ("balance sheet", "can doi ke toan", "current assets", "total assets")),
+    ("Income Statement", ("income statement", "ket qua kinh doanh", "net revenue", "gross profit")),
+    ("Financial Ratios", ("financial ratio", "financial ratios", "chi so tai chinh", "p/e", "bvps", "roea", "roaa")),
+]
+_KEYWORD_PATTERNS = [
+    (name, re.compile("|".join(r"(?<![a-z0-9])" + re.escape(k) + r"(?![a-z0-9])" for k in keywords)))
+    for name, keywords in STATEMENT_KEYWORDS
+]
+# Rows (including header rows) looked at by identify_statement
+IDENTIFY_ROWS = 6
+_ROW_END = re.compile(r"</tr\s*>", re.IGNORECASE)
+
+DATASETS = {
+    "finance": {
+        "statements": ["Income Statement", "Balance Sheet"],
+        "dir": FINANCE_DIR,
+        "long_dir": FINANCE_LONG_DIR,
+    },
+    "cash_flow": {
+        "statements": ["Cash Flow"],
+        "dir": "data/finance_cash_flow",
+        "long_dir": "data/finance_cash_flow_long",
+    },
+    "ratios": {
+        "statements": ["Financial Ratios"],
+        "dir": "data/finance_ratios",
+        "long_dir": "data/finance_ratios_long",
+    },
+}
+
+_QUARTER = re.compile(r"Q([1-4])/(\d{4})")
+
+
+def archive_path(symbol: str, page: int, name: str, archive_dir: str = ARCHIVE_DIR) -> str:
+    return os.path.join(archive_dir, symbol, f"p{page:02d}_{STATEMENTS[name]}.html.gz")
+
+
+def _staging_dir(archive_dir: str) -> str:
+    return os.path.join(archive_dir, STAGING_DIR)
+
+
+def begin_archive(symbol: str, archive_dir: str = ARCHIVE_DIR):
+    """Start a crawl's archive of `symbol` with an empty staging directory."""
+    shutil.rmtree(os.path.join(_staging_dir(archive_dir), symbol), ignore_errors=True)
+
+
+def archive_html(symbol: str, page: int, name: str, html: str, archive_dir: str = ARCHIVE_DIR) -> str:
+    """Store the outerHTML of one statement table in the staging area, gzip-compressed."""
+    path = archive_path(symbol, page, name, _staging_dir(archive_dir))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with gzip.open(path, "wt", encoding="utf-8", compresslevel=6) as f:
+        f.write(html)
+    return path
+
+
+def commit_archive(symbol: str, archive_dir: str = ARCHIVE_DIR, keep: bool = True):
+    """
+    Finish a crawl's archive: with `keep` the staged pages replace the
+    symbol's archive directory, otherwise they are discarded.
+    """
+    staged = os.path.join(_staging_dir(archive_dir), symbol)
+    if not keep or not os.path.isdir(staged):
+        shutil.rmtree(staged, ignore_errors=True)
+        return
+    final = os.path.join(archive_dir, symbol)
+    shutil.rmtree(final, ignore_errors=True)
+    os.replace(staged, final)
+
+
+def _expand_rows(rows) -> list:
+    """Cell texts of every row, with colspan and rowspan cells repeated."""
+    expanded = []
+    spans = {}      # column -> [text, rows still covered]
+    for row in rows:
+        cells = []
+        col = 0
+
+        def fill_spans():
+            nonlocal col
+            while col in spans:
+                text, remaining = spans[col]
+                cells.append(text)
+                if remaining == 1:
+                    del spans[col]
+                else:
+                    spans[col][1] = remaining - 1
+                col += 1
+
+        for cell in row:
+            if cell.tag not in ("td", "th"):
+                continue
+            fill_spans()
+            text = " ".join(cell.text_content().split())
+            rowspan = int(cell.get("rowspan", 1) or 1)
+            for _ in range(int(cell.get("colspan", 1) or 1)):
+                if rowspan > 1:
+                    spans[col] = [text, rowspan - 1]
+                cells.append(text)
+                col += 1
+        fill_spans()
+        expanded.append(cells)
+    return expanded
+
+
+def read_html_table(html: str) -> pd.DataFrame:
+    """
+    Parse a single <table> into a DataFrame.
+
+    Uses lxml directly instead of pd.read_html, expanding colspan and
+    rowspan cells, and converts numeric columns the way read_html does, with
+    ',' as thousands separator. Falls back to pd.read_html without lxml.
+    `python reparse_finance.py --check-parser` compares both parsers (values
+    and time) on the archived tables.
+    """
+    try:
+        from lxml import html as lxml_html
+    except ImportError:
+        return pd.read_html(io.StringIO(html))[0]
+
+    table = lxml_html.fromstring(html)
+    if table.tag != "table":
+        table = table.find(".//table")
+    rows = table.xpath("./thead/tr|./tbody/tr|./tr|./tfoot/tr")
+
+    # Like read_html, spans do not cross thead / tbody / tfoot boundaries
+    expanded = []
+    for _, section in itertools.groupby(rows, key=lambda r: r.getparent()):
+        expanded.extend(_expand_rows(list(section)))
+
+    header_rows = []
+    body = []
+    for row, cells in zip(rows, expanded):
+        if not cells:
+            continue
+        is_header = row.getparent().tag == "thead" or all(c.tag == "th" for c in row if c.tag in ("td", "th"))
+        if is_header and not body:
+            header_rows.append(cells)
+        else:
+            body.append(cells)
+
+    width = max([len(r) for r in header_rows + body] or [0])
+    if header_rows:
+        header_rows = [r + [""] * (width - len(r)) for r in header_rows]
+        if len(header_rows) == 1:
+            columns = header_rows[0]
+        else:
+            columns = [tuple(r[i] for r in header_rows) for i in range(width)]
+    else:
+        columns = list(range(width))
+    body = [r + [None] * (width - len(r)) for r in body]
+
+    df = pd.DataFrame(body, columns=columns)
+    for i in range(1, width):
+        text = df.iloc[:, i]
+        text = text.where(text != "", None)
+        converted = pd.to_numeric(text.str.replace(",", "", regex=False), errors="coerce")
+        # Like read_html: convert only if every non-empty cell is a number
+        if converted.notna().sum() == text.notna().sum():
+            df.isetitem(i, converted.astype("float64"))
+    return df
+
+
+def identify_statement(html: str):
+    """
+    Name of the statement in a table, from its caption, header and first rows.
+
+    Returns:
+        A key of STATEMENTS, or None if the table is not recognized
+    """
+    # Only the caption/thead and the first IDENTIFY_ROWS rows: deeper rows
+    # (e.g. notes mentioning other statements) must not decide the type
+    end = len(html)
+    for i, match in enumerate(_ROW_END.finditer(html)):
+        if i + 1 == IDENTIFY_ROWS:
+            end = match.end()
+            break
+    text = re.sub(r"<[^>]+>", " ", html[:end]).replace("\u0111", "d").replace("\u0110", "D")
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    text = " ".join(text.lower().split())
+    for name, pattern in _KEYWORD_PATTERNS:
+        if pattern.search(text):
+            return name
+    return None
+
+
+def clean_statement_columns(df: pd.DataFrame, name: str) -> pd.DataFrame:
+    """Rename quarter columns to 'Qn/YYYY' and the label column to 'Indicator'."""
+    new_columns = []
+    for col in df.columns:
+        col_str = str(col) if not isinstance(col, tuple) else '_'.join(map(str, col))
+        match = re.search(r"(Q[1-4]/\d{4})", col_str)
+        if match:
+            new_columns.append(match.group(1))
+        else:
+            if "Indicator" in col_str or name in col_str or "Net revenue" in col_str or "Current assets" in col_str or "Total assets" in col_str:
+                if col_str == df.columns[0] or "Indicator" in col_str:
+                    new_columns.append("Indicator")
+                else:
+                    new_columns.append(col_str)
+            else:
+                new_columns.append(col_str)
+
+    if "Indicator" not in new_columns and len(new_columns) > 0:
+         new_columns[0] = "Indicator"
+
+    df.columns = new_columns
+    return df
+
+
+def parse_statement_html(html: str, name: str) -> pd.DataFrame:
+    """Parse and clean one statement table."""
+    return clean_statement_columns(read_html_table(html), name)
+
+
+def combine_pages(page_frames: list):
+    """
+    Merge the per-page frames on Indicator and keep quarters from Q1/2020, sorted.
+
+    Returns:
+        Combined wide DataFrame, or None if there are no frames
+    """
+    if not page_frames:
+        return None
+
+    final_df = page_frames[0]
+    for df in page_frames[1:]:
+        try:
+            final_df = pd.merge(final_df, df, on='Indicator', how='outer')
+        except Exception as merge_error:
+            print(f"Error merging frames: {merge_error}")
+
+    # Sort Columns
+    cols = final_df.columns.tolist()
+    valid_quarter_cols = []
+    other_cols = []
+
+    for c in cols:
+        match = _QUARTER.search(str(c))
+        if match:
+            q = int(match.group(1))
+            y = int(match.group(2))
+            if y > 2020 or (y == 2020 and q >= 1):
+                valid_quarter_cols.append(c)
+        else:
+            other_cols.append(c)
+
+    def sort_key(col_name):
+        match = _QUARTER.search(col_name)
+        if match:
+            return int(match.group(2)), int(match.group(1))
+        return 0, 0
+
+    valid_quarter_cols.sort(key=sort_key)
+    return final_df[other_cols + valid_quarter_cols]
+
+
+def stack_statements(tables: dict, dataset: str):
+    """Stack the tables of one page that belong to `dataset`, or None if it has none."""
+    frames = [tables[name] for name in DATASETS[dataset]["statements"] if tables.get(name) is not None]
+    if not frames:
+        return None
+    return pd.concat(frames, ignore_index=True)
+
+
+def save_finance(symbol: str, final_df: pd.DataFrame, refresh_cube: bool = True, dataset: str = "finance") -> str:
+    """
+    Write the wide CSV and the typed long table of a symbol if anything changed.
+
+    Args:
+        symbol: Stock ticker symbol
+        final_df: Output of combine_pages()
+        refresh_cube: Update the symbol's slice of the indicator cube on change
+            (disable in worker processes and refresh the cube once afterwards)
+        dataset: Key of DATASETS; only 'finance' feeds the indicator cube
+
+    Returns:
+        Path of the wide CSV
+    """
+    data_dir = DATASETS[dataset]["dir"]
+    long_dir = DATASETS[dataset]["long_dir"]
+    os.makedirs(data_dir, exist_ok=True)
+    output_path = os.path.join(data_dir, f"{symbol}.csv")
+    long_path = os.path.join(long_dir, f"{symbol}.csv")
+
+    def write():
+        final_df.to_csv(output_path, index=False)
+        print(f"Saved data for {symbol} to {output_path}")
+
+        # Typed long table (numbers parsed once here)
+        long_df = to_long(final_df, symbol)
+        save_long(long_df, symbol, data_dir=long_dir)
+        print(f"Saved normalized data for {symbol} to {long_path}")
+        if refresh_cube and dataset == "finance":
+            from indicator_cube import update_cube
+            update_cube(symbol, long_df)
+
+    # Only rewrite (and refresh the cube) if some quarter actually changed
+    commit_if_changed(dataset, symbol, finance_partitions(final_df), write, [output_path, long_path])
+    return output_path
@@ -0,0 +1,185 @@
+"""
+Typed, compact storage for crawled financial statements
+Normalize the wide tables produced by crawl_stock_data (one object column per
+quarter, numbers as strings with thousand separators) into a long table:
+
+    symbol     category
+    indicator  category
+    quarter    period[Q-DEC]
+    value      float64
+
+Numbers are parsed once at ingest; the wide view is rebuilt on demand with
+to_wide().
+
+Usage:
+    from finance_store import to_long, to_wide, save_long, read_long
+"""
+
+import os
+import re
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+FINANCE_LONG_DIR = "data/finance_long"
+
+QUARTER_PATTERN = re.compile(r"Q([1-4])/(\d{4})")
+
+
+def parse_numbers(values: pd.Series) -> pd.Series:
+    """
+    Parse Vietstock-formatted numbers into float64.
+
+    Handles thousand separators ('1,234'), accounting negatives ('(1,234)')
+    and placeholders ('-', '', 'N/A') which become NaN.
+
+    Args:
+        values: Series of strings or numbers
+
+    Returns:
+        float64 Series aligned with the input
+    """
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype("float64")
+
+    s = values.astype("string").str.strip()
+    negative = (s.str.startswith("(") & s.str.endswith(")")).fillna(False).astype(bool)
+    s = s.str.strip("()").str.replace(",", "", regex=False)
+    parsed = pd.to_numeric(s, errors="coerce").astype("float64")
+    return parsed.where(~negative, -parsed)
+
+
+def quarter_to_period(label) -> pd.Period:
+    """Convert 'Q3/2024' (or a Period) into a quarterly Period."""
+    if isinstance(label, pd.Period):
+        return label
+    match = QUARTER_PATTERN.search(str(label))
+    if not match:
+        raise ValueError(f"Not a quarter label: {label!r}")
+    return pd.Period(year=int(match.group(2)), quarter=int(match.group(1)), freq="Q")
+
+
+def period_to_quarter(period: pd.Period) -> str:
+    """Convert a quarterly Period back into the crawler's 'Q3/2024' label."""
+    return f"Q{period.quarter}/{period.year}"
+
+
+def to_long(wide_df: pd.DataFrame, symbol: str) -> pd.DataFrame:
+    """
+    Normalize a wide statement table into the compact long layout.
+
+    Args:
+        wide_df: Frame with an 'Indicator' column and 'Qn/YYYY' columns
+        symbol: Stock ticker symbol
+
+    Returns:
+        Long DataFrame with symbol, indicator, quarter and value columns.
+        Empty cells are dropped. An indicator label that repeats in the table
+        (several "Other" lines, sub-totals) keeps every row: the second and
+        later occurrences are labelled "Other (2)", "Other (3)", ...
+    """
+    quarter_cols = [c for c in wide_df.columns if QUARTER_PATTERN.search(str(c))]
+    if "Indicator" not in wide_df.columns or not quarter_cols:
+        return _empty_long()
+
+    df = wide_df[["Indicator"] + quarter_cols].dropna(subset=["Indicator"]).copy()
+    df["Indicator"] = df["Indicator"].astype(str).str.strip()
+    df["Indicator"] = _number_repeats(df["Indicator"], symbol)
+
+    long_df = df.melt(id_vars="Indicator", var_name="quarter", value_name="value")
+    long_df["value"] = parse_numbers(long_df["value"])
+    long_df = long_df.dropna(subset=["value"])
+
+    quarters = {c: quarter_to_period(c) for c in quarter_cols}
+    result = pd.DataFrame({
+        "symbol": pd.Categorical([symbol] * len(long_df)),
+        "indicator": pd.Categorical(long_df["Indicator"], categories=df["Indicator"].tolist()),
+        "quarter": pd.PeriodIndex([quarters[q] for q in long_df["quarter"]], freq="Q"),
+        "value": long_df["value"].to_numpy(dtype="float64"),
+    })
+    return result.sort_values(["indicator", "quarter"], ignore_index=True)
+
+
+def _number_repeats(labels: pd.Series, symbol: str) -> pd.Series:
+    """Suffix repeated labels with their occurrence number and log them."""
+    occurrence = labels.groupby(labels, sort=False).cumcount() + 1
+    repeated = occurrence > 1
+    if not repeated.any():
+        return labels
+    counts = labels[repeated].value_counts(sort=False)
+    print(f"Warning: finance {symbol}: {int(repeated.sum())} repeated indicator row(s) kept as numbered "
+          f"labels: " + ", ".join(f"{label!r} x{n + 1}" for label, n in counts.items()))
+    return labels.where(~repeated, labels + " (" + occurrence.astype(str) + ")")
+
+
+def to_wide(long_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Build the wide indicator x quarter view from a single-symbol long table.
+
+    Args:
+        long_df: Output of to_long() / read_long()
+
+    Returns:
+        DataFrame indexed by indicator (crawl order) with chronologically
+        sorted 'Qn/YYYY' float64 columns
+    """
+    if long_df.empty:
+        return pd.DataFrame(index=pd.Index([], name="Indicator"))
+
+    wide = long_df.pivot_table(
+        index="indicator", columns="quarter", values="value",
+        aggfunc="first", observed=True, sort=True
+    )
+    wide = wide.sort_index(axis=1)
+    wide.columns = [period_to_quarter(p) for p in wide.columns]
+    wide.index = wide.index.astype(str)
+    wide.index.name = "Indicator"
+    return wide
+
+
+def concat_long(frames: list) -> pd.DataFrame:
+    """Concatenate long tables of several symbols, keeping categorical dtypes."""
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return _empty_long()
+    symbols = union_categoricals([f["symbol"] for f in frames])
+    indicators = union_categoricals([f["indicator"] for f in frames])
+    df = pd.concat(frames, ignore_index=True)
+    df["symbol"] = pd.Categorical(df["symbol"], categories=symbols.categories)
+    df["indicator"] = pd.Categorical(df["indicator"], categories=indicators.categories)
+    return df
+
+
+def save_long(long_df: pd.DataFrame, symbol: str, data_dir: str = FINANCE_LONG_DIR) -> str:
+    """
+    Write a long table to `{data_dir}/{symbol}.csv`.
+
+    Returns:
+        Path of the written file
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    output_path = os.path.join(data_dir, f"{symbol}.csv")
+    out = long_df.copy()
+    out["quarter"] = out["quarter"].astype(str)
+    out.to_csv(output_path, index=False)
+    return output_path
+
+
+def read_long(path: str) -> pd.DataFrame:
+    """Read a file written by save_long() back into the typed layout."""
+    df = pd.read_csv(path, dtype={"symbol": str, "indicator": str, "quarter": str, "value": "float64"})
+    if df.empty:
+        return _empty_long()
+    df["symbol"] = df["symbol"].astype("category")
+    df["indicator"] = pd.Categorical(df["indicator"], categories=pd.unique(df["indicator"]))
+    df["quarter"] = pd.PeriodIndex(df["quarter"], freq="Q")
+    return df
+
+
+def _empty_long() -> pd.DataFrame:
+    return pd.DataFrame({
+        "symbol": pd.Categorical([]),
+        "indicator": pd.Categorical([]),
+        "quarter": pd.PeriodIndex([], freq="Q"),
+        "value": pd.Series([], dtype="float64"),
+    })
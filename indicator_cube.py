@@ -0,0 +1,415 @@
+"""
+Cross-sectional indicator cube over all crawled financial statements
+Every symbol's statement uses its own labels and row order ("3. Net revenue",
+"Net revenue", "Net Revenue ..."). This module builds a canonical indicator
+dictionary from the crawled labels and keeps a dense
+symbol x indicator x quarter array with a hash index on every axis, so
+
+    cube.cross_section("Net revenue", "Q2/2024")   # all symbols, one quarter
+    cube.time_series("VNM", "Net revenue")         # one symbol, all quarters
+
+are direct array lookups. Re-crawling one symbol only rewrites that symbol's
+slice (see update_symbol / refresh).
+
+The cube files are read and replaced under a lock file (data/cube/.lock), and
+every file is written to a temporary name first, so crawler processes updating
+the cube at the same time never lose each other's slices or leave it torn.
+Labels of one symbol that normalize to the same canonical key (and so would
+overwrite each other) are reported, and only the first of them is kept.
+
+Usage:
+    python indicator_cube.py          # build / refresh data/cube from data/finance_long
+"""
+
+import json
+import os
+import re
+import unicodedata
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from finance_store import FINANCE_LONG_DIR, period_to_quarter, quarter_to_period, read_long
+
+CUBE_DIR = "data/cube"
+
+_NUMBERING = re.compile(r"^\s*(?:[IVXLC]+|\d+(?:\.\d+)*|[a-z])\s*[\.\)\-:]\s*", re.IGNORECASE)
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+@contextmanager
+def cube_lock(cube_dir: str = CUBE_DIR):
+    """Hold the exclusive lock of the cube files (blocks until it is free)."""
+    os.makedirs(cube_dir, exist_ok=True)
+    with open(os.path.join(cube_dir, ".lock"), "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+
+            f.seek(0)
+            # LK_LOCK gives up after 10 s, so keep trying
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _replace_json(path: str, data: dict, **kwargs):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, **kwargs)
+    os.replace(tmp_path, path)
+
+
+def canonical_key(label: str) -> str:
+    """
+    Normalize an indicator label into a canonical key.
+
+    Strips list numbering ('3.', 'II.', 'a)'), diacritics, case and punctuation:
+    '3. Net revenue' and 'Net Revenue' both map to 'net revenue'.
+    """
+    text = str(label).strip()
+    # Numbering can be nested ("I. 1. Cash")
+    previous = None
+    while previous != text:
+        previous = text
+        text = _NUMBERING.sub("", text)
+    text = text.replace("đ", "d").replace("Đ", "D")
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+
+class IndicatorDictionary:
+    """Canonical indicator ids learned from the labels seen in crawled files."""
+
+    def __init__(self):
+        self.keys = []
+        self.labels = []
+        self.aliases = []
+        self._ids = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, label: str) -> int:
+        """Return the id of `label`, registering its canonical key if new."""
+        label = str(label).strip()
+        key = canonical_key(label)
+        idx = self._ids.get(key)
+        if idx is None:
+            idx = len(self.keys)
+            self._ids[key] = idx
+            self.keys.append(key)
+            self.labels.append(label)
+            self.aliases.append([])
+        elif label != self.labels[idx] and label not in self.aliases[idx]:
+            self.aliases[idx].append(label)
+        return idx
+
+    def lookup(self, label: str) -> int:
+        """Return the id of `label` (any alias or the canonical key itself)."""
+        idx = self._ids.get(canonical_key(label))
+        if idx is None:
+            raise KeyError(f"Unknown indicator: {label!r}")
+        return idx
+
+    def to_dict(self) -> dict:
+        return {
+            "indicators": [
+                {"key": k, "label": lbl, "aliases": a}
+                for k, lbl, a in zip(self.keys, self.labels, self.aliases)
+            ]
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "IndicatorDictionary":
+        d = cls()
+        for entry in data.get("indicators", []):
+            d._ids[entry["key"]] = len(d.keys)
+            d.keys.append(entry["key"])
+            d.labels.append(entry["label"])
+            d.aliases.append(list(entry.get("aliases", [])))
+        return d
+
+
+class _Axis:
+    """Append-only list of labels with an O(1) label -> position index."""
+
+    def __init__(self, labels=None):
+        self.labels = []
+        self.index = {}
+        for label in labels or []:
+            self.add(label)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def add(self, label) -> int:
+        pos = self.index.get(label)
+        if pos is None:
+            pos = len(self.labels)
+            self.index[label] = pos
+            self.labels.append(label)
+        return pos
+
+
+class IndicatorCube:
+    """Dense symbol x indicator x quarter array of statement values."""
+
+    def __init__(self, cube_dir: str = CUBE_DIR):
+        self.cube_dir = cube_dir
+        self.indicators = IndicatorDictionary()
+        self.symbols = _Axis()
+        self.quarters = _Axis()
+        self.sources = {}
+        self.collisions = {}
+        self._data = np.full((8, 64, 16), np.nan)
+        self._quarter_order = np.empty(0, dtype=np.intp)
+
+    # ------------------------------------------------------------------
+    # Construction / updates
+    # ------------------------------------------------------------------
+    def _ensure_capacity(self):
+        shape = self._data.shape
+        needed = (len(self.symbols), len(self.indicators), len(self.quarters))
+        if all(n <= s for n, s in zip(needed, shape)):
+            return
+        # Grow geometrically so repeated appends stay amortized O(1)
+        new_shape = tuple(max(s, 2 * n) if n > s else s for n, s in zip(needed, shape))
+        grown = np.full(new_shape, np.nan)
+        grown[:shape[0], :shape[1], :shape[2]] = self._data
+        self._data = grown
+
+    def _refresh_quarter_order(self):
+        self._quarter_order = np.array(
+            sorted(range(len(self.quarters)), key=lambda i: self.quarters.labels[i]),
+            dtype=np.intp
+        )
+
+    def update_symbol(self, symbol: str, long_df: pd.DataFrame):
+        """
+        Replace the slice of `symbol` with the values of its long table.
+
+        Rows that land on the same indicator and quarter (different labels
+        with one canonical key) are reported and recorded in `collisions`;
+        the first of them is kept.
+
+        Args:
+            symbol: Stock ticker symbol
+            long_df: Typed long table from finance_store.to_long / read_long
+        """
+        s = self.symbols.add(symbol)
+        n_quarters = len(self.quarters)
+
+        labels = long_df["indicator"].astype(str).to_numpy()
+        label_ids = {label: self.indicators.add(label) for label in pd.unique(labels)}
+        ind_idx = np.fromiter((label_ids[label] for label in labels), dtype=np.intp, count=len(labels))
+
+        periods = long_df["quarter"]
+        q_ids = {p: self.quarters.add(p) for p in pd.unique(periods)}
+        q_idx = np.fromiter((q_ids[p] for p in periods), dtype=np.intp, count=len(periods))
+
+        self._ensure_capacity()
+        if len(self.quarters) != n_quarters:
+            self._refresh_quarter_order()
+
+        values = long_df["value"].to_numpy(dtype="float64")
+        cells = pd.DataFrame({"indicator": ind_idx, "quarter": q_idx})
+        duplicate = cells.duplicated(keep="first").to_numpy()
+        self.collisions.pop(symbol, None)
+        if duplicate.any():
+            collided = {}
+            for i in pd.unique(ind_idx[duplicate]):
+                collided[self.indicators.keys[i]] = sorted(set(labels[ind_idx == i]))
+            self.collisions[symbol] = collided
+            print(f"Warning: {symbol} has {len(collided)} indicator(s) whose labels collide "
+                  f"on one canonical key, keeping the first row of each:")
+            for key, key_labels in collided.items():
+                print(f"  {key!r}: {key_labels}")
+            ind_idx, q_idx, values = ind_idx[~duplicate], q_idx[~duplicate], values[~duplicate]
+
+        self._data[s] = np.nan
+        self._data[s, ind_idx, q_idx] = values
+
+    def refresh(self, long_dir: str = FINANCE_LONG_DIR) -> list:
+        """
+        Re-ingest only the long tables whose file changed since the last refresh.
+
+        Returns:
+            List of symbols that were updated
+        """
+        updated = []
+        if not os.path.isdir(long_dir):
+            return updated
+        for filename in sorted(os.listdir(long_dir)):
+            if not filename.endswith(".csv"):
+                continue
+            symbol = filename[:-4]
+            path = os.path.join(long_dir, filename)
+            stat = os.stat(path)
+            signature = [stat.st_mtime_ns, stat.st_size]
+            if self.sources.get(symbol) == signature:
+                continue
+            self.update_symbol(symbol, read_long(path))
+            self.sources[symbol] = signature
+            updated.append(symbol)
+        return updated
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+    def _symbol_pos(self, symbol: str) -> int:
+        pos = self.symbols.index.get(symbol)
+        if pos is None:
+            raise KeyError(f"Unknown symbol: {symbol!r}")
+        return pos
+
+    def _quarter_pos(self, quarter) -> int:
+        pos = self.quarters.index.get(quarter_to_period(quarter))
+        if pos is None:
+            raise KeyError(f"Unknown quarter: {quarter!r}")
+        return pos
+
+    def value(self, symbol: str, indicator: str, quarter) -> float:
+        """Single value; NaN if the symbol did not report it."""
+        return float(self._data[
+            self._symbol_pos(symbol),
+            self.indicators.lookup(indicator),
+            self._quarter_pos(quarter)
+        ])
+
+    def cross_section(self, indicator: str, quarter) -> pd.Series:
+        """Values of one indicator for every symbol in one quarter."""
+        i = self.indicators.lookup(indicator)
+        q = self._quarter_pos(quarter)
+        n = len(self.symbols)
+        return pd.Series(self._data[:n, i, q], index=pd.Index(self.symbols.labels, name="symbol"),
+                         name=self.indicators.labels[i])
+
+    def time_series(self, symbol: str, indicator: str) -> pd.Series:
+        """Values of one indicator for one symbol, in chronological order."""
+        s = self._symbol_pos(symbol)
+        i = self.indicators.lookup(indicator)
+        order = self._quarter_order
+        return pd.Series(self._data[s, i, order], index=self._quarter_index(order),
+                         name=self.indicators.labels[i])
+
+    def panel(self, indicator: str) -> pd.DataFrame:
+        """Symbol x quarter frame of one indicator."""
+        i = self.indicators.lookup(indicator)
+        order = self._quarter_order
+        n = len(self.symbols)
+        return pd.DataFrame(self._data[:n, i, :][:, order],
+                            index=pd.Index(self.symbols.labels, name="symbol"),
+                            columns=self._quarter_index(order))
+
+    def _quarter_index(self, order) -> pd.Index:
+        return pd.Index([period_to_quarter(self.quarters.labels[q]) for q in order], name="quarter")
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+    def save(self):
+        with cube_lock(self.cube_dir):
+            self._write()
+
+    def _write(self):
+        os.makedirs(self.cube_dir, exist_ok=True)
+        shape = (len(self.symbols), len(self.indicators), len(self.quarters))
+        values_path = os.path.join(self.cube_dir, "values.npy")
+        # np.save would append .npy to a name not ending in it
+        tmp_values = os.path.join(self.cube_dir, "values.tmp.npy")
+        np.save(tmp_values, self._data[:shape[0], :shape[1], :shape[2]])
+        os.replace(tmp_values, values_path)
+        _replace_json(os.path.join(self.cube_dir, "indicators.json"), self.indicators.to_dict(),
+                      ensure_ascii=False, indent=1)
+        _replace_json(os.path.join(self.cube_dir, "axes.json"), {
+            "symbols": self.symbols.labels,
+            "quarters": [str(p) for p in self.quarters.labels],
+            "sources": self.sources,
+            "collisions": self.collisions,
+        }, indent=1)
+
+    @classmethod
+    def load(cls, cube_dir: str = CUBE_DIR) -> "IndicatorCube":
+        """Load a saved cube, or return an empty one if none exists yet."""
+        with cube_lock(cube_dir):
+            return cls._read(cube_dir)
+
+    @classmethod
+    def _read(cls, cube_dir: str) -> "IndicatorCube":
+        cube = cls(cube_dir)
+        values_path = os.path.join(cube_dir, "values.npy")
+        if not os.path.exists(values_path):
+            return cube
+
+        with open(os.path.join(cube_dir, "indicators.json"), encoding="utf-8") as f:
+            cube.indicators = IndicatorDictionary.from_dict(json.load(f))
+        with open(os.path.join(cube_dir, "axes.json"), encoding="utf-8") as f:
+            axes = json.load(f)
+        cube.symbols = _Axis(axes["symbols"])
+        cube.quarters = _Axis([pd.Period(q, freq="Q") for q in axes["quarters"]])
+        cube.sources = axes.get("sources", {})
+        cube.collisions = axes.get("collisions", {})
+
+        values = np.load(values_path)
+        cube._ensure_capacity()
+        cube._data[:values.shape[0], :values.shape[1], :values.shape[2]] = values
+        cube._refresh_quarter_order()
+        return cube
+
+
+def update_cube(
+    symbol: str,
+    long_df: pd.DataFrame,
+    cube_dir: str = CUBE_DIR,
+    long_dir: str = FINANCE_LONG_DIR
+):
+    """Replace one symbol's slice of the saved cube (load, update, save under the lock)."""
+    with cube_lock(cube_dir):
+        cube = IndicatorCube._read(cube_dir)
+        cube.update_symbol(symbol, long_df)
+        # Remember which file version this slice came from so refresh() skips it
+        path = os.path.join(long_dir, f"{symbol}.csv")
+        if os.path.exists(path):
+            stat = os.stat(path)
+            cube.sources[symbol] = [stat.st_mtime_ns, stat.st_size]
+        else:
+            cube.sources.pop(symbol, None)
+        cube._write()
+    return cube
+
+
+def refresh_cube(cube_dir: str = CUBE_DIR, long_dir: str = FINANCE_LONG_DIR):
+    """
+    Re-ingest the changed long tables into the saved cube under the lock.
+
+    Returns:
+        (cube, list of updated symbols)
+    """
+    with cube_lock(cube_dir):
+        cube = IndicatorCube._read(cube_dir)
+        updated = cube.refresh(long_dir)
+        cube._write()
+    return cube, updated
+
+
+if __name__ == "__main__":
+    cube, updated = refresh_cube()
+    print(f"Updated {len(updated)} symbols: {', '.join(updated) if updated else '-'}")
+    print(f"Cube: {len(cube.symbols)} symbols x {len(cube.indicators)} indicators x {len(cube.quarters)} quarters")
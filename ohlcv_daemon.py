@@ -0,0 +1,306 @@
+"""
+Trading-hours OHLCV daemon with a live in-memory cache
+Refreshes the latest intraday bars for a universe of symbols during HOSE
+sessions, keeps them in a fixed-size ring buffer per symbol and serves them to
+local consumers over HTTP on 127.0.0.1. Bars are written to disk only once,
+after the afternoon session closes, to data/OLHCV/live/{symbol}_{interval}.csv
+(separate from download_intraday's resumable files). Persisting merges with
+the existing file by timestamp, so repeated persists never duplicate bars.
+
+HOSE sessions (Asia/Ho_Chi_Minh, Monday-Friday):
+    morning     09:00 - 11:30
+    afternoon   13:00 - 14:45
+
+Endpoints:
+    GET /symbols                 -> ["ACB", ...]
+    GET /latest/<SYMBOL>         -> last bar
+    GET /bars/<SYMBOL>?n=100     -> last n bars (oldest first)
+
+Usage:
+    python ohlcv_daemon.py
+    python ohlcv_daemon.py --symbols ACB FPT --interval 1m --port 8765
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time as dtime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+# Vietnam has no daylight saving time
+VN_TZ = timezone(timedelta(hours=7))
+SESSIONS = [(dtime(9, 0), dtime(11, 30)), (dtime(13, 0), dtime(14, 45))]
+FIELDS = ["open", "high", "low", "close", "volume"]
+
+
+class RingBuffer:
+    """Fixed-capacity bar buffer: appends are O(1) and never reallocate."""
+
+    def __init__(self, capacity: int = 2000):
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype="datetime64[ns]")
+        self.values = np.zeros((capacity, len(FIELDS)), dtype="float64")
+        self.start = 0
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def _pos(self, i: int) -> int:
+        return (self.start + i) % self.capacity
+
+    def last_time(self):
+        if self.size == 0:
+            return None
+        return self.times[self._pos(self.size - 1)]
+
+    def extend(self, times: np.ndarray, values: np.ndarray) -> int:
+        """
+        Add bars in time order. A bar with the same timestamp as the newest one
+        replaces it (the current bar is still forming); older bars are ignored.
+
+        Returns:
+            Number of bars appended or updated
+        """
+        changed = 0
+        with self.lock:
+            for t, row in zip(times, values):
+                last = self.last_time()
+                if last is not None and t < last:
+                    continue
+                if last is not None and t == last:
+                    self.values[self._pos(self.size - 1)] = row
+                elif self.size < self.capacity:
+                    pos = self._pos(self.size)
+                    self.times[pos] = t
+                    self.values[pos] = row
+                    self.size += 1
+                else:
+                    # Full: overwrite the oldest bar
+                    self.times[self.start] = t
+                    self.values[self.start] = row
+                    self.start = (self.start + 1) % self.capacity
+                changed += 1
+        return changed
+
+    def tail(self, n: int = None) -> tuple:
+        """Copy of the last n bars (all if n is None), oldest first."""
+        with self.lock:
+            n = self.size if n is None else min(n, self.size)
+            idx = [(self.start + self.size - n + i) % self.capacity for i in range(n)]
+            return self.times[idx].copy(), self.values[idx].copy()
+
+    def clear(self):
+        with self.lock:
+            self.start = 0
+            self.size = 0
+
+
+def bars_to_records(times: np.ndarray, values: np.ndarray) -> list:
+    return [
+        {"time": str(pd.Timestamp(t)), **dict(zip(FIELDS, row.tolist()))}
+        for t, row in zip(times, values)
+    ]
+
+
+def in_session(now: datetime) -> bool:
+    if now.weekday() >= 5:
+        return False
+    current = now.time()
+    return any(start <= current <= end for start, end in SESSIONS)
+
+
+def seconds_until_next_session(now: datetime) -> float:
+    day = now
+    for _ in range(8):
+        if day.weekday() < 5:
+            for start, _ in SESSIONS:
+                candidate = datetime.combine(day.date(), start, tzinfo=VN_TZ)
+                if candidate > now:
+                    return (candidate - now).total_seconds()
+        day = datetime.combine(day.date() + timedelta(days=1), dtime(0, 0), tzinfo=VN_TZ)
+    return 3600.0
+
+
+class OHLCVDaemon:
+    """Polls vnstock during trading hours and keeps the bars in memory."""
+
+    def __init__(
+        self,
+        symbols: list,
+        interval: str = "1m",
+        source: str = "VCI",
+        refresh_seconds: float = 60,
+        max_workers: int = 4,
+        capacity: int = 2000,
+        output_dir: str = "data/OLHCV/live"
+    ):
+        self.symbols = list(symbols)
+        self.interval = interval
+        self.source = source
+        self.refresh_seconds = refresh_seconds
+        self.max_workers = max_workers
+        self.output_dir = output_dir
+        self.buffers = {symbol: RingBuffer(capacity) for symbol in self.symbols}
+        self.session_date = None
+        self.persisted_date = None
+        self.stopped = threading.Event()
+
+    def _fetch(self, symbol: str, day: str) -> pd.DataFrame:
+        from vnstock import Quote
+        from rate_limiter import SOURCE_HOSTS, get_limiter
+
+        quote = Quote(symbol=symbol, source=self.source)
+        with get_limiter().request(SOURCE_HOSTS.get(self.source, self.source)):
+            df = quote.history(start=day, end=day, interval=self.interval)
+        return df if df is not None else pd.DataFrame()
+
+    def refresh(self, now: datetime):
+        """Fetch today's bars for every symbol and merge them into the buffers."""
+        day = now.strftime("%Y-%m-%d")
+        if self.session_date != day:
+            # New trading day: start from empty buffers
+            for buffer in self.buffers.values():
+                buffer.clear()
+            self.session_date = day
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {symbol: pool.submit(self._fetch, symbol, day) for symbol in self.symbols}
+            for symbol, future in futures.items():
+                try:
+                    df = future.result()
+                except Exception as e:
+                    print(f"✗ Refresh failed for {symbol}: {e}")
+                    continue
+                if df.empty:
+                    continue
+                df = df.sort_values("time")
+                times = pd.to_datetime(df["time"]).to_numpy(dtype="datetime64[ns]")
+                self.buffers[symbol].extend(times, df[FIELDS].to_numpy(dtype="float64"))
+
+    def persist(self):
+        """Merge the session's bars into '{output_dir}/{symbol}_{interval}.csv' by time."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        for symbol, buffer in self.buffers.items():
+            times, values = buffer.tail()
+            if len(times) == 0:
+                continue
+            df = pd.DataFrame(values, columns=FIELDS)
+            df.insert(0, "time", pd.to_datetime(times))
+            csv_file = os.path.join(self.output_dir, f"{symbol}_{self.interval}.csv")
+            if os.path.exists(csv_file):
+                existing = pd.read_csv(csv_file, parse_dates=["time"])
+                df = pd.concat([existing, df], ignore_index=True)
+            # Latest value of a bar wins; rewrite atomically
+            df = df.drop_duplicates(subset="time", keep="last").sort_values("time")
+            tmp_file = csv_file + ".tmp"
+            df.to_csv(tmp_file, index=False)
+            os.replace(tmp_file, csv_file)
+        print(f"Persisted session {self.session_date} to {self.output_dir}")
+        self.persisted_date = self.session_date
+
+    def run(self):
+        """Main loop: refresh during sessions, persist once after the close."""
+        print(f"OHLCV daemon started for {len(self.symbols)} symbols ({self.interval})")
+        while not self.stopped.is_set():
+            now = datetime.now(VN_TZ)
+            if in_session(now):
+                start = time.monotonic()
+                self.refresh(now)
+                elapsed = time.monotonic() - start
+                self.stopped.wait(max(0.0, self.refresh_seconds - elapsed))
+                continue
+
+            after_close = now.weekday() < 5 and now.time() > SESSIONS[-1][1]
+            if after_close and self.session_date and self.persisted_date != self.session_date:
+                # One last pull to capture the closing auction bar
+                self.refresh(now)
+                self.persist()
+
+            # Sleep towards the next session, waking up regularly to stay responsive
+            self.stopped.wait(min(seconds_until_next_session(now), 300))
+
+        if self.session_date and self.persisted_date != self.session_date:
+            self.persist()
+
+
+def make_handler(daemon: OHLCVDaemon):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code: int, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = [p for p in url.path.split("/") if p]
+            if parts == ["symbols"]:
+                return self._send(200, daemon.symbols)
+            if len(parts) == 2 and parts[0] in ("latest", "bars"):
+                buffer = daemon.buffers.get(parts[1].upper())
+                if buffer is None:
+                    return self._send(404, {"error": f"Unknown symbol {parts[1]}"})
+                if parts[0] == "latest":
+                    records = bars_to_records(*buffer.tail(1))
+                    return self._send(200, records[0] if records else None)
+                n = int(parse_qs(url.query).get("n", ["100"])[0])
+                return self._send(200, bars_to_records(*buffer.tail(n)))
+            return self._send(404, {"error": "Not found"})
+
+        def log_message(self, format, *args):
+            # Keep the console for refresh logs
+            pass
+
+    return Handler
+
+
+def serve(daemon: OHLCVDaemon, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    """Start the local HTTP API in a background thread."""
+    server = ThreadingHTTPServer((host, port), make_handler(daemon))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving live bars on http://{host}:{port}")
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Trading-hours OHLCV daemon")
+    parser.add_argument("--symbols", nargs="+", help="Symbols to track (default: VN30)")
+    parser.add_argument("--interval", default="1m")
+    parser.add_argument("--source", default="VCI", choices=["VCI", "TCBS"])
+    parser.add_argument("--refresh-seconds", type=float, default=60)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args(argv)
+
+    if args.symbols:
+        symbols = args.symbols
+    else:
+        from download_ohlcv import VN30_SYMBOLS
+        symbols = VN30_SYMBOLS
+
+    daemon = OHLCVDaemon(
+        symbols, interval=args.interval, source=args.source,
+        refresh_seconds=args.refresh_seconds, max_workers=args.workers
+    )
+    server = serve(daemon, port=args.port)
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        print("Stopping daemon...")
+        daemon.stopped.set()
+        if daemon.session_date and daemon.persisted_date != daemon.session_date:
+            daemon.persist()
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+Corporate-action back-adjustment of OHLCV prices
+Derives split and stock-dividend factors from the shares-outstanding events
+collected by cophieu68_selenium and back-adjusts the raw vnstock bars:
+
+    factor(t) = product of 1 / ratio over every event with ex-date after t
+    price_adjusted = price * factor      volume_adjusted = volume / factor
+
+An increase in shares outstanding only becomes an event when the price
+confirms it: the listing date ('Ngay bo sung') trails the ex-date by weeks,
+so the preceding LOOKBACK_DAYS are searched for an overnight gap
+(previous close / open) matching the share ratio. Increases without such a
+gap (rights issues, ESOP, placements, or prices that are already adjusted)
+are kept in the factor file as unconfirmed and not applied.
+
+A gap that ordinary trading can produce proves nothing: when the price move
+implied by a ratio (1 - 1/ratio, within GAP_TOLERANCE) fits inside the daily
+limit band (DAILY_LIMIT_BAND, HOSE +-7%), the event is never auto-confirmed.
+It is logged and left unconfirmed for manual review, so small ESOP or
+placement increases cannot back-adjust the whole history.
+
+Factors are stored per symbol in data/adjustments/{symbol}.json. When a new
+event appears only the history before its ex-date is rescaled, and new bars
+are appended unadjusted; a changed or removed event rebuilds the symbol.
+
+Usage:
+    python price_adjust.py                      # every symbol with prices and shares
+    python price_adjust.py --symbols ACB FPT --full
+
+    from data_api import load_prices
+    df = load_prices("ACB", data_dir="data/OLHCV_adjusted")
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from change_manifest import commit_if_changed, ohlcv_partitions
+from data_api import OHLCV_DIR, SHARES_DIR, load_prices, load_shares
+
+ADJUSTMENTS_DIR = "data/adjustments"
+ADJUSTED_DIR = "data/OLHCV_adjusted"
+PRICE_FIELDS = ["open", "high", "low", "close"]
+
+MIN_RATIO = 1.02             # smaller share increases are never splits/dividends
+LOOKBACK_DAYS = 90           # how far before the listing date the ex-date may be
+GAP_TOLERANCE = 0.02         # allowed relative mismatch between gap and ratio
+DAILY_LIMIT_BAND = 0.07      # HOSE daily price limit (HNX 0.10, UPCOM 0.15)
+
+
+def _event_key(event: dict) -> tuple:
+    return event["ex_date"], round(event["ratio"], 6)
+
+
+def detect_events(prices: pd.DataFrame, shares: pd.DataFrame, limit_band: float = DAILY_LIMIT_BAND) -> list:
+    """
+    Match share-count increases with price gaps.
+
+    Args:
+        prices: Raw bars indexed by date (load_prices of one symbol)
+        shares: Shares outstanding indexed by date (load_shares)
+        limit_band: Daily price limit of the exchange; ratios whose gap fits
+            inside it are left unconfirmed
+
+    Returns:
+        List of {'listed', 'ex_date', 'ratio', 'gap', 'confirmed', 'reason'}
+        dicts, oldest first ('reason' explains an unconfirmed event)
+    """
+    # Smallest ratio whose gap (even at the tolerance edge) an ordinary day can't produce
+    min_confirmable = 1 / ((1 - limit_band) * (1 - GAP_TOLERANCE))
+    if prices.empty or len(shares) < 2:
+        return []
+
+    dates = prices.index.normalize()
+    gaps = (prices["close"].shift(1) / prices["open"]).to_numpy()
+    ratios = shares["shares"] / shares["shares"].shift(1)
+
+    events = []
+    for listed, ratio in ratios.items():
+        if not ratio >= MIN_RATIO:
+            continue
+        window = (dates > listed - pd.Timedelta(days=LOOKBACK_DAYS)) & (dates <= listed)
+        candidates = np.flatnonzero(window & ~np.isnan(gaps))
+        event = {"listed": listed.strftime("%Y-%m-%d"), "ex_date": None,
+                 "ratio": float(ratio), "gap": None, "confirmed": False, "reason": None}
+        if ratio < min_confirmable:
+            event["reason"] = f"implied price move within the {limit_band:.0%} daily limit band"
+            print(f"Unconfirmed share increase x{ratio:.4f} listed {event['listed']}: "
+                  f"{event['reason']}, not adjusted (review manually)")
+            events.append(event)
+            continue
+        event["reason"] = "no matching price gap"
+        if len(candidates):
+            errors = np.abs(np.log(gaps[candidates]) - np.log(ratio))
+            best = candidates[np.argmin(errors)]
+            event["gap"] = float(gaps[best])
+            if abs(gaps[best] / ratio - 1) <= GAP_TOLERANCE:
+                event["ex_date"] = dates[best].strftime("%Y-%m-%d")
+                event["confirmed"] = True
+                event["reason"] = None
+        events.append(event)
+    return events
+
+
+def adjustment_factors(dates: pd.DatetimeIndex, events: list) -> np.ndarray:
+    """Cumulative back-adjustment factor of every date, in one vectorized pass."""
+    applied = sorted((pd.Timestamp(e["ex_date"]), e["ratio"]) for e in events if e["confirmed"])
+    if not applied:
+        return np.ones(len(dates))
+    ex_dates = np.array([d for d, _ in applied], dtype="datetime64[ns]")
+    inverse = np.array([1 / r for _, r in applied])
+    # suffix[k] = product of 1/ratio over events k.. ; suffix[len] = 1
+    suffix = np.append(np.cumprod(inverse[::-1])[::-1], 1.0)
+    return suffix[np.searchsorted(ex_dates, dates.to_numpy(dtype="datetime64[ns]"), side="right")]
+
+
+def _apply(df: pd.DataFrame, factors: np.ndarray) -> pd.DataFrame:
+    df = df.copy()
+    df[PRICE_FIELDS] = df[PRICE_FIELDS].to_numpy(dtype="float64") * factors[:, None]
+    if "volume" in df.columns:
+        df["volume"] = df["volume"].to_numpy(dtype="float64") / factors
+    return df
+
+
+def load_factors(symbol: str, adjustments_dir: str = ADJUSTMENTS_DIR) -> dict:
+    path = os.path.join(adjustments_dir, f"{symbol}.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_factors(symbol: str, state: dict, adjustments_dir: str):
+    os.makedirs(adjustments_dir, exist_ok=True)
+    path = os.path.join(adjustments_dir, f"{symbol}.json")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def adjust_symbol(
+    symbol: str,
+    full: bool = False,
+    data_dir: str = OHLCV_DIR,
+    shares_dir: str = SHARES_DIR,
+    output_dir: str = ADJUSTED_DIR,
+    adjustments_dir: str = ADJUSTMENTS_DIR
+) -> str:
+    """
+    Update the adjusted bars of one symbol.
+
+    Args:
+        symbol: Stock ticker symbol
+        full: Recompute the whole history instead of rescaling incrementally
+
+    Returns:
+        Path of the adjusted CSV, or None if there are no prices
+    """
+    raw = load_prices(symbol, data_dir=data_dir)
+    if raw.empty:
+        return None
+    shares = load_shares(symbol, data_dir=shares_dir)
+    events = detect_events(raw, shares)
+    applied = {_event_key(e) for e in events if e["confirmed"]}
+
+    output_path = os.path.join(output_dir, f"{symbol}.csv")
+    state = load_factors(symbol, adjustments_dir)
+    previous = {_event_key(e) for e in state.get("events", []) if e["confirmed"]}
+    incremental = (
+        not full and state.get("last_date") and os.path.exists(output_path)
+        and previous <= applied
+    )
+
+    if incremental:
+        # Already-adjusted history only needs the factors of the new events
+        old = load_prices(symbol, data_dir=output_dir)
+        new_rows = raw.loc[raw.index > pd.Timestamp(state["last_date"])]
+        new_events = [e for e in events if e["confirmed"] and _event_key(e) not in previous]
+        adjusted = pd.concat([old, new_rows[old.columns]])
+        if new_events:
+            adjusted = _apply(adjusted, adjustment_factors(adjusted.index, new_events))
+        print(f"{symbol}: {len(new_events)} new event(s), {len(new_rows)} new bar(s)")
+    else:
+        adjusted = _apply(raw, adjustment_factors(raw.index, events))
+        print(f"{symbol}: rebuilt with {len(applied)} event(s)")
+
+    adjusted = adjusted.reset_index()
+
+    def write():
+        os.makedirs(output_dir, exist_ok=True)
+        adjusted.to_csv(output_path, index=False)
+        print(f"Saved adjusted prices to {output_path}")
+
+    commit_if_changed("ohlcv_adjusted", symbol, ohlcv_partitions(adjusted), write, [output_path])
+    _save_factors(symbol, {
+        "symbol": symbol,
+        "events": events,
+        "last_date": raw.index[-1].strftime("%Y-%m-%d"),
+    }, adjustments_dir)
+    return output_path
+
+
+def adjust_all(symbols: list = None, full: bool = False, data_dir: str = OHLCV_DIR, shares_dir: str = SHARES_DIR) -> dict:
+    """Adjust every symbol that has both prices and shares outstanding."""
+    if symbols is None:
+        prices = {f[:-4] for f in os.listdir(data_dir) if f.endswith(".csv")} if os.path.isdir(data_dir) else set()
+        shares = {f[:-4] for f in os.listdir(shares_dir) if f.endswith(".csv")} if os.path.isdir(shares_dir) else set()
+        symbols = sorted(prices & shares)
+
+    results = {}
+    for symbol in symbols:
+        try:
+            results[symbol] = adjust_symbol(symbol, full=full, data_dir=data_dir, shares_dir=shares_dir)
+        except Exception as e:
+            print(f"✗ Adjustment failed for {symbol}: {e}")
+            results[symbol] = None
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Back-adjust OHLCV prices for splits and stock dividends")
+    parser.add_argument("--symbols", nargs="+")
+    parser.add_argument("--full", action="store_true", help="Recompute every symbol from the raw bars")
+    args = parser.parse_args(argv)
+
+    adjust_all(args.symbols, full=args.full)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+Sampling profiler for the crawlers and downloaders
+A background thread samples the Python stack of every other thread with
+sys._current_frames() every few milliseconds, so a whole crawl can be
+profiled without editing code and without the overhead of a tracing profiler.
+
+Each sample is attributed to one category, which becomes the root frame of
+the flamegraph:
+    webdriver   inside Selenium (a WebDriver command round trip)
+    network     inside requests / urllib3 / http.client / socket / ssl
+    cpu         Python code running on the CPU (pandas parsing, merges, ...)
+    wait        Python code off the CPU (time.sleep, locks, ...); needs a
+                per-thread CPU clock, so on Windows such samples count as cpu
+
+Every profiled run writes to data/profiles/:
+    {name}_{timestamp}.folded   folded stacks (flamegraph.pl / speedscope)
+    {name}_{timestamp}.svg      flamegraph
+    {name}_{timestamp}.txt      time per category and top-N hotspots
+
+Usage:
+    python cli.py finance --symbols ACB --profile
+
+    from profiler import profile_run
+    with profile_run("my_job"):
+        ...
+"""
+
+import functools
+import html
+import os
+import sys
+import threading
+import time
+import zlib
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+PROFILE_DIR = "data/profiles"
+
+# Matched against the module name of every frame (the package itself or a
+# submodule), never against file paths: repo modules like cophieu68_selenium
+# must not count as Selenium
+_CATEGORY_MODULES = [
+    ("webdriver", ("selenium",)),
+    ("network", ("requests", "urllib3", "http.client", "socket", "ssl")),
+]
+
+
+def _in_package(module: str, package: str) -> bool:
+    return module == package or module.startswith(package + ".")
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Collects weighted stack samples of all other threads."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples = Counter()        # (category, thread, stack) -> seconds
+        self.samples_taken = 0
+        self.wall_time = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._cpu_clocks = {}
+        self._cpu_seen = {}
+
+    def _thread_cpu(self, ident: int):
+        """CPU seconds used by a thread so far, or None if the platform can't tell."""
+        if not hasattr(time, "pthread_getcpuclockid"):
+            return None
+        try:
+            if ident not in self._cpu_clocks:
+                self._cpu_clocks[ident] = time.pthread_getcpuclockid(ident)
+            return time.clock_gettime(self._cpu_clocks[ident])
+        except (OSError, OverflowError):
+            return None
+
+    def _categorize(self, modules: list, on_cpu: bool) -> str:
+        for category, packages in _CATEGORY_MODULES:
+            if any(_in_package(module, package) for module in modules for package in packages):
+                return category
+        return "cpu" if on_cpu else "wait"
+
+    def _sample(self, elapsed: float):
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            modules = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                modules.append(frame.f_globals.get("__name__") or "")
+                frame = frame.f_back
+            stack.reverse()
+
+            cpu = self._thread_cpu(ident)
+            previous = self._cpu_seen.get(ident)
+            self._cpu_seen[ident] = cpu
+            # On CPU for at least half the interval, or unknown
+            on_cpu = cpu is None or previous is None or (cpu - previous) >= elapsed / 2
+
+            category = self._categorize(modules, on_cpu)
+            self.samples[(category, names.get(ident, str(ident)), tuple(stack))] += elapsed
+        self.samples_taken += 1
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            self._sample(now - last)
+            last = now
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.wall_time = time.perf_counter() - self._started
+
+    # ------------------------------------------------------------------
+    # Results
+    # ------------------------------------------------------------------
+    def folded(self) -> dict:
+        """{'category;thread;frame;...;leaf': seconds}"""
+        return {
+            ";".join((f"[{category}]", thread) + stack): seconds
+            for (category, thread, stack), seconds in self.samples.items()
+        }
+
+    def by_category(self) -> dict:
+        totals = defaultdict(float)
+        for (category, _, _), seconds in self.samples.items():
+            totals[category] += seconds
+        return dict(totals)
+
+    def hotspots(self, top: int = 25) -> tuple:
+        """(self time, inclusive time) of the `top` most expensive functions."""
+        self_time = Counter()
+        total_time = Counter()
+        for (_, _, stack), seconds in self.samples.items():
+            if not stack:
+                continue
+            self_time[stack[-1]] += seconds
+            for label in set(stack):
+                total_time[label] += seconds
+        return self_time.most_common(top), total_time.most_common(top)
+
+    def report(self, name: str, top: int = 25) -> str:
+        sampled = sum(self.samples.values()) or 1.0
+        lines = [
+            f"Profile of {name}",
+            f"Wall time {self.wall_time:.1f}s, {self.samples_taken} samples every {self.interval * 1000:.0f} ms",
+            "",
+            "Time by category (summed over threads):",
+        ]
+        for category, seconds in sorted(self.by_category().items(), key=lambda kv: -kv[1]):
+            lines.append(f"  {category:10s} {seconds:9.2f}s  {seconds / sampled:6.1%}")
+
+        self_time, total_time = self.hotspots(top)
+        lines += ["", f"Top {top} by self time:"]
+        lines += [f"  {seconds:9.2f}s  {label}" for label, seconds in self_time]
+        lines += ["", f"Top {top} by inclusive time:"]
+        lines += [f"  {seconds:9.2f}s  {label}" for label, seconds in total_time]
+        return "\n".join(lines) + "\n"
+
+
+def write_folded(folded: dict, path: str):
+    # Integer sample weights in milliseconds, the format flamegraph.pl expects
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, seconds in sorted(folded.items()):
+            f.write(f"{stack} {max(1, round(seconds * 1000))}\n")
+
+
+def write_flamegraph(folded: dict, path: str, title: str = "Flamegraph", width: int = 1200):
+    """Render folded stacks as a standalone SVG flamegraph (root at the bottom)."""
+    root = {"value": 0.0, "children": {}}
+    for stack, seconds in folded.items():
+        node = root
+        node["value"] += seconds
+        for label in stack.split(";"):
+            node = node["children"].setdefault(label, {"value": 0.0, "children": {}})
+            node["value"] += seconds
+
+    def depth(node):
+        return 1 + max((depth(child) for child in node["children"].values()), default=0)
+
+    frame_height = 16
+    levels = depth(root)
+    height = (levels + 2) * frame_height
+    total = root["value"] or 1.0
+    rects = []
+
+    def layout(node, x, level):
+        for label, child in sorted(node["children"].items()):
+            w = child["value"] / total * width
+            if w >= 0.5:
+                y = height - (level + 1) * frame_height
+                hue = zlib.crc32(label.encode("utf-8")) % 55
+                color = f"rgb(230,{110 + hue * 2},{40 + hue})"
+                text = label if len(label) * 7 < w else (label[:max(0, int(w / 7) - 2)] + ".." if w > 30 else "")
+                tooltip = html.escape(f"{label} ({child['value']:.2f}s, {child['value'] / total:.1%})")
+                rects.append(
+                    f'<g><title>{tooltip}</title>'
+                    f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{frame_height - 1}" fill="{color}"/>'
+                    f'<text x="{x + 3:.1f}" y="{y + 11}">{html.escape(text)}</text></g>'
+                )
+                layout(child, x, level + 1)
+            x += w
+
+    layout(root, 0.0, 1)
+    svg = (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'font-family="Verdana" font-size="11">\n'
+        f'<rect width="100%" height="100%" fill="#f8f8f8"/>\n'
+        f'<text x="{width / 2}" y="14" text-anchor="middle" font-size="14">{html.escape(title)}</text>\n'
+        + "\n".join(rects) + "\n</svg>\n"
+    )
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(svg)
+
+
+@contextmanager
+def profile_run(name: str, interval: float = 0.005, output_dir: str = PROFILE_DIR, top: int = 25):
+    """Profile the enclosed block and write the folded stacks, flamegraph and report."""
+    profiler = SamplingProfiler(interval)
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        os.makedirs(output_dir, exist_ok=True)
+        base = os.path.join(output_dir, f"{name}_{time.strftime('%Y%m%d_%H%M%S')}")
+        folded = profiler.folded()
+        write_folded(folded, base + ".folded")
+        write_flamegraph(folded, base + ".svg", title=f"{name} ({profiler.wall_time:.1f}s)")
+        report = profiler.report(name, top)
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write(report)
+        print(report)
+        print(f"Profile written to {base}.svg / .txt / .folded")
+
+
+def profileable(func):
+    """Give an entry point a `profile=False` keyword that runs it under profile_run."""
+    @functools.wraps(func)
+    def wrapper(*args, profile=False, **kwargs):
+        if not profile:
+            return func(*args, **kwargs)
+        with profile_run(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,250 @@
+"""
+Shared adaptive rate limiter for all network-facing collectors
+One token bucket per host, stored in a SQLite file so every thread and every
+process on the machine (downloaders, crawlers, queue workers) draws from the
+same budget.
+
+Rates adapt AIMD-style from what the collectors observe:
+    - success with normal latency   -> rate increases by a small step
+    - slow responses                -> rate *= 0.8
+    - 429 / 5xx / captcha           -> rate *= 0.5
+    - any other failure             -> rate unchanged
+so each host runs at the highest pace it tolerates instead of a fixed sleep.
+Errors that say nothing about the server's load (Selenium timeouts, parse
+errors, 4xx other than 429) never slow a host down. The statuses that count
+as throttling are configurable (RateLimiter(throttle_statuses=...)).
+
+Every acquired token is reported back, preferably by wrapping the request in
+request(), which reports even when the wrapped code raises.
+
+Usage:
+    from rate_limiter import get_limiter, VCI_HOST
+
+    with get_limiter().request(VCI_HOST) as outcome:
+        df = quote.history(...)
+        # outcome.status = 429 / outcome.captcha = True to report throttling
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+LIMITER_PATH = "data/rate_limits.sqlite"
+
+VCI_HOST = "trading.vietcap.com.vn"
+TCBS_HOST = "apipubaws.tcbs.com.vn"
+VIETSTOCK_HOST = "finance.vietstock.vn"
+COPHIEU68_HOST = "www.cophieu68.vn"
+
+SOURCE_HOSTS = {"VCI": VCI_HOST, "TCBS": TCBS_HOST}
+
+# host: (initial rate, min rate, max rate) in requests per second, and burst size
+DEFAULT_LIMITS = {
+    VCI_HOST: (2.0, 0.2, 10.0, 5),
+    TCBS_HOST: (2.0, 0.2, 10.0, 5),
+    VIETSTOCK_HOST: (0.5, 0.05, 2.0, 2),
+    COPHIEU68_HOST: (0.5, 0.05, 2.0, 2),
+}
+_FALLBACK_LIMIT = (1.0, 0.1, 5.0, 2)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    host TEXT PRIMARY KEY,
+    rate REAL NOT NULL,
+    min_rate REAL NOT NULL,
+    max_rate REAL NOT NULL,
+    burst REAL NOT NULL,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+# HTTP statuses that mean "slow down": 429 and every 5xx
+THROTTLE_STATUSES = frozenset([429, *range(500, 600)])
+_STATUS_PATTERN = re.compile(r"\b(429|5\d\d)\b")
+_BLOCK_MARKERS = ("captcha", "too many requests", "access denied", "just a moment")
+
+
+class RequestOutcome:
+    """Filled in by the caller inside RateLimiter.request() to report throttling.
+
+    Set `timed = False` when the block contains fixed waits, so they are not
+    mistaken for a slow response.
+    """
+
+    def __init__(self):
+        self.status = None
+        self.captcha = False
+        self.timed = True
+
+
+class RateLimiter:
+    """Per-host token buckets shared across threads and processes."""
+
+    def __init__(
+        self,
+        path: str = LIMITER_PATH,
+        target_latency: float = 3.0,
+        increase_step: float = 0.05,
+        throttle_statuses=THROTTLE_STATUSES
+    ):
+        self.path = path
+        self.target_latency = target_latency
+        self.increase_step = increase_step
+        self.throttle_statuses = frozenset(throttle_statuses)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def _bucket(self, host: str, now: float) -> list:
+        row = self.conn.execute(
+            "SELECT rate, min_rate, max_rate, burst, tokens, updated FROM buckets WHERE host = ?",
+            (host,)
+        ).fetchone()
+        if row is None:
+            rate, min_rate, max_rate, burst = DEFAULT_LIMITS.get(host, _FALLBACK_LIMIT)
+            row = (rate, min_rate, max_rate, burst, burst, now)
+            self.conn.execute("INSERT INTO buckets VALUES (?, ?, ?, ?, ?, ?, ?)", (host, *row))
+        rate, min_rate, max_rate, burst, tokens, updated = row
+        tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+        return [rate, min_rate, max_rate, burst, tokens]
+
+    def _save(self, host: str, rate: float, tokens: float, now: float):
+        self.conn.execute(
+            "UPDATE buckets SET rate = ?, tokens = ?, updated = ? WHERE host = ?",
+            (rate, tokens, now, host)
+        )
+
+    def acquire(self, host: str):
+        """Block until a request to `host` is allowed."""
+        while True:
+            with self._lock:
+                now = time.time()
+                self.conn.execute("BEGIN IMMEDIATE")
+                try:
+                    rate, _, _, _, tokens = self._bucket(host, now)
+                    if tokens >= 1:
+                        self._save(host, rate, tokens - 1, now)
+                        wait = 0.0
+                    else:
+                        self._save(host, rate, tokens, now)
+                        wait = (1 - tokens) / rate
+                    self.conn.execute("COMMIT")
+                except Exception:
+                    self.conn.execute("ROLLBACK")
+                    raise
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def report(
+        self,
+        host: str,
+        latency: float = None,
+        status: int = None,
+        captcha: bool = False,
+        failed: bool = False
+    ):
+        """
+        Adapt the rate of `host` from one observed request.
+
+        Args:
+            host: Host the request went to
+            latency: Seconds the request took
+            status: HTTP status if known (throttle_statuses, by default 429
+                and 5xx, count as throttling)
+            captcha: True if a captcha / block page was served
+            failed: The request failed for a reason other than throttling;
+                the rate is left unchanged
+        """
+        throttled = captcha or status in self.throttle_statuses
+        slow = latency is not None and latency > self.target_latency
+        if failed and not throttled:
+            return
+
+        with self._lock:
+            now = time.time()
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                rate, min_rate, max_rate, _, tokens = self._bucket(host, now)
+                if throttled:
+                    rate = max(min_rate, rate * 0.5)
+                    # Drain the bucket so the back-off takes effect immediately
+                    tokens = min(tokens, 0.0)
+                elif slow:
+                    rate = max(min_rate, rate * 0.8)
+                else:
+                    rate = min(max_rate, rate + self.increase_step)
+                self._save(host, rate, tokens, now)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+        if throttled:
+            print(f"Throttled by {host} (status={status}, captcha={captcha}), rate now {rate:.2f} req/s")
+
+    @contextmanager
+    def request(self, host: str):
+        """
+        Acquire a token, time the wrapped request and report the outcome.
+
+        Exceptions are reported as throttling only when they carry a throttle
+        status (429 / 5xx by default) or the caller flagged a captcha; any
+        other exception leaves the rate unchanged. The exception is re-raised.
+        """
+        self.acquire(host)
+        outcome = RequestOutcome()
+        start = time.monotonic()
+        try:
+            yield outcome
+        except Exception as e:
+            status = outcome.status or _exception_status(e)
+            self.report(host, status=status, captcha=outcome.captcha, failed=True)
+            raise
+        latency = time.monotonic() - start if outcome.timed else None
+        self.report(host, latency=latency, status=outcome.status, captcha=outcome.captcha)
+
+    def rates(self) -> dict:
+        """Current rate (req/s) per host."""
+        with self._lock:
+            return dict(self.conn.execute("SELECT host, rate FROM buckets").fetchall())
+
+
+def _exception_status(error: Exception):
+    """HTTP status carried by an exception (requests-style response or message), or None."""
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status
+    match = _STATUS_PATTERN.search(str(error))
+    return int(match.group(1)) if match else None
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter() -> RateLimiter:
+    """Process-wide limiter bound to the shared LIMITER_PATH file."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+        return _limiter
+
+
+def page_is_blocked(driver) -> bool:
+    """True if the browser is showing a captcha or rate-limit page instead of content."""
+    try:
+        text = driver.execute_script(
+            "return document.title + ' ' + (document.body ? document.body.innerText.slice(0, 2000) : '');"
+        ) or ""
+    except Exception:
+        return False
+    text = text.lower()
+    return any(marker in text for marker in _BLOCK_MARKERS)
@@ -0,0 +1,169 @@
+"""
+Offline re-parse of archived Vietstock statement tables
+Rebuilds every statement dataset (data/finance, data/finance_cash_flow,
+data/finance_ratios and their long tables) and the indicator cube from the raw
+HTML archive written by vn30_crawler (data/raw_html), without opening a
+browser. Symbols are parsed in parallel on a process pool; the cube is
+refreshed once at the end from the long tables.
+
+--check-parser parses every archived table with both the lxml parser and
+pd.read_html, reports tables whose cleaned frames differ and the time each
+parser took, without writing anything.
+
+Usage:
+    python reparse_finance.py                     # every archived symbol
+    python reparse_finance.py --symbols ACB FPT --workers 4
+    python reparse_finance.py --check-parser
+"""
+
+import argparse
+import gzip
+import io
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from finance_parse import ARCHIVE_DIR, STAGING_DIR, STATEMENTS
+
+_ARCHIVE_FILE = re.compile(r"p(\d+)_(\w+)\.html\.gz$")
+
+
+def archived_symbols(archive_dir: str = ARCHIVE_DIR) -> list:
+    if not os.path.isdir(archive_dir):
+        return []
+    return sorted(entry.name for entry in os.scandir(archive_dir)
+                  if entry.is_dir() and entry.name != STAGING_DIR)
+
+
+def archived_pages(symbol: str, archive_dir: str = ARCHIVE_DIR) -> dict:
+    """{page: {statement name: path}} of the archived tables of a symbol."""
+    names = {slug: name for name, slug in STATEMENTS.items()}
+    pages = {}
+    for entry in os.scandir(os.path.join(archive_dir, symbol)):
+        match = _ARCHIVE_FILE.match(entry.name)
+        if match and match.group(2) in names:
+            pages.setdefault(int(match.group(1)), {})[names[match.group(2)]] = entry.path
+    return pages
+
+
+def reparse_symbol(symbol: str, archive_dir: str = ARCHIVE_DIR):
+    """
+    Parse every archived table of a symbol and save its statement datasets.
+
+    Returns:
+        (symbol, saved finance CSV path or None)
+    """
+    from finance_parse import DATASETS, combine_pages, parse_statement_html, save_finance, stack_statements
+
+    page_frames = {dataset: [] for dataset in DATASETS}
+    for page, paths in sorted(archived_pages(symbol, archive_dir).items()):
+        tables = {}
+        for name, path in paths.items():
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                tables[name] = parse_statement_html(f.read(), name)
+        for dataset in DATASETS:
+            page_df = stack_statements(tables, dataset)
+            if page_df is not None:
+                page_frames[dataset].append(page_df)
+
+    saved = {}
+    for dataset, frames in page_frames.items():
+        final_df = combine_pages(frames)
+        if final_df is not None:
+            saved[dataset] = save_finance(symbol, final_df, refresh_cube=False, dataset=dataset)
+    return symbol, saved.get("finance")
+
+
+def reparse_all(symbols: list = None, archive_dir: str = ARCHIVE_DIR, max_workers: int = None) -> dict:
+    """
+    Re-parse many symbols in parallel and refresh the indicator cube.
+
+    Args:
+        symbols: Symbols to re-parse (default: every archived symbol)
+        archive_dir: Raw HTML archive directory
+        max_workers: Worker processes (default: CPU count)
+
+    Returns:
+        {symbol: saved CSV path or None}
+    """
+    symbols = symbols or archived_symbols(archive_dir)
+    if not symbols:
+        print(f"No archived tables in {archive_dir}")
+        return {}
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(reparse_symbol, symbol, archive_dir): symbol for symbol in symbols}
+        for future in as_completed(futures):
+            symbol = futures[future]
+            try:
+                results[symbol] = future.result()[1]
+            except Exception as e:
+                print(f"✗ Re-parse failed for {symbol}: {e}")
+                results[symbol] = None
+
+    # One cube refresh in the parent instead of one per worker write
+    from indicator_cube import refresh_cube
+
+    refresh_cube()
+
+    done = sum(1 for path in results.values() if path)
+    print(f"Re-parsed {done}/{len(symbols)} symbols from {archive_dir}")
+    return results
+
+
+def check_parser(symbols: list = None, archive_dir: str = ARCHIVE_DIR) -> list:
+    """
+    Compare read_html_table with pd.read_html on every archived table.
+
+    Returns:
+        Paths of the tables whose cleaned frames differ
+    """
+    import pandas as pd
+
+    from finance_parse import clean_statement_columns, read_html_table
+
+    mismatches = []
+    timings = {"lxml": 0.0, "read_html": 0.0}
+    tables = 0
+    for symbol in symbols or archived_symbols(archive_dir):
+        for page, paths in sorted(archived_pages(symbol, archive_dir).items()):
+            for name, path in paths.items():
+                with gzip.open(path, "rt", encoding="utf-8") as f:
+                    html = f.read()
+                started = time.perf_counter()
+                fast = clean_statement_columns(read_html_table(html), name)
+                timings["lxml"] += time.perf_counter() - started
+                started = time.perf_counter()
+                reference = clean_statement_columns(pd.read_html(io.StringIO(html))[0], name)
+                timings["read_html"] += time.perf_counter() - started
+                tables += 1
+                try:
+                    pd.testing.assert_frame_equal(fast, reference, check_dtype=False)
+                except AssertionError as e:
+                    mismatches.append(path)
+                    print(f"✗ {path}: {str(e).splitlines()[0]}")
+
+    print(f"Checked {tables} tables: {len(mismatches)} mismatch(es); "
+          f"lxml {timings['lxml']:.2f}s, pd.read_html {timings['read_html']:.2f}s")
+    return mismatches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild finance outputs from the raw HTML archive")
+    parser.add_argument("--symbols", nargs="+")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--check-parser", action="store_true",
+                        help="Compare the lxml parser with pd.read_html instead of re-parsing")
+    args = parser.parse_args(argv)
+
+    if args.check_parser:
+        check_parser(args.symbols, archive_dir=args.archive_dir)
+        return
+    reparse_all(args.symbols, archive_dir=args.archive_dir, max_workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
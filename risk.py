@@ -0,0 +1,282 @@
+"""
+Rolling risk matrix for the downloaded universe
+Keeps rolling covariance and correlation of daily log returns, beta to the
+index and portfolio volatility for every symbol in data/OLHCV. The window is
+maintained with running sums of pairwise products, so appending a day costs
+O(N^2) for that day (add the new returns, subtract the ones leaving the
+window) instead of a recompute over the whole window.
+
+Missing bars (suspensions, late listings) are handled pairwise: every matrix
+entry only uses days on which both symbols traded. The state is saved to
+data/risk/state.npz and the latest matrices to data/risk/*.csv, so a report
+after the daily download only processes the new days. The state is rebuilt
+from scratch when the universe changes and every REBUILD_EVERY days to
+discard floating-point drift.
+
+Beta is measured against `index_symbol` (e.g. download VNINDEX or VN30 with
+download_ohlcv) when its CSV exists, otherwise against the equal-weighted
+universe.
+
+Usage:
+    python risk.py                              # update and write data/risk/*.csv
+    python risk.py --window 120 --index VN30
+
+    from risk import RiskModel
+    model = RiskModel.load()
+    model.update()
+    vol = model.portfolio_volatility({"ACB": 0.5, "FPT": 0.5})
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_api import OHLCV_DIR, load_prices
+
+RISK_DIR = "data/risk"
+TRADING_DAYS = 252
+MIN_OBSERVATIONS = 20
+REBUILD_EVERY = 250
+
+
+class RiskModel:
+    """Rolling-window return moments updated one day at a time."""
+
+    def __init__(self, window: int = 60, index_symbol: str = "VNINDEX",
+                 data_dir: str = OHLCV_DIR, risk_dir: str = RISK_DIR):
+        self.window = window
+        self.index_symbol = index_symbol
+        self.data_dir = data_dir
+        self.risk_dir = risk_dir
+        self._reset([])
+
+    def _reset(self, symbols: list):
+        n = len(symbols)
+        self.symbols = list(symbols)
+        self.last_date = None
+        self.last_close = np.full(n, np.nan)
+        # Returns currently in the window, as a ring buffer
+        self.ring = np.full((self.window, n), np.nan)
+        self.pos = 0
+        self.size = 0
+        self.updates = 0
+        # Pairwise running sums over the window (i = row symbol, j = column symbol):
+        #   count[i, j] days both traded, sum_x[i, j] sum of r_i on those days,
+        #   sum_xx[i, j] sum of r_i^2 on those days, sum_xy[i, j] sum of r_i * r_j
+        self.count = np.zeros((n, n))
+        self.sum_x = np.zeros((n, n))
+        self.sum_xx = np.zeros((n, n))
+        self.sum_xy = np.zeros((n, n))
+
+    # ------------------------------------------------------------------
+    # Window maintenance
+    # ------------------------------------------------------------------
+    def _accumulate(self, returns: np.ndarray, sign: float):
+        """Add (sign=1) or remove (sign=-1) one or more days of returns, shape (days, N)."""
+        valid = (~np.isnan(returns)).astype("float64")
+        r = np.nan_to_num(returns)
+        self.count += sign * (valid.T @ valid)
+        self.sum_x += sign * (r.T @ valid)
+        self.sum_xx += sign * ((r * r).T @ valid)
+        self.sum_xy += sign * (r.T @ r)
+
+    def _push(self, returns: np.ndarray):
+        if self.size == self.window:
+            self._accumulate(self.ring[self.pos][None, :], -1.0)
+        else:
+            self.size += 1
+        self.ring[self.pos] = returns
+        self.pos = (self.pos + 1) % self.window
+        self._accumulate(returns[None, :], 1.0)
+        self.updates += 1
+
+    def _universe(self) -> list:
+        if not os.path.isdir(self.data_dir):
+            return []
+        symbols = sorted(f[:-4] for f in os.listdir(self.data_dir) if f.endswith(".csv"))
+        # Keep the index as the last column
+        if self.index_symbol in symbols:
+            symbols.remove(self.index_symbol)
+            symbols.append(self.index_symbol)
+        return symbols
+
+    def _closes(self, symbols: list, start: str = None) -> pd.DataFrame:
+        df = load_prices(symbols, start=start, fields=["close"], data_dir=self.data_dir)
+        if df.empty:
+            return pd.DataFrame(columns=symbols, dtype="float64")
+        return df["close"].unstack("symbol").reindex(columns=symbols).sort_index()
+
+    def _rebuild(self, symbols: list):
+        """Full pass: recompute the window from the price history."""
+        self._reset(symbols)
+        closes = self._closes(symbols)
+        if closes.empty:
+            return
+        values = closes.to_numpy(dtype="float64")
+        previous = closes.ffill().shift(1).to_numpy(dtype="float64")
+        with np.errstate(invalid="ignore", divide="ignore"):
+            returns = np.log(values / previous)
+
+        recent = returns[-self.window:]
+        self.size = len(recent)
+        self.ring[:self.size] = recent
+        self.pos = self.size % self.window
+        self._accumulate(recent, 1.0)
+        self.last_close = closes.ffill().iloc[-1].to_numpy(dtype="float64")
+        self.last_date = closes.index[-1].strftime("%Y-%m-%d")
+        print(f"Rebuilt risk window: {len(symbols)} symbols, {self.size} days up to {self.last_date}")
+
+    def update(self) -> int:
+        """
+        Bring the window up to date with the price files.
+
+        Returns:
+            Number of days appended (all of the window after a rebuild)
+        """
+        symbols = self._universe()
+        if symbols != self.symbols or self.last_date is None or self.updates >= REBUILD_EVERY:
+            self._rebuild(symbols)
+            return self.size
+
+        closes = self._closes(symbols, start=self.last_date)
+        closes = closes.loc[closes.index > pd.Timestamp(self.last_date)]
+        for date, row in zip(closes.index, closes.to_numpy(dtype="float64")):
+            with np.errstate(invalid="ignore", divide="ignore"):
+                returns = np.log(row / self.last_close)
+            self._push(returns)
+            self.last_close = np.where(np.isnan(row), self.last_close, row)
+            self.last_date = date.strftime("%Y-%m-%d")
+        if len(closes):
+            print(f"Appended {len(closes)} day(s) to the risk window, now up to {self.last_date}")
+        return len(closes)
+
+    # ------------------------------------------------------------------
+    # Risk measures
+    # ------------------------------------------------------------------
+    def _pairwise(self) -> tuple:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            n = np.where(self.count >= MIN_OBSERVATIONS, self.count, np.nan)
+            cov = (self.sum_xy - self.sum_x * self.sum_x.T / n) / (n - 1)
+            var_i = (self.sum_xx - self.sum_x ** 2 / n) / (n - 1)
+        return cov, var_i
+
+    def covariance(self, annualize: bool = True) -> pd.DataFrame:
+        """Pairwise covariance of daily log returns over the window."""
+        cov, _ = self._pairwise()
+        if annualize:
+            cov = cov * TRADING_DAYS
+        return pd.DataFrame(cov, index=self.symbols, columns=self.symbols)
+
+    def correlation(self) -> pd.DataFrame:
+        cov, var_i = self._pairwise()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            corr = np.clip(cov / np.sqrt(var_i * var_i.T), -1.0, 1.0)
+        return pd.DataFrame(corr, index=self.symbols, columns=self.symbols)
+
+    def betas(self) -> pd.Series:
+        """Beta of every symbol to the index (or to the equal-weighted universe)."""
+        cov, _ = self._pairwise()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if self.symbols and self.symbols[-1] == self.index_symbol:
+                beta = cov[:, -1] / cov[-1, -1]
+            else:
+                beta = np.nanmean(cov, axis=1) / np.nanmean(cov)
+        return pd.Series(beta, index=self.symbols, name="beta")
+
+    def volatility(self) -> pd.Series:
+        """Annualized volatility of every symbol."""
+        cov, _ = self._pairwise()
+        return pd.Series(np.sqrt(np.diag(cov) * TRADING_DAYS), index=self.symbols, name="volatility")
+
+    def portfolio_volatility(self, weights: dict) -> float:
+        """
+        Annualized volatility of a portfolio.
+
+        Args:
+            weights: {symbol: weight}; symbols outside the universe are ignored
+        """
+        w = np.array([weights.get(s, 0.0) for s in self.symbols])
+        cov = np.nan_to_num(self.covariance().to_numpy())
+        return float(np.sqrt(max(w @ cov @ w, 0.0)))
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+    def save(self):
+        os.makedirs(self.risk_dir, exist_ok=True)
+        path = os.path.join(self.risk_dir, "state.npz")
+        tmp_path = os.path.join(self.risk_dir, "state.tmp.npz")
+        np.savez(
+            tmp_path,
+            window=self.window, index_symbol=self.index_symbol, data_dir=self.data_dir,
+            symbols=np.array(self.symbols, dtype=str), last_date=self.last_date or "",
+            last_close=self.last_close, ring=self.ring, pos=self.pos, size=self.size,
+            updates=self.updates, count=self.count, sum_x=self.sum_x,
+            sum_xx=self.sum_xx, sum_xy=self.sum_xy
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, risk_dir: str = RISK_DIR, **kwargs) -> "RiskModel":
+        """
+        Load the saved state, or return an empty model if none exists or it was
+        built with different settings (window, index, data directory).
+        """
+        model = cls(risk_dir=risk_dir, **kwargs)
+        path = os.path.join(risk_dir, "state.npz")
+        if not os.path.exists(path):
+            return model
+        with np.load(path) as state:
+            if (int(state["window"]) != model.window or str(state["index_symbol"]) != model.index_symbol
+                    or str(state["data_dir"]) != model.data_dir):
+                return model
+            model.symbols = state["symbols"].tolist()
+            model.last_date = str(state["last_date"]) or None
+            model.last_close = state["last_close"]
+            model.ring = state["ring"]
+            model.pos = int(state["pos"])
+            model.size = int(state["size"])
+            model.updates = int(state["updates"])
+            model.count = state["count"]
+            model.sum_x = state["sum_x"]
+            model.sum_xx = state["sum_xx"]
+            model.sum_xy = state["sum_xy"]
+        return model
+
+    def report(self) -> dict:
+        """Write the current matrices to data/risk/*.csv and return their paths."""
+        os.makedirs(self.risk_dir, exist_ok=True)
+        paths = {
+            "covariance": os.path.join(self.risk_dir, "covariance.csv"),
+            "correlation": os.path.join(self.risk_dir, "correlation.csv"),
+            "summary": os.path.join(self.risk_dir, "summary.csv"),
+        }
+        self.covariance().to_csv(paths["covariance"])
+        self.correlation().to_csv(paths["correlation"])
+        pd.concat([self.volatility(), self.betas()], axis=1).to_csv(paths["summary"], index_label="symbol")
+        return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rolling covariance, correlation and beta")
+    parser.add_argument("--window", type=int, default=60, help="Window length in trading days")
+    parser.add_argument("--index", default="VNINDEX", help="Symbol of the index CSV in the data directory")
+    parser.add_argument("--data-dir", default=OHLCV_DIR)
+    args = parser.parse_args(argv)
+
+    model = RiskModel.load(window=args.window, index_symbol=args.index, data_dir=args.data_dir)
+    model.update()
+    model.save()
+    paths = model.report()
+    summary = pd.concat([model.volatility(), model.betas()], axis=1)
+    print(summary.round(3).to_string())
+    print(f"Equal-weight portfolio volatility: "
+          f"{model.portfolio_volatility({s: 1 / len(model.symbols) for s in model.symbols}):.2%}"
+          if model.symbols else "No symbols")
+    print(f"Saved {', '.join(paths.values())}")
+
+
+if __name__ == "__main__":
+    main()
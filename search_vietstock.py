@@ -5,8 +5,10 @@ from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.action_chains import ActionChains
+from profiler import profileable
 
-def run_search():
+@profileable
+def run_search(stocks_to_search=None):
     # Initialize the Chrome driver
     driver = webdriver.Chrome()
     
@@ -57,7 +59,7 @@ def run_search():
         handle_login_popup()
         # ----------------------------------------
         
-        stocks_to_search = ["ACB", "VIC", "VNM"]
+        stocks_to_search = stocks_to_search or ["ACB", "VIC", "VNM"]
         
         for stock in stocks_to_search:
             print(f"--- Searching for {stock} ---")
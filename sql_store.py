@@ -0,0 +1,290 @@
+"""
+Embedded analytical SQL store over all collected data
+Bulk-loads OHLCV bars, financial statements and shares outstanding into one
+SQLite database so cross-dataset questions are a single SQL query:
+
+    ohlcv   (symbol, date, open, high, low, close, volume)      PK (symbol, date)
+    finance (symbol, quarter, indicator_key, indicator, value)  PK (symbol, quarter, indicator_key)
+    shares  (symbol, date, shares)                              PK (symbol, date)
+    quarter_close (view): last close of every symbol in every quarter
+
+Indicators are stored under their canonical key (see indicator_cube), so the
+same line item joins across symbols whatever its label. Only files that
+changed since the last ingest are reloaded, one transaction per dataset.
+A changed file that holds no rows (e.g. a header-only shares CSV) removes the
+symbol's rows from its table.
+
+Rows are inserted with a plain INSERT, so a duplicate primary key fails the
+ingest instead of silently replacing a row. Duplicates are resolved
+explicitly and logged before the insert: several labels of one quarter with
+the same canonical key keep the first row (the rule of indicator_cube), and a
+share-count date listed twice keeps the last row (OHLCV bars are already
+deduplicated that way by data_api.load_prices).
+
+Usage:
+    python sql_store.py                      # ingest / refresh data/warehouse.sqlite
+
+    from sql_store import SQLStore
+    store = SQLStore()
+    store.ingest_all()
+    pb = store.price_to_book(symbols=["ACB", "BID", "CTG", "VCB"])
+"""
+
+import os
+import sqlite3
+
+import pandas as pd
+
+from data_api import FINANCE_DIR, OHLCV_DIR, SHARES_DIR, load_prices, load_shares, load_statements_long
+from finance_store import FINANCE_LONG_DIR
+from indicator_cube import canonical_key
+
+STORE_PATH = "data/warehouse.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ohlcv (
+    symbol TEXT NOT NULL,
+    date TEXT NOT NULL,
+    open REAL, high REAL, low REAL, close REAL, volume REAL,
+    PRIMARY KEY (symbol, date)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_ohlcv_date ON ohlcv (date, symbol);
+
+CREATE TABLE IF NOT EXISTS finance (
+    symbol TEXT NOT NULL,
+    quarter TEXT NOT NULL,
+    indicator_key TEXT NOT NULL,
+    indicator TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (symbol, quarter, indicator_key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_finance_indicator ON finance (indicator_key, quarter, symbol);
+
+CREATE TABLE IF NOT EXISTS shares (
+    symbol TEXT NOT NULL,
+    date TEXT NOT NULL,
+    shares INTEGER NOT NULL,
+    PRIMARY KEY (symbol, date)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS sources (
+    dataset TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (dataset, symbol)
+) WITHOUT ROWID;
+
+CREATE VIEW IF NOT EXISTS quarter_close AS
+SELECT o.symbol, q.quarter, o.date, o.close
+FROM (
+    SELECT symbol,
+           strftime('%Y', date) || 'Q' || ((CAST(strftime('%m', date) AS INTEGER) + 2) / 3) AS quarter,
+           MAX(date) AS date
+    FROM ohlcv
+    GROUP BY symbol, quarter
+) q
+JOIN ohlcv o ON o.symbol = q.symbol AND o.date = q.date;
+"""
+
+
+class SQLStore:
+    """SQLite warehouse fed from the collectors' output directories."""
+
+    def __init__(self, path: str = STORE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    # ------------------------------------------------------------------
+    # Ingest
+    # ------------------------------------------------------------------
+    def _changed_files(self, dataset: str, *directories: str) -> list:
+        """
+        (symbol, signature) of CSVs whose mtime/size differ from the last ingest.
+
+        With several directories a symbol's file is taken from the first one
+        that has it.
+        """
+        known = {
+            symbol: (mtime, size) for symbol, mtime, size in self.conn.execute(
+                "SELECT symbol, mtime_ns, size FROM sources WHERE dataset = ?", (dataset,)
+            )
+        }
+        signatures = {}
+        for directory in directories:
+            if not os.path.isdir(directory):
+                continue
+            for entry in os.scandir(directory):
+                symbol = entry.name[:-4]
+                if not (entry.is_file() and entry.name.endswith(".csv")) or symbol in signatures:
+                    continue
+                stat = entry.stat()
+                signatures[symbol] = (stat.st_mtime_ns, stat.st_size)
+        return [(symbol, signature) for symbol, signature in sorted(signatures.items())
+                if known.get(symbol) != signature]
+
+    @staticmethod
+    def _dedupe(dataset: str, symbol: str, df: pd.DataFrame, subset, keep: str) -> pd.DataFrame:
+        """Drop rows with a repeated key, keeping the `keep` one, and log what was dropped."""
+        duplicate = df.duplicated(subset=subset, keep=keep)
+        if duplicate.any():
+            print(f"Warning: {dataset} {symbol}: dropped {int(duplicate.sum())} row(s) with a duplicate "
+                  f"{subset}, keeping the {keep} of each")
+            df = df[~duplicate]
+        return df
+
+    def _replace(self, dataset: str, table: str, columns: list, batches: list):
+        """
+        Replace the rows of every (symbol, signature, rows) batch in one transaction.
+
+        Raises:
+            ValueError: if a batch has duplicate primary keys (nothing is written)
+        """
+        placeholders = ", ".join("?" * len(columns))
+        with self.conn:
+            for symbol, signature, rows in batches:
+                self.conn.execute(f"DELETE FROM {table} WHERE symbol = ?", (symbol,))
+                try:
+                    self.conn.executemany(
+                        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+                        rows
+                    )
+                except sqlite3.IntegrityError as e:
+                    raise ValueError(f"Duplicate {table} rows for {symbol}: {e}") from e
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?)",
+                    (dataset, symbol, *signature)
+                )
+
+    def ingest_ohlcv(self, data_dir: str = OHLCV_DIR) -> int:
+        batches = []
+        for symbol, signature in self._changed_files("ohlcv", data_dir):
+            df = load_prices(symbol, data_dir=data_dir)
+            if df.empty:
+                # Still replace: drops the symbol's old rows and records the signature
+                batches.append((symbol, signature, []))
+                continue
+            df = df[["open", "high", "low", "close", "volume"]]
+            dates = df.index.strftime("%Y-%m-%d")
+            rows = zip([symbol] * len(df), dates, *(df[c].to_numpy(dtype="float64").tolist() for c in df.columns))
+            batches.append((symbol, signature, rows))
+        self._replace("ohlcv", "ohlcv", ["symbol", "date", "open", "high", "low", "close", "volume"], batches)
+        return len(batches)
+
+    def ingest_finance(self, data_dir: str = FINANCE_DIR, long_dir: str = FINANCE_LONG_DIR) -> int:
+        # Prefer the typed long tables; symbols only crawled before they existed
+        # come from the wide CSVs
+        batches = []
+        for symbol, signature in self._changed_files("finance", long_dir, data_dir):
+            df = load_statements_long(symbol, data_dir=data_dir, long_dir=long_dir)
+            if df.empty:
+                # Still replace: drops the symbol's old rows and records the signature
+                batches.append((symbol, signature, []))
+                continue
+            labels = df["indicator"].astype(str)
+            keys = {label: canonical_key(label) for label in labels.unique()}
+            df = pd.DataFrame({
+                "quarter": df["quarter"].astype(str).to_numpy(),
+                "indicator_key": labels.map(keys).to_numpy(),
+                "indicator": labels.to_numpy(),
+                "value": df["value"].to_numpy(),
+            })
+            df = self._dedupe("finance", symbol, df, ["quarter", "indicator_key"], keep="first")
+            rows = zip(
+                [symbol] * len(df),
+                df["quarter"].tolist(),
+                df["indicator_key"].tolist(),
+                df["indicator"].tolist(),
+                df["value"].tolist()
+            )
+            batches.append((symbol, signature, rows))
+        self._replace("finance", "finance", ["symbol", "quarter", "indicator_key", "indicator", "value"], batches)
+        return len(batches)
+
+    def ingest_shares(self, data_dir: str = SHARES_DIR) -> int:
+        batches = []
+        for symbol, signature in self._changed_files("shares", data_dir):
+            df = load_shares(symbol, data_dir=data_dir)
+            if df.empty:
+                # Still replace: drops the symbol's old rows and records the signature
+                batches.append((symbol, signature, []))
+                continue
+            df = pd.DataFrame({"date": df.index.strftime("%Y-%m-%d"), "shares": df["shares"].to_numpy()})
+            df = self._dedupe("shares", symbol, df, ["date"], keep="last")
+            rows = zip([symbol] * len(df), df["date"].tolist(), df["shares"].tolist())
+            batches.append((symbol, signature, rows))
+        self._replace("shares", "shares", ["symbol", "date", "shares"], batches)
+        return len(batches)
+
+    def ingest_all(self) -> dict:
+        """Reload every changed file of every dataset."""
+        counts = {
+            "ohlcv": self.ingest_ohlcv(),
+            "finance": self.ingest_finance(),
+            "shares": self.ingest_shares(),
+        }
+        self.conn.execute("ANALYZE")
+        print("Ingested " + ", ".join(f"{n} {name}" for name, n in counts.items()) + " files")
+        return counts
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+    def query(self, sql: str, params=()) -> pd.DataFrame:
+        """Run any SQL against the store and return a DataFrame."""
+        return pd.read_sql_query(sql, self.conn, params=params)
+
+    def price_to_book(
+        self,
+        symbols: list = None,
+        equity_indicator: str = "Owner's equity",
+        price_unit: float = 1000,
+        statement_unit: float = 1e6
+    ) -> pd.DataFrame:
+        """
+        P/B of every symbol at every quarter end.
+
+        Market cap uses the last close of the quarter and the shares
+        outstanding in effect on that date.
+
+        Args:
+            symbols: Symbols to include (default: all)
+            equity_indicator: Label of the equity line in the balance sheet
+            price_unit: VND per price unit (vnstock prices are in thousand VND)
+            statement_unit: VND per statement unit (Vietstock reports million VND)
+
+        Returns:
+            DataFrame with symbol, quarter, date, close, shares, equity and pb
+        """
+        sql = """
+            SELECT qc.symbol, qc.quarter, qc.date, qc.close,
+                   (SELECT s.shares FROM shares s
+                    WHERE s.symbol = qc.symbol AND s.date <= qc.date
+                    ORDER BY s.date DESC LIMIT 1) AS shares,
+                   f.value AS equity
+            FROM quarter_close qc
+            JOIN finance f
+              ON f.symbol = qc.symbol AND f.quarter = qc.quarter AND f.indicator_key = ?
+        """
+        params = [canonical_key(equity_indicator)]
+        if symbols:
+            sql += f" WHERE qc.symbol IN ({', '.join('?' * len(symbols))})"
+            params.extend(symbols)
+        sql += " ORDER BY qc.symbol, qc.quarter"
+
+        df = self.query(sql, params)
+        df["pb"] = (df["close"] * price_unit * df["shares"]) / (df["equity"] * statement_unit)
+        return df
+
+
+if __name__ == "__main__":
+    store = SQLStore()
+    store.ingest_all()
+    store.close()
@@ -1,14 +1,19 @@
 import time
-import io
 import re
-import os
-import pandas as pd
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.action_chains import ActionChains
+from finance_parse import (
+    DATASETS, archive_html, begin_archive, combine_pages, commit_archive, identify_statement,
+    parse_statement_html, save_finance, stack_statements
+)
+from rate_limiter import VIETSTOCK_HOST, get_limiter, page_is_blocked
+from crawl_retry import RetryBudget, record_status, retry_step
+from profiler import profileable
+from browser_governor import BrowserGovernor, record_page_load
 
 # List of VN30 stocks (You can update this list)
 VN30_STOCKS = [
@@ -17,137 +22,191 @@ VN30_STOCKS = [
     "TCB", "TPB", "VCB", "VHM", "VIB", "VIC", "VJC", "VNM", "VPB", "VRE"
 ]
 
-def extract_and_clean_table(driver, xpath, name):
-    """Extracts and cleans a financial table from the current page."""
+def extract_and_clean_table(driver, xpath, name, symbol=None, page=None):
+    """Extracts and cleans a financial table from the current page.
+
+    With a symbol and page number the raw table HTML is archived first, so the
+    table can be re-parsed later without re-crawling (see reparse_finance.py).
+    """
     print(f"Attempting to extract {name}...")
     try:
         element = driver.find_element(By.XPATH, xpath)
         html = element.get_attribute('outerHTML')
-        df = pd.read_html(io.StringIO(html))[0]
-        
-        # Clean columns
-        new_columns = []
-        for col in df.columns:
-            col_str = str(col) if not isinstance(col, tuple) else '_'.join(map(str, col))
-            match = re.search(r"(Q[1-4]/\d{4})", col_str)
-            if match:
-                new_columns.append(match.group(1))
-            else:
-                if "Indicator" in col_str or name in col_str or "Net revenue" in col_str or "Current assets" in col_str or "Total assets" in col_str: 
-                    if col_str == df.columns[0] or "Indicator" in col_str: 
-                        new_columns.append("Indicator")
-                    else:
-                        new_columns.append(col_str)
-                else:
-                    new_columns.append(col_str)
-        
-        if "Indicator" not in new_columns and len(new_columns) > 0:
-             new_columns[0] = "Indicator"
-             
-        df.columns = new_columns
-        return df
+        if symbol is not None and page is not None:
+            archive_html(symbol, page, name, html)
+        return parse_statement_html(html, name)
     except Exception as e:
         print(f"Failed to extract {name}: {e}")
         return None
 
-def crawl_stock_data(driver, symbol):
-    """Crawls financial data for the current stock page."""
-    print(f"Starting crawl for {symbol}...")
+# Block holding the statement tables on the company finance page
+STATEMENT_CONTAINER = "/html/body/div[4]/div[15]/div/div[5]/div[3]/div[2]/div/div[4]/div/div/div[2]"
+# Positional XPaths of the two core statements, used when a table is not recognized by its labels
+LEGACY_XPATHS = {
+    "Income Statement": STATEMENT_CONTAINER + "/div/table",
+    "Balance Sheet": STATEMENT_CONTAINER + "/div[2]/table",
+}
+
+def extract_statement_tables(driver, symbol=None, page=None):
+    """Extracts every statement table shown on the current page in one pass.
+
+    Tables are identified by their header and first row labels (income statement,
+    balance sheet, cash flow, financial ratios). Returns {statement name: DataFrame}.
+    """
+    tables = {}
+    elements = driver.find_elements(By.XPATH, STATEMENT_CONTAINER + "/div//table")
+    for position, element in enumerate(elements):
+        try:
+            html = element.get_attribute('outerHTML')
+            name = identify_statement(html)
+            if name is None or name in tables:
+                continue
+            if symbol is not None and page is not None:
+                archive_html(symbol, page, name, html)
+            tables[name] = parse_statement_html(html, name)
+            print(f"Extracted {name}")
+        except Exception as e:
+            print(f"Failed to extract table {position + 1}: {e}")
+    
+    for name, xpath in LEGACY_XPATHS.items():
+        if name not in tables:
+            df = extract_and_clean_table(driver, xpath, name, symbol, page)
+            if df is not None:
+                tables[name] = df
+    return tables
+
+PAGE_COUNT = 6
+
+def click_previous(driver):
+    """Clicks the 'Previous' pagination button once and waits for the reload."""
+    # Need to re-find the previous button on each page
+    # Generic robust selector for the 'Previous' pagination button
+    prev_btns = driver.find_elements(By.XPATH, "//i[contains(@class, 'fa-chevron-left')]/parent::div | //i[contains(@class, 'fa-angle-left')]/parent::div | //div[contains(@class, 'btn-previous')]")
     
-    income_xpath = "/html/body/div[4]/div[15]/div/div[5]/div[3]/div[2]/div/div[4]/div/div/div[2]/div/table"
-    balance_xpath = "/html/body/div[4]/div[15]/div/div[5]/div[3]/div[2]/div/div[4]/div/div/div[2]/div[2]/table"
-    # Fallback XPaths or more robust finders could be added here
+    # Filter for visible one
+    prev_btn = None
+    for btn in prev_btns:
+        if btn.is_displayed():
+            prev_btn = btn
+            break
     
-    all_frames = []
+    if not prev_btn:
+         # Specific XPath fallback from original script
+         prev_btn = driver.find_element(By.XPATH, "/html/body/div[4]/div[15]/div/div[5]/div[3]/div[2]/div/div[4]/div/div/div/div[2]/div[2]")
+
+    driver.execute_script("arguments[0].scrollIntoView(true);", prev_btn)
+    time.sleep(1)
+    with get_limiter().request(VIETSTOCK_HOST) as outcome:
+        driver.execute_script("arguments[0].click();", prev_btn)
+        
+        print("Clicked Previous, waiting for reload...")
+        time.sleep(3) 
+        outcome.captcha = page_is_blocked(driver)
+        # Fixed wait: the reload time itself is not observable here
+        outcome.timed = False
+
+def go_to_page(driver, page):
+    """Re-navigates to a page by reloading the stock page and paging back `page` times."""
+    print(f"Re-navigating to page {page+1}...")
+    with get_limiter().request(VIETSTOCK_HOST) as outcome:
+        driver.refresh()
+        outcome.captcha = page_is_blocked(driver)
+    time.sleep(3)
+    handle_login_popup(driver)
+    for _ in range(page):
+        click_previous(driver)
+
+def quarter_columns(frames):
+    return sorted({c for df in frames for c in df.columns if re.search(r"Q[1-4]/\d{4}", str(c))})
+
+def crawl_stock_data(driver, symbol, budget=None):
+    """Crawls financial data for the current stock page.
+
+    Returns (saved CSV path or None, complete) where complete is False if any page failed.
+
+    A page whose tables are missing, or which did not change after clicking Previous, is
+    re-navigated and re-extracted on its own. The outcome per page is recorded with
+    record_status, so truncated histories are never written silently.
+    """
+    print(f"Starting crawl for {symbol}...")
+    budget = budget or RetryBudget()
+    # Pages of this crawl replace the symbol's archive only once data was saved
+    begin_archive(symbol)
     
-    # Try to find the previous button to ensure we are on a page that allows paging
-    # or just start extracting
+    # Every statement on the page is captured in the same paging sweep
+    page_frames = {dataset: [] for dataset in DATASETS}
+    status = {"complete": True, "pages_ok": [], "pages_failed": [], "errors": [], "statements": []}
+    previous_quarters = None
     
-    for i in range(6):
+    for i in range(PAGE_COUNT):
         print(f"--- Processing Page {i+1} for {symbol} ---")
+        extracted = {"tables": {}}
+        
+        def extract_page():
+            # Extract data
+            tables = extract_statement_tables(driver, symbol, i + 1)
+            quarters = quarter_columns(tables.values())
+            if tables and quarters == previous_quarters:
+                # Stale page: the Previous click did not take effect
+                raise RuntimeError("page did not change after clicking Previous")
+            extracted["tables"] = tables
+            if "Income Statement" not in tables or "Balance Sheet" not in tables:
+                raise RuntimeError("statement table missing")
+            return quarters
         
-        # Extract data
-        income_df = extract_and_clean_table(driver, income_xpath, "Income Statement")
-        balance_df = extract_and_clean_table(driver, balance_xpath, "Balance Sheet")
+        try:
+            previous_quarters = retry_step(
+                f"{symbol} page {i+1}", extract_page, budget,
+                recover=lambda: go_to_page(driver, i)
+            )
+            status["pages_ok"].append(i + 1)
+        except Exception as e:
+            status["pages_failed"].append(i + 1)
+            status["errors"].append(f"page {i+1}: {e}")
         
-        current_page_frames = []
-        if income_df is not None:
-            current_page_frames.append(income_df)
-        if balance_df is not None:
-            current_page_frames.append(balance_df)
-            
-        if current_page_frames:
-            page_df = pd.concat(current_page_frames, ignore_index=True)
-            all_frames.append(page_df)
+        # Keep whatever was extracted, even if one table is missing
+        for dataset in DATASETS:
+            page_df = stack_statements(extracted["tables"], dataset)
+            if page_df is not None:
+                page_frames[dataset].append(page_df)
+        status["statements"] = sorted(set(status["statements"]) | set(extracted["tables"]))
         
         # Click Previous Button
-        if i < 5:
+        if i < PAGE_COUNT - 1:
             try:
-                # Need to re-find the previous button on each page
-                # Generic robust selector for the 'Previous' pagination button
-                prev_btns = driver.find_elements(By.XPATH, "//i[contains(@class, 'fa-chevron-left')]/parent::div | //i[contains(@class, 'fa-angle-left')]/parent::div | //div[contains(@class, 'btn-previous')]")
-                
-                # Filter for visible one
-                prev_btn = None
-                for btn in prev_btns:
-                    if btn.is_displayed():
-                        prev_btn = btn
-                        break
-                
-                if not prev_btn:
-                     # Specific XPath fallback from original script
-                     prev_btn = driver.find_element(By.XPATH, "/html/body/div[4]/div[15]/div/div[5]/div[3]/div[2]/div/div[4]/div/div/div/div[2]/div[2]")
-
-                driver.execute_script("arguments[0].scrollIntoView(true);", prev_btn)
-                time.sleep(1)
-                driver.execute_script("arguments[0].click();", prev_btn)
-                
-                print("Clicked Previous, waiting for reload...")
-                time.sleep(3) 
-
+                retry_step(
+                    f"{symbol} previous from page {i+1}", lambda: click_previous(driver), budget,
+                    recover=lambda: go_to_page(driver, i)
+                )
             except Exception as e:
                 print(f"Could not click Previous button on page {i+1}: {e}")
+                status["pages_failed"].extend(range(i + 2, PAGE_COUNT + 1))
+                status["errors"].append(f"previous from page {i+1}: {e}")
                 break
 
-    if all_frames:
-        final_df = all_frames[0]
-        for df in all_frames[1:]:
-            try:
-                final_df = pd.merge(final_df, df, on='Indicator', how='outer')
-            except Exception as merge_error:
-                print(f"Error merging frames: {merge_error}")
-        
-        # Sort Columns
-        cols = final_df.columns.tolist()
-        valid_quarter_cols = []
-        other_cols = []
-        
-        for c in cols:
-            match = re.search(r"Q([1-4])/(\d{4})", str(c))
-            if match:
-                q = int(match.group(1))
-                y = int(match.group(2))
-                if y > 2020 or (y == 2020 and q >= 1):
-                    valid_quarter_cols.append(c)
-            else:
-                other_cols.append(c)
-        
-        def sort_key(col_name):
-            match = re.search(r"Q([1-4])/(\d{4})", col_name)
-            if match:
-                return int(match.group(2)), int(match.group(1))
-            return 0, 0
-        
-        valid_quarter_cols.sort(key=sort_key)
-        final_df = final_df[other_cols + valid_quarter_cols]
-        
-        # Save
-        os.makedirs('data/finance', exist_ok=True)
-        output_path = f"data/finance/{symbol}.csv"
-        final_df.to_csv(output_path, index=False)
-        print(f"Saved data for {symbol} to {output_path}")
+    status["complete"] = not status["pages_failed"]
+
+    # Cash flow and ratios are saved as their own datasets when the page has them
+    for dataset in DATASETS:
+        if dataset != "finance":
+            dataset_df = combine_pages(page_frames[dataset])
+            if dataset_df is not None:
+                save_finance(symbol, dataset_df, dataset=dataset)
+
+    # The archive follows the saved outputs: replaced only if some dataset was written
+    commit_archive(symbol, keep=any(page_frames.values()))
+
+    final_df = combine_pages(page_frames["finance"])
+    if final_df is not None:
+        output_path = save_finance(symbol, final_df)
+        status["quarters"] = len(quarter_columns([final_df]))
+        record_status("finance", symbol, status)
+        return output_path, status["complete"]
     else:
         print(f"No data extracted for {symbol}.")
+        status["complete"] = False
+        record_status("finance", symbol, status)
+        return None, False
 
 def handle_login_popup(driver):
     try:
@@ -175,80 +234,119 @@ def handle_login_popup(driver):
         # print(f"Popup check finished: {e}") 
         # Suppress noise if no popup
 
-def run_crawler():
-    driver = webdriver.Chrome()
+VIETSTOCK_HOME = "https://finance.vietstock.vn/?languageid=2"
+
+def open_home(driver):
+    """Opens the Vietstock home page and dismisses the login popup."""
+    with get_limiter().request(VIETSTOCK_HOST) as outcome:
+        driver.get(VIETSTOCK_HOME)
+        outcome.captcha = page_is_blocked(driver)
+    driver.maximize_window()
+    handle_login_popup(driver)
+
+def close_extra_tabs(driver):
+    """Closes every tab but the home tab and switches back to it."""
+    while len(driver.window_handles) > 1:
+        driver.switch_to.window(driver.window_handles[-1])
+        driver.close()
+    driver.switch_to.window(driver.window_handles[0])
+
+def open_stock_tab(driver, wait, stock):
+    """Searches for a stock from the home tab and opens its page in a new tab."""
+    # Check search input visibility or open it
+    try:
+         search_input = driver.find_element(By.ID, "popup-search-txt")
+         if not search_input.is_displayed():
+             raise Exception("Input hidden")
+    except:
+         search_btn = wait.until(EC.element_to_be_clickable((By.ID, "btn-mobile-search")))
+         search_btn.click()
+         search_input = wait.until(EC.visibility_of_element_located((By.ID, "popup-search-txt")))
+    
+    limiter = get_limiter()
+    with limiter.request(VIETSTOCK_HOST) as outcome:
+        search_input.clear()
+        search_input.send_keys(stock)
+        
+        print("Waiting 3 seconds for search results...")
+        time.sleep(3)
+        
+        # Find result
+        stock_list = wait.until(EC.visibility_of_element_located((By.ID, "list-stock-search")))
+        first_result = stock_list.find_element(By.TAG_NAME, "a")
+        # Includes the fixed wait above
+        outcome.timed = False
+    
+    # Open in new tab
+    with limiter.request(VIETSTOCK_HOST) as outcome:
+        actions = ActionChains(driver)
+        actions.key_down(Keys.CONTROL).click(first_result).key_up(Keys.CONTROL).perform()
+        
+        wait.until(lambda d: len(d.window_handles) > 1)
+        driver.switch_to.window(driver.window_handles[-1])
+        print(f"Opened tab for {stock}")
+        
+        # Wait for title to ensure page load
+        wait.until(EC.title_contains(stock))
+        outcome.captcha = page_is_blocked(driver)
+    record_page_load(driver)
+
+def crawl_symbol(driver, wait, stock, budget=None):
+    """Searches for a stock from the home tab, crawls it in a new tab and returns to the home tab.
+
+    Returns (path of the saved finance CSV or None, complete). A partial crawl
+    (some pages failed) may still have saved a CSV, but complete is False.
+    """
+    budget = budget or RetryBudget()
+    output_path = None
+    complete = False
     try:
-        driver.get("https://finance.vietstock.vn/?languageid=2")
-        driver.maximize_window()
-        wait = WebDriverWait(driver, 10)
+        print(f"\n================ processing {stock} ================")
         
-        handle_login_popup(driver)
+        retry_step(
+            f"{stock} open page", lambda: open_stock_tab(driver, wait, stock), budget,
+            recover=lambda: close_extra_tabs(driver)
+        )
+        
+        # Wait a bit more for dynamic content
+        time.sleep(3) 
+        
+        # === CRAWL DATA ===
+        output_path, complete = crawl_stock_data(driver, stock, budget)
+        # ==================
+        
+    except Exception as e:
+        print(f"Error processing {stock}: {e}")
+        record_status("finance", stock, {"complete": False, "errors": [str(e)]})
+    finally:
+        # Close tab and return to main tab
+        try:
+            close_extra_tabs(driver)
+        except Exception as e:
+            print(f"Could not return to main tab: {e}")
+
+    return output_path, complete
+
+@profileable
+def run_crawler(symbols=None):
+    symbols = symbols or VN30_STOCKS
+    # Recycles Chrome every few dozen symbols or when it grows slow/large
+    governor = BrowserGovernor(webdriver.Chrome, open_home)
+    try:
+        budget = RetryBudget()
         
         # Loop through stocks
         # For testing, we can limit the list, or run all. 
         # Using full VN30 list as requested.
-        for stock in VN30_STOCKS:
-            try:
-                print(f"\n================ processing {stock} ================")
-                
-                # Check search input visibility or open it
-                try:
-                     search_input = driver.find_element(By.ID, "popup-search-txt")
-                     if not search_input.is_displayed():
-                         raise Exception("Input hidden")
-                except:
-                     search_btn = wait.until(EC.element_to_be_clickable((By.ID, "btn-mobile-search")))
-                     search_btn.click()
-                     search_input = wait.until(EC.visibility_of_element_located((By.ID, "popup-search-txt")))
-                
-                search_input.clear()
-                search_input.send_keys(stock)
-                
-                print("Waiting 3 seconds for search results...")
-                time.sleep(3)
-                
-                # Find result
-                stock_list = wait.until(EC.visibility_of_element_located((By.ID, "list-stock-search")))
-                first_result = stock_list.find_element(By.TAG_NAME, "a")
-                
-                # Open in new tab
-                actions = ActionChains(driver)
-                actions.key_down(Keys.CONTROL).click(first_result).key_up(Keys.CONTROL).perform()
-                
-                wait.until(lambda d: len(d.window_handles) > 1)
-                driver.switch_to.window(driver.window_handles[-1])
-                print(f"Opened tab for {stock}")
-                
-                # Wait for load - check for Financials (Tai chinh) section or just title
-                try:
-                    # Wait for title to ensure page load
-                    wait.until(EC.title_contains(stock))
-                    # Wait a bit more for dynamic content
-                    time.sleep(3) 
-                    
-                    # === CRAWL DATA ===
-                    crawl_stock_data(driver, stock)
-                    # ==================
-                    
-                except Exception as e:
-                    print(f"Error processing {stock} page: {e}")
-                
-                # Close tab and return
-                driver.close()
-                driver.switch_to.window(driver.window_handles[0])
-                time.sleep(1)
-                
-            except Exception as e:
-                print(f"Error in search loop for {stock}: {e}")
-                # Ensure we are on main tab
-                if len(driver.window_handles) > 1:
-                    driver.close()
-                    driver.switch_to.window(driver.window_handles[0])
+        for stock in symbols:
+            governor.before_symbol()
+            crawl_symbol(governor.driver, governor.wait, stock, budget)
+            governor.symbol_done()
 
     except Exception as e:
         print(f"Global Crawler Error: {e}")
     finally:
-        driver.quit()
+        governor.close()
 
 if __name__ == "__main__":
     run_crawler()
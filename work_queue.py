@@ -0,0 +1,594 @@
+"""
+Durable work queue for whole-market collection
+Every listed symbol gets one task per collector (ohlcv, finance, shares) in a
+SQLite database. Worker processes lease tasks, renew the lease with a
+heartbeat while they work and report the result; a task whose worker dies is
+re-leased once its lease expires. Scaling out is a matter of starting more
+workers, on this machine or on others.
+
+Only processes on the machine holding the queue file open it directly
+(SQLite in WAL mode needs shared memory; never put the file on an NFS/SMB
+share). Workers on other machines go through `serve`, a small HTTP service
+on that machine which runs the same enqueue / lease / heartbeat / complete /
+fail operations against the file. Pass its URL as --queue; set a shared
+token with --token (or WORK_QUEUE_TOKEN) when the port is reachable by others.
+
+Every enqueue starts a new collection cycle: tasks that are done or failed are
+reset to pending, while pending and leased tasks are left to finish. Each
+worker has one retry budget (crawl_retry.RetryBudget) shared by all the
+symbols it crawls.
+
+Usage:
+    python work_queue.py enqueue --kinds ohlcv finance shares
+    python work_queue.py worker --kinds ohlcv
+    python work_queue.py status
+
+    # machine A (owns data/queue.sqlite)
+    python work_queue.py --token s3cret serve --host 0.0.0.0 --port 8765
+    # machines B, C, ...
+    python work_queue.py --queue http://machine-a:8765 --token s3cret worker --kinds finance
+"""
+
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+QUEUE_PATH = "data/queue.sqlite"
+DEFAULT_PORT = 8765
+TASK_KINDS = ["ohlcv", "finance", "shares"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    payload TEXT NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    lease_owner TEXT,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT,
+    updated_at REAL,
+    UNIQUE (kind, symbol)
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status, kind, lease_expires);
+"""
+
+
+class WorkQueue:
+    """SQLite-backed task queue with leases and heartbeats."""
+
+    def __init__(self, path: str = QUEUE_PATH, lease_seconds: float = 600):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Autocommit mode; write transactions are opened explicitly below
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        self.conn.close()
+
+    def enqueue(self, kind: str, symbols: list, payload: dict = None, max_attempts: int = 3) -> int:
+        """
+        Queue one task per symbol for a new cycle. New symbols are inserted and
+        finished (done or failed) tasks are reset to pending with the new
+        payload; tasks still pending or leased are left untouched.
+
+        Returns:
+            Number of tasks inserted or requeued
+        """
+        payload_json = json.dumps(payload or {})
+        now = time.time()
+        rows = [(kind, symbol, payload_json, max_attempts, now) for symbol in symbols]
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT INTO tasks (kind, symbol, payload, max_attempts, updated_at) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (kind, symbol) DO UPDATE SET status = 'pending', attempts = 0, "
+                "payload = excluded.payload, max_attempts = excluded.max_attempts, "
+                "lease_owner = NULL, lease_expires = NULL, result = NULL, error = NULL, "
+                "updated_at = excluded.updated_at "
+                "WHERE tasks.status IN ('done', 'failed')",
+                rows
+            )
+            inserted = self.conn.total_changes - before
+            self.conn.execute("COMMIT")
+        return inserted
+
+    def lease(self, worker_id: str, kinds: list = None):
+        """
+        Lease the next available task (pending, or leased with an expired lease).
+
+        Returns:
+            Task dict (id, kind, symbol, payload, attempts) or None if the queue is drained
+        """
+        now = time.time()
+        kinds = kinds or TASK_KINDS
+        placeholders = ",".join("?" * len(kinds))
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock up front, so two workers can never
+            # select the same row
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Expired leases with no attempts left are given up on
+                self.conn.execute(
+                    "UPDATE tasks SET status = 'failed', error = 'lease expired', updated_at = ? "
+                    "WHERE status = 'leased' AND lease_expires < ? AND attempts >= max_attempts",
+                    (now, now)
+                )
+                row = self.conn.execute(
+                    f"SELECT id, kind, symbol, payload, attempts FROM tasks "
+                    f"WHERE kind IN ({placeholders}) AND attempts < max_attempts "
+                    f"AND (status = 'pending' OR (status = 'leased' AND lease_expires < ?)) "
+                    f"ORDER BY id LIMIT 1",
+                    (*kinds, now)
+                ).fetchone()
+                if row is None:
+                    self.conn.execute("COMMIT")
+                    return None
+                self.conn.execute(
+                    "UPDATE tasks SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                    "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (worker_id, now + self.lease_seconds, now, row[0])
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return {
+            "id": row[0],
+            "kind": row[1],
+            "symbol": row[2],
+            "payload": json.loads(row[3]),
+            "attempts": row[4] + 1,
+        }
+
+    def _update_owned(self, sql: str, params: tuple) -> bool:
+        with self._lock:
+            cur = self.conn.execute(sql, params)
+        return cur.rowcount == 1
+
+    def heartbeat(self, task_id: int, worker_id: str) -> bool:
+        """Extend the lease. Returns False if the lease was lost to another worker."""
+        now = time.time()
+        return self._update_owned(
+            "UPDATE tasks SET lease_expires = ?, updated_at = ? "
+            "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+            (now + self.lease_seconds, now, task_id, worker_id)
+        )
+
+    def complete(self, task_id: int, worker_id: str, result=None) -> bool:
+        return self._update_owned(
+            "UPDATE tasks SET status = 'done', result = ?, error = NULL, lease_expires = NULL, "
+            "updated_at = ? WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+            (json.dumps(result), time.time(), task_id, worker_id)
+        )
+
+    def fail(self, task_id: int, worker_id: str, error: str) -> bool:
+        """Record a failure; the task goes back to pending until max_attempts is reached."""
+        return self._update_owned(
+            "UPDATE tasks SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'pending' END, "
+            "error = ?, lease_expires = NULL, updated_at = ? "
+            "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+            (error, time.time(), task_id, worker_id)
+        )
+
+    def retry_failed(self, kinds: list = None) -> int:
+        """Reset failed tasks to pending with a fresh attempt budget."""
+        kinds = kinds or TASK_KINDS
+        placeholders = ",".join("?" * len(kinds))
+        with self._lock:
+            cur = self.conn.execute(
+                f"UPDATE tasks SET status = 'pending', attempts = 0, updated_at = ? "
+                f"WHERE status = 'failed' AND kind IN ({placeholders})",
+                (time.time(), *kinds)
+            )
+        return cur.rowcount
+
+    def stats(self) -> dict:
+        """Task counts as {kind: {status: count}}."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT kind, status, COUNT(*) FROM tasks GROUP BY kind, status"
+            ).fetchall()
+        stats = {}
+        for kind, status, count in rows:
+            stats.setdefault(kind, {})[status] = count
+        return stats
+
+
+def enqueue_universe(
+    queue: WorkQueue,
+    kinds: list = None,
+    source: str = "VCI",
+    start_date: str = None,
+    end_date: str = None
+) -> dict:
+    """
+    Enqueue every listed symbol (HOSE, HNX, UPCOM) for each collector kind.
+
+    Returns:
+        Number of tasks inserted or requeued per kind
+    """
+    from download_ohlcv import get_all_listed_symbols
+
+    listing = get_all_listed_symbols(source=source)
+    symbols = sorted(listing["symbol"].dropna().astype(str).unique())
+    print(f"Found {len(symbols)} listed symbols")
+
+    inserted = {}
+    for kind in kinds or TASK_KINDS:
+        payload = {"start_date": start_date, "end_date": end_date, "source": source} if kind == "ohlcv" else {}
+        inserted[kind] = queue.enqueue(kind, symbols, payload=payload)
+        print(f"Queued {inserted[kind]} {kind} tasks")
+    return inserted
+
+
+# ----------------------------------------------------------------------
+# Network access for workers on other machines
+# ----------------------------------------------------------------------
+# Queue operations a remote client may call
+_REMOTE_METHODS = ("enqueue", "lease", "heartbeat", "complete", "fail", "retry_failed", "stats")
+
+
+def serve_queue(queue: WorkQueue, host: str = "127.0.0.1", port: int = DEFAULT_PORT, token: str = None):
+    """
+    Serve the queue operations over HTTP until interrupted.
+
+    Every operation is a POST /{method} with the keyword arguments as a JSON
+    object and returns {"result": ...}; GET /info returns the lease length.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code: int, body: dict):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _authorized(self) -> bool:
+            if token and self.headers.get("X-Queue-Token") != token:
+                self._send(403, {"error": "invalid token"})
+                return False
+            return True
+
+        def do_GET(self):
+            if not self._authorized():
+                return
+            if self.path != "/info":
+                self._send(404, {"error": f"unknown path {self.path}"})
+                return
+            self._send(200, {"result": {"lease_seconds": queue.lease_seconds}})
+
+        def do_POST(self):
+            if not self._authorized():
+                return
+            method = self.path.strip("/")
+            if method not in _REMOTE_METHODS:
+                self._send(404, {"error": f"unknown method {method}"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                kwargs = json.loads(self.rfile.read(length) or b"{}")
+                self._send(200, {"result": getattr(queue, method)(**kwargs)})
+            except (TypeError, ValueError) as e:
+                self._send(400, {"error": str(e)})
+            except Exception as e:
+                self._send(500, {"error": str(e)})
+
+        def log_message(self, format, *args):
+            # Heartbeats would flood the console
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f"Serving {queue.path} on http://{host}:{port}" + (" (token required)" if token else ""))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+class QueueClient:
+    """WorkQueue interface for a queue served by serve_queue() on another machine."""
+
+    def __init__(self, url: str, token: str = None, timeout: float = 30, attempts: int = 3):
+        self.url = url.rstrip("/")
+        self.token = token
+        self.timeout = timeout
+        self.attempts = attempts
+        self.lease_seconds = self._call("info")["lease_seconds"]
+
+    def _call(self, method: str, **kwargs):
+        """Call one queue operation, retrying connection errors."""
+        data = None if method == "info" else json.dumps(kwargs).encode("utf-8")
+        request = urllib.request.Request(f"{self.url}/{method}", data=data,
+                                         headers={"Content-Type": "application/json"})
+        if self.token:
+            request.add_header("X-Queue-Token", self.token)
+        for attempt in range(1, self.attempts + 1):
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    return json.loads(response.read())["result"]
+            except urllib.error.HTTPError as e:
+                try:
+                    error = json.loads(e.read()).get("error")
+                except ValueError:
+                    error = e.reason
+                raise RuntimeError(f"Queue server rejected {method}: {error}") from e
+            except (urllib.error.URLError, OSError) as e:
+                if attempt == self.attempts:
+                    raise
+                print(f"Queue server unreachable ({e}), retrying {attempt + 1}/{self.attempts}...")
+                time.sleep(2 * attempt)
+
+    def enqueue(self, kind: str, symbols: list, payload: dict = None, max_attempts: int = 3) -> int:
+        return self._call("enqueue", kind=kind, symbols=list(symbols), payload=payload, max_attempts=max_attempts)
+
+    def lease(self, worker_id: str, kinds: list = None):
+        return self._call("lease", worker_id=worker_id, kinds=kinds)
+
+    def heartbeat(self, task_id: int, worker_id: str) -> bool:
+        return self._call("heartbeat", task_id=task_id, worker_id=worker_id)
+
+    def complete(self, task_id: int, worker_id: str, result=None) -> bool:
+        return self._call("complete", task_id=task_id, worker_id=worker_id, result=result)
+
+    def fail(self, task_id: int, worker_id: str, error: str) -> bool:
+        return self._call("fail", task_id=task_id, worker_id=worker_id, error=error)
+
+    def retry_failed(self, kinds: list = None) -> int:
+        return self._call("retry_failed", kinds=kinds)
+
+    def stats(self) -> dict:
+        return self._call("stats")
+
+    def close(self):
+        pass
+
+
+def open_queue(location: str = QUEUE_PATH, token: str = None):
+    """A WorkQueue for a local file, or a QueueClient for an http(s):// URL."""
+    if location.startswith(("http://", "https://")):
+        return QueueClient(location, token=token)
+    return WorkQueue(location)
+
+
+class _Heartbeat(threading.Thread):
+    """Renews a task lease in the background while the task runs."""
+
+    def __init__(self, queue: WorkQueue, task_id: int, worker_id: str):
+        super().__init__(daemon=True)
+        self.queue = queue
+        self.task_id = task_id
+        self.worker_id = worker_id
+        self.stopped = threading.Event()
+        self.lost = False
+
+    def run(self):
+        interval = self.queue.lease_seconds / 3
+        while not self.stopped.wait(interval):
+            try:
+                alive = self.queue.heartbeat(self.task_id, self.worker_id)
+            except Exception as e:
+                # Unreachable queue server: the lease may still be valid, try again
+                print(f"Heartbeat for task {self.task_id} failed: {e}")
+                continue
+            if not alive:
+                self.lost = True
+                return
+
+
+class _Sessions:
+    """Browser sessions opened lazily by a worker and reused across tasks.
+
+    Each browser is owned by a BrowserGovernor, which recycles it after a number
+    of symbols or when it grows slow or large. The retry budget is shared by
+    every crawl of the worker run.
+    """
+
+    def __init__(self, retry_budget: int = 50):
+        from crawl_retry import RetryBudget
+
+        self.vietstock = None
+        self.cophieu68 = None
+        self.budget = RetryBudget(retry_budget)
+
+    def finance_governor(self):
+        if self.vietstock is None:
+            from selenium import webdriver
+            from browser_governor import BrowserGovernor
+            from vn30_crawler import open_home
+
+            self.vietstock = BrowserGovernor(webdriver.Chrome, open_home)
+        return self.vietstock
+
+    def shares_governor(self):
+        if self.cophieu68 is None:
+            from selenium import webdriver
+            from browser_governor import BrowserGovernor
+            from cophieu68_selenium import open_home
+
+            self.cophieu68 = BrowserGovernor(webdriver.Chrome, open_home)
+        return self.cophieu68
+
+    def close(self):
+        for governor in (self.vietstock, self.cophieu68):
+            if governor is not None:
+                try:
+                    governor.close()
+                except Exception:
+                    pass
+
+
+def run_task(task: dict, sessions: _Sessions):
+    """Run one task and return its result; raises on failure."""
+    symbol = task["symbol"]
+    payload = task["payload"]
+
+    if task["kind"] == "ohlcv":
+        from download_ohlcv import download_ohlcv
+
+        df = download_ohlcv(
+            symbol=symbol,
+            start_date=payload.get("start_date"),
+            end_date=payload.get("end_date"),
+            source=payload.get("source", "VCI"),
+        )
+        return {"records": len(df)}
+
+    if task["kind"] == "finance":
+        from vn30_crawler import crawl_symbol
+
+        governor = sessions.finance_governor()
+        governor.before_symbol()
+        output_path, complete = crawl_symbol(governor.driver, governor.wait, symbol, sessions.budget)
+        governor.symbol_done()
+        if output_path is None:
+            raise RuntimeError(f"No finance data saved for {symbol}")
+        if not complete:
+            # Keep the task retrying; the partial CSV stays as the best data so far
+            raise RuntimeError(f"Partial finance crawl for {symbol} (saved {output_path}, "
+                               f"see data/crawl_status/finance/{symbol}.json)")
+        return {"path": output_path}
+
+    if task["kind"] == "shares":
+        from cophieu68_selenium import crawl_stock
+
+        governor = sessions.shares_governor()
+        governor.before_symbol()
+        output_path = crawl_stock(governor.driver, governor.wait, symbol, sessions.budget)
+        governor.symbol_done()
+        if output_path is None:
+            raise RuntimeError(f"No shares data saved for {symbol}")
+        return {"path": output_path}
+
+    raise ValueError(f"Unknown task kind: {task['kind']}")
+
+
+def run_worker(
+    queue_path: str = QUEUE_PATH,
+    kinds: list = None,
+    worker_id: str = None,
+    max_tasks: int = None,
+    retry_budget: int = 50,
+    token: str = None
+) -> int:
+    """
+    Lease and run tasks until the queue is drained (or max_tasks is reached).
+
+    `queue_path` is the queue file, or the URL of a queue server on another
+    machine. `retry_budget` is the number of crawler step retries for the
+    whole run.
+
+    Returns:
+        Number of tasks processed
+    """
+    queue = open_queue(queue_path, token)
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    sessions = _Sessions(retry_budget)
+    processed = 0
+
+    try:
+        while max_tasks is None or processed < max_tasks:
+            task = queue.lease(worker_id, kinds)
+            if task is None:
+                print(f"[{worker_id}] Queue drained.")
+                break
+
+            print(f"[{worker_id}] {task['kind']} {task['symbol']} (attempt {task['attempts']})")
+            heartbeat = _Heartbeat(queue, task["id"], worker_id)
+            heartbeat.start()
+            try:
+                result = run_task(task, sessions)
+            except Exception as e:
+                heartbeat.stopped.set()
+                queue.fail(task["id"], worker_id, str(e))
+                print(f"✗ {task['kind']} {task['symbol']}: {e}")
+            else:
+                heartbeat.stopped.set()
+                if heartbeat.lost or not queue.complete(task["id"], worker_id, result):
+                    print(f"Lease lost for {task['kind']} {task['symbol']}, result discarded")
+                else:
+                    print(f"✓ {task['kind']} {task['symbol']} completed")
+            heartbeat.join()
+            processed += 1
+    finally:
+        sessions.close()
+        queue.close()
+    return processed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Whole-market collection queue")
+    parser.add_argument("--queue", default=QUEUE_PATH,
+                        help="Path of the SQLite queue file, or URL of a queue server")
+    parser.add_argument("--token", default=os.environ.get("WORK_QUEUE_TOKEN"),
+                        help="Shared token of the queue server")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_enqueue = sub.add_parser("enqueue", help="Enqueue every listed symbol (starts a new cycle)")
+    p_enqueue.add_argument("--kinds", nargs="+", choices=TASK_KINDS, default=TASK_KINDS)
+    p_enqueue.add_argument("--source", default="VCI")
+    p_enqueue.add_argument("--start-date")
+    p_enqueue.add_argument("--end-date")
+
+    p_worker = sub.add_parser("worker", help="Run a worker until the queue is drained")
+    p_worker.add_argument("--kinds", nargs="+", choices=TASK_KINDS, default=TASK_KINDS)
+    p_worker.add_argument("--worker-id")
+    p_worker.add_argument("--max-tasks", type=int)
+    p_worker.add_argument("--retry-budget", type=int, default=50, help="Step retries for the whole run")
+
+    sub.add_parser("status", help="Show task counts")
+
+    p_retry = sub.add_parser("retry-failed", help="Reset failed tasks to pending")
+    p_retry.add_argument("--kinds", nargs="+", choices=TASK_KINDS, default=TASK_KINDS)
+
+    p_serve = sub.add_parser("serve", help="Serve the queue file to workers on other machines")
+    p_serve.add_argument("--host", default="127.0.0.1", help="Interface to listen on (0.0.0.0 for all)")
+    p_serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "enqueue":
+        queue = open_queue(args.queue, args.token)
+        enqueue_universe(queue, args.kinds, args.source, args.start_date, args.end_date)
+        queue.close()
+    elif args.command == "worker":
+        run_worker(args.queue, args.kinds, args.worker_id, args.max_tasks, args.retry_budget, args.token)
+    elif args.command == "status":
+        queue = open_queue(args.queue, args.token)
+        for kind, counts in sorted(queue.stats().items()):
+            print(f"{kind:8s} " + "  ".join(f"{k}={v}" for k, v in sorted(counts.items())))
+        queue.close()
+    elif args.command == "retry-failed":
+        queue = open_queue(args.queue, args.token)
+        print(f"Reset {queue.retry_failed(args.kinds)} failed tasks")
+        queue.close()
+    elif args.command == "serve":
+        queue = WorkQueue(args.queue)
+        try:
+            serve_queue(queue, args.host, args.port, args.token)
+        finally:
+            queue.close()
+
+
+if __name__ == "__main__":
+    main()